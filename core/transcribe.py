@@ -5,12 +5,50 @@ CLI утилита для транскрибации через Yandex SpeechKit
 """
 
 import sys
+import copy
+import difflib
 import argparse
 import json
+import subprocess
+import threading
 from pathlib import Path
 from yandex_stt import YandexSTT
-from stt_corrections import TranscriptionCorrector
-from filler_words_filter import FillerWordsFilter
+from stt_corrections import corrector as default_corrector
+from filler_words_filter import filler_filter
+
+try:
+    import orjson  # опционально, быстрее stdlib json
+except ImportError:
+    orjson = None
+
+
+# Для более длинных текстов verbose-режим не выводит пословный список замен
+VERBOSE_DIFF_MAX_WORDS = 500
+
+
+def _is_ogg_opus(path: Path) -> bool:
+    """
+    Проверить, что файл — OGG Opus (по сигнатурам, без запуска file(1))
+    
+    Первая страница Ogg начинается с 'OggS' и для Opus содержит заголовок 'OpusHead'.
+    """
+    try:
+        with path.open('rb') as f:
+            head = f.read(128)
+    except OSError:
+        return path.suffix.lower() in ('.opus', '.ogg')
+    return head.startswith(b'OggS') and b'OpusHead' in head
+
+
+def _write_stdout(data: bytes):
+    """Записать байты в stdout минуя текстовый слой (с fallback, если буфера нет)"""
+    buffer = getattr(sys.stdout, 'buffer', None)
+    if buffer is None:
+        sys.stdout.write(data.decode('utf-8'))
+        return
+    sys.stdout.flush()  # Сначала то, что уже напечатано через print()
+    buffer.write(data)
+    buffer.flush()
 
 
 def main():
@@ -56,12 +94,14 @@ def main():
     
     # Проверить файл
     audio_path = Path(args.audio_file)
-    if not audio_path.exists():
+    try:
+        audio_stat = audio_path.stat()
+    except FileNotFoundError:
         print(f"❌ Файл не найден: {args.audio_file}", file=sys.stderr)
         sys.exit(1)
     
     # Проверить размер (ограничение 1 МБ)
-    file_size_mb = audio_path.stat().st_size / (1024 * 1024)
+    file_size_mb = audio_stat.st_size / (1024 * 1024)
     if file_size_mb > 1:
         print(f"⚠️  Предупреждение: размер файла {file_size_mb:.2f} МБ", file=sys.stderr)
         print(f"   Синхронный API поддерживает до 1 МБ", file=sys.stderr)
@@ -82,45 +122,49 @@ def main():
         print(f"   Проверь файл .env.yandex", file=sys.stderr)
         sys.exit(1)
     
-    # Конвертация в OGG Opus если нужно
-    audio_to_send = str(audio_path)
-    temp_file = None
+    # TLS-рукопожатие с Yandex идёт параллельно с конвертацией
+    warmup = threading.Thread(target=stt.warm_connection, daemon=True)
+    warmup.start()
     
-    # Определить формат
-    import subprocess
-    file_info = subprocess.check_output(['file', str(audio_path)]).decode()
+    # Конвертация в OGG Opus если нужно (ffmpeg пишет в stdout, без временного файла)
+    audio_to_send = str(audio_path)
     
     # Если не OGG Opus - конвертируем
-    if 'Ogg data' not in file_info or 'Opus' not in file_info:
+    if not _is_ogg_opus(audio_path):
         if args.verbose:
             print("🔄 Конвертация в OGG Opus для лучшей совместимости...")
         
-        temp_file = audio_path.parent / f".tmp_{audio_path.stem}.ogg"
-        
         try:
-            subprocess.run([
-                'ffmpeg', '-i', str(audio_path),
+            # ffmpeg пишет в stderr только ошибки; их читаем лишь в verbose-режиме
+            converted = subprocess.run([
+                'ffmpeg', '-hide_banner', '-loglevel', 'error',
+                '-i', str(audio_path),
                 '-c:a', 'libopus',
                 '-b:a', '48k',
                 '-ar', '48000',
                 '-ac', '1',
-                str(temp_file),
-                '-y'
-            ], check=True, capture_output=True)
+                '-f', 'ogg',
+                'pipe:1',
+            ], check=True, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE if args.verbose else subprocess.DEVNULL)
             
-            audio_to_send = str(temp_file)
+            audio_to_send = converted.stdout
             
             if args.verbose:
                 print("   ✅ Конвертация завершена")
         except Exception as e:
             if args.verbose:
                 print(f"   ⚠️ Конвертация не удалась, отправляю оригинал")
+                if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+                    print(e.stderr[-4096:].decode('utf-8', errors='replace'), file=sys.stderr)
             # Fallback to original
     
     # Транскрибация
     if args.verbose:
         print("🎤 Транскрибация...")
     
+    warmup.join(timeout=5)
+    
     try:
         result = stt.transcribe_sync(
             audio_to_send,
@@ -135,8 +179,10 @@ def main():
             print("✅ Готово!")
             print()
             print("📋 Полный результат:")
-            import json
-            print(json.dumps(result, indent=2, ensure_ascii=False))
+            if orjson is not None:
+                print(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode())
+            else:
+                print(json.dumps(result, indent=2, ensure_ascii=False))
             print()
             print("📝 Текст:")
         
@@ -149,7 +195,7 @@ def main():
         
         # Очистка слов-паразитов
         if args.clean:
-            filler_filter = FillerWordsFilter()
+            # Общий фильтр модуля: паттерны компилируются один раз на процесс
             original_text = text
             text = filler_filter.clean(text, aggressive=False)
             
@@ -162,16 +208,21 @@ def main():
         
         # Исправления
         if not args.no_corrections:
-            corrector = TranscriptionCorrector()
+            # Общий корректор модуля: словарь и автомат строятся один раз на процесс
+            corrector = default_corrector
             
             # Загрузить кастомные исправления если указаны
             if args.corrections:
+                # Копия со своим словарём, чтобы не менять общий корректор
+                corrector = copy.copy(default_corrector)
                 corrections_file = Path(args.corrections)
                 if corrections_file.exists():
-                    with open(corrections_file, 'r', encoding='utf-8') as f:
-                        custom_corrections = json.load(f)
-                        for wrong, correct in custom_corrections.items():
-                            corrector.add_correction(wrong, correct)
+                    if orjson is not None:
+                        custom_corrections = orjson.loads(corrections_file.read_bytes())
+                    else:
+                        with open(corrections_file, 'r', encoding='utf-8') as f:
+                            custom_corrections = json.load(f)
+                    corrector.add_corrections(custom_corrections)
                     
                     if args.verbose:
                         print(f"   ✅ Загружено {len(custom_corrections)} исправлений")
@@ -185,18 +236,24 @@ def main():
                 print("🔧 Применены исправления:")
                 orig_words = original_text.split()
                 corr_words = text.split()
-                for i, (o, c) in enumerate(zip(orig_words, corr_words)):
-                    if o != c:
-                        print(f"   '{o}' → '{c}'")
+                if len(orig_words) > VERBOSE_DIFF_MAX_WORDS:
+                    print(f"   (текст длиннее {VERBOSE_DIFF_MAX_WORDS} слов, список замен не выводится)")
+                else:
+                    # SequenceMatcher выравнивает слова, даже если замена изменила их число
+                    matcher = difflib.SequenceMatcher(None, orig_words, corr_words, autojunk=False)
+                    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                        if tag != 'equal':
+                            print(f"   '{' '.join(orig_words[i1:i2])}' → '{' '.join(corr_words[j1:j2])}'")
                 print()
         
-        # Вывод
-        print(text)
+        # Вывод: текст кодируется один раз и для stdout, и для файла
+        encoded = text.encode('utf-8')
+        _write_stdout(encoded + b'\n')
         
         # Сохранение в файл
         if args.output:
             output_path = Path(args.output)
-            output_path.write_text(text, encoding='utf-8')
+            output_path.write_bytes(encoded)
             if args.verbose:
                 print()
                 print(f"💾 Сохранено в: {output_path}")
@@ -204,10 +261,6 @@ def main():
     except Exception as e:
         print(f"❌ Ошибка транскрибации: {e}", file=sys.stderr)
         sys.exit(1)
-    finally:
-        # Удалить временный файл
-        if temp_file and temp_file.exists():
-            temp_file.unlink()
 
 
 if __name__ == "__main__":
@@ -9,11 +9,50 @@ import os
 import json
 import time
 import boto3
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, Union
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from botocore.exceptions import ClientError
 
 
+# Крупные файлы грузим в S3 частями параллельно (одно TCP-соединение упирается в RTT)
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True
+)
+
+# Опрос асинхронных операций: первая пауза и множитель (до poll_interval)
+FIRST_POLL_INTERVAL = 0.5
+POLL_BACKOFF = 1.5
+
+# Аудио, которое уже лежит в хранилище: не загружаем и не удаляем
+REMOTE_URI_PREFIXES = ("http://", "https://", "s3://")
+
+
+@lru_cache(maxsize=1)
+def _read_env_file(path: str, mtime: float) -> Dict[str, str]:
+    """
+    Разобрать .env.yandex в словарь (при повторе ключа действует первое значение)
+    
+    Кешируется по (path, mtime): файл читается один раз, а не на каждый ключ
+    каждого YandexSTT(); изменённый файл перечитывается автоматически.
+    """
+    values: Dict[str, str] = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith('#') and '=' in line:
+                k, v = line.strip().split('=', 1)
+                values.setdefault(k, v)
+    return values
+
+
 class YandexSTT:
     """Yandex SpeechKit Speech-to-Text API client"""
     
@@ -47,6 +86,17 @@ class YandexSTT:
         self.sync_url = "https://stt.api.cloud.yandex.net/speech/v1/stt:recognize"
         self.async_url = "https://transcribe.api.cloud.yandex.net/speech/stt/v2/longRunningRecognize"
         
+        # Одна HTTP-сессия на клиент: keep-alive соединения переиспользуются между запросами.
+        # Пул — на параллельный опрос операций (wait_for_completion_many); повторы при
+        # 502/503/504 только для идемпотентных запросов (POST распознавания не повторяется)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+        ))
+        self.session.headers['Authorization'] = f'Api-Key {self.api_key}'
+        
         # S3 client
         self.s3_client = None
         if self.s3_access_key and self.s3_secret_key:
@@ -55,20 +105,20 @@ class YandexSTT:
                 endpoint_url='https://storage.yandexcloud.net',
                 aws_access_key_id=self.s3_access_key,
                 aws_secret_access_key=self.s3_secret_key,
-                region_name='ru-central1'
+                region_name='ru-central1',
+                # Клиент потокобезопасен; больше соединений — параллельные части multipart-загрузки
+                config=Config(max_pool_connections=32, s3={'addressing_style': 'path'})
             )
         
     def _load_env(self, key: str) -> str:
         """Загрузить переменную из .env.yandex"""
         env_file = Path(__file__).parent / '.env.yandex'
-        if env_file.exists():
-            with open(env_file) as f:
-                for line in f:
-                    if line.strip() and not line.startswith('#'):
-                        if '=' in line:
-                            k, v = line.strip().split('=', 1)
-                            if k == key:
-                                return v
+        try:
+            values = _read_env_file(str(env_file), env_file.stat().st_mtime)
+        except OSError:
+            values = {}
+        if key in values:
+            return values[key]
         
         # Fallback на environment variables
         value = os.getenv(key)
@@ -76,6 +126,18 @@ class YandexSTT:
             raise ValueError(f"Missing {key}. Set it in .env.yandex or environment")
         return value
     
+    def warm_connection(self, timeout: float = 5.0):
+        """
+        Заранее открыть TCP+TLS соединение с endpoint синхронного API
+        
+        Запускается в фоне, пока идёт конвертация аудио: к моменту отправки
+        соединение уже лежит в пуле сессии. Ответ (обычно 4xx на HEAD) не важен.
+        """
+        try:
+            self.session.head(self.sync_url, timeout=timeout)
+        except requests.RequestException:
+            pass
+    
     def upload_to_storage(self, audio_file: str, object_name: Optional[str] = None) -> str:
         """
         Загрузить файл в Yandex Object Storage
@@ -94,7 +156,9 @@ class YandexSTT:
             object_name = Path(audio_file).name
         
         try:
-            self.s3_client.upload_file(audio_file, self.s3_bucket, object_name)
+            self.s3_client.upload_file(
+                audio_file, self.s3_bucket, object_name, Config=S3_TRANSFER_CONFIG
+            )
             uri = f"https://storage.yandexcloud.net/{self.s3_bucket}/{object_name}"
             return uri
         except ClientError as e:
@@ -112,7 +176,7 @@ class YandexSTT:
     
     def transcribe_sync(
         self, 
-        audio_file: str,
+        audio_file: Union[str, bytes],
         language: str = "ru-RU",
         format: str = "auto",
         profanity_filter: bool = False,
@@ -124,7 +188,7 @@ class YandexSTT:
         Синхронная транскрибация (для файлов до 1 минуты и 1 МБ)
         
         Args:
-            audio_file: Путь к аудио файлу
+            audio_file: Путь к аудио файлу или уже прочитанные байты аудио
             language: Язык распознавания (ru-RU, en-US, tr-TR и др.)
             format: Формат аудио (lpcm, oggopus, mp3, auto)
             profanity_filter: Фильтровать мат
@@ -135,13 +199,6 @@ class YandexSTT:
         Returns:
             Dict с результатом транскрибации
         """
-        with open(audio_file, 'rb') as f:
-            audio_data = f.read()
-        
-        headers = {
-            'Authorization': f'Api-Key {self.api_key}',
-        }
-        
         params = {
             'lang': language,
             'folderId': self.folder_id,
@@ -158,12 +215,13 @@ class YandexSTT:
         if hints:
             params['hints'] = ','.join(hints)
         
-        response = requests.post(
-            self.sync_url,
-            headers=headers,
-            params=params,
-            data=audio_data
-        )
+        if isinstance(audio_file, (bytes, bytearray)):
+            response = self.session.post(self.sync_url, params=params, data=audio_file)
+        else:
+            # Файл отдаётся requests как есть: тело читается и отправляется блоками
+            # (Content-Length по размеру файла), без копии всего аудио в памяти
+            with open(audio_file, 'rb') as f:
+                response = self.session.post(self.sync_url, params=params, data=f)
         
         if response.status_code != 200:
             raise Exception(f"API Error {response.status_code}: {response.text}")
@@ -197,11 +255,6 @@ class YandexSTT:
         if not audio_file.startswith('http') and auto_upload:
             audio_file = self.upload_to_storage(audio_file)
         
-        headers = {
-            'Authorization': f'Api-Key {self.api_key}',
-            'Content-Type': 'application/json',
-        }
-        
         config = {
             "config": {
                 "specification": {
@@ -223,9 +276,8 @@ class YandexSTT:
         if literature_text:
             config["config"]["specification"]["literatureText"] = True
         
-        response = requests.post(
+        response = self.session.post(
             self.async_url,
-            headers=headers,
             json=config
         )
         
@@ -249,17 +301,37 @@ class YandexSTT:
             - error: ошибка (если была)
         """
         url = f"https://operation.api.cloud.yandex.net/operations/{operation_id}"
-        headers = {
-            'Authorization': f'Api-Key {self.api_key}',
-        }
-        
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url)
         
         if response.status_code != 200:
             raise Exception(f"API Error {response.status_code}: {response.text}")
         
         return response.json()
     
+    @staticmethod
+    def _operation_result(operation: Dict) -> Dict:
+        """Извлечь текст и chunks из завершённой операции"""
+        if 'error' in operation:
+            raise Exception(f"Transcription failed: {operation['error']}")
+        
+        response = operation.get('response', {})
+        chunks = response.get('chunks', [])
+        
+        if not chunks:
+            return {"result": ""}
+        
+        # Собрать весь текст
+        full_text = ' '.join([
+            ' '.join([alt['text'] for alt in chunk.get('alternatives', [])])
+            for chunk in chunks
+        ])
+        
+        # Вернуть полную структуру с chunks для speaker diarization
+        return {
+            "result": full_text.strip(),
+            "chunks": chunks
+        }
+    
     def wait_for_completion(self, operation_id: str, timeout: int = 600, poll_interval: int = 5) -> Dict:
         """
         Ждать завершения асинхронной операции
@@ -267,43 +339,92 @@ class YandexSTT:
         Args:
             operation_id: ID операции
             timeout: Максимальное время ожидания (секунды)
-            poll_interval: Интервал проверки (секунды)
+            poll_interval: Максимальный интервал проверки (секунды); первые
+                           проверки чаще — с FIRST_POLL_INTERVAL, растущим в POLL_BACKOFF раз
             
         Returns:
             Результат транскрибации
         """
-        start_time = time.time()
+        deadline = time.monotonic() + timeout
+        wait = min(FIRST_POLL_INTERVAL, poll_interval)
         
-        while time.time() - start_time < timeout:
+        while time.monotonic() < deadline:
             result = self.check_operation(operation_id)
             
             if result.get('done'):
-                if 'error' in result:
-                    raise Exception(f"Transcription failed: {result['error']}")
-                
-                # Извлечь текст из результата
-                response = result.get('response', {})
-                chunks = response.get('chunks', [])
-                
-                if not chunks:
-                    return {"result": ""}
-                
-                # Собрать весь текст
-                full_text = ' '.join([
-                    ' '.join([alt['text'] for alt in chunk.get('alternatives', [])])
-                    for chunk in chunks
-                ])
-                
-                # Вернуть полную структуру с chunks для speaker diarization
-                return {
-                    "result": full_text.strip(),
-                    "chunks": chunks
-                }
+                return self._operation_result(result)
             
-            time.sleep(poll_interval)
+            # Короткие операции замечаем быстро, длинные опрашиваем не чаще poll_interval
+            time.sleep(wait)
+            wait = min(poll_interval, wait * POLL_BACKOFF)
         
         raise TimeoutError(f"Operation {operation_id} did not complete within {timeout} seconds")
     
+    def wait_for_completion_many(
+        self,
+        operation_ids: List[str],
+        timeout: int = 600,
+        poll_interval: int = 5,
+        max_parallel: int = 8
+    ) -> Tuple[Dict[str, Dict], Dict[str, Exception]]:
+        """
+        Ждать завершения нескольких асинхронных операций одним общим циклом
+        
+        На каждом шаге статусы всех незавершённых операций запрашиваются
+        параллельно, а пауза poll_interval одна на всю пачку, а не на каждую операцию.
+        
+        Args:
+            operation_ids: ID операций из transcribe_async()
+            timeout: Максимальное время ожидания всей пачки (секунды)
+            poll_interval: Максимальный интервал проверки (секунды), см. wait_for_completion
+            max_parallel: Максимум одновременных запросов статуса
+            
+        Returns:
+            (результаты по ID операции, ошибки по ID операции).
+            Операции, не успевшие завершиться, попадают в ошибки как TimeoutError.
+        """
+        results: Dict[str, Dict] = {}
+        errors: Dict[str, Exception] = {}
+        pending = list(dict.fromkeys(operation_ids))
+        deadline = time.monotonic() + timeout
+        wait = min(FIRST_POLL_INTERVAL, poll_interval)
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(pending) or 1))) as pool:
+            while pending:
+                checked = list(pool.map(self._check_operation_safe, pending))
+                still_pending = []
+                for operation_id, (operation, error) in zip(pending, checked):
+                    if error is not None:
+                        errors[operation_id] = error
+                    elif operation.get('done'):
+                        try:
+                            results[operation_id] = self._operation_result(operation)
+                        except Exception as e:
+                            errors[operation_id] = e
+                    else:
+                        still_pending.append(operation_id)
+                pending = still_pending
+                
+                if not pending:
+                    break
+                if time.monotonic() >= deadline:
+                    for operation_id in pending:
+                        errors[operation_id] = TimeoutError(
+                            f"Operation {operation_id} did not complete within {timeout} seconds"
+                        )
+                    break
+                time.sleep(wait)
+                wait = min(poll_interval, wait * POLL_BACKOFF)
+        
+        return results, errors
+    
+    def _check_operation_safe(self, operation_id: str) -> Tuple[Optional[Dict], Optional[Exception]]:
+        """check_operation(), возвращающий ошибку вместо исключения (для пула потоков)"""
+        try:
+            return self.check_operation(operation_id), None
+        except Exception as e:
+            return None, e
+    
     def transcribe_async_with_cleanup(
         self,
         audio_file: str,
@@ -335,10 +456,15 @@ class YandexSTT:
         Returns:
             Результат транскрибации
         """
-        # Сохраняем имя файла для последующего удаления
-        object_name = Path(audio_file).name
+        # Удаляем только то, что сами загрузили: URI уже лежит в хранилище,
+        # и DeleteObject по имени из URL был бы лишним запросом
+        object_name = None
         
         try:
+            if not audio_file.startswith(REMOTE_URI_PREFIXES):
+                object_name = Path(audio_file).name
+                audio_file = self.upload_to_storage(audio_file, object_name)
+            
             # Транскрибация
             operation_id = self.transcribe_async(
                 audio_file,
@@ -346,7 +472,7 @@ class YandexSTT:
                 profanity_filter=profanity_filter,
                 punctuation=punctuation,
                 literature_text=literature_text,
-                auto_upload=True,
+                auto_upload=False,
                 hints=hints,
                 speaker_labeling=speaker_labeling,
             )
@@ -358,10 +484,11 @@ class YandexSTT:
             
         finally:
             # Удаление файла из S3 (в любом случае - успех или ошибка)
-            try:
-                self.delete_from_storage(object_name)
-            except Exception:
-                pass  # Игнорируем ошибки удаления
+            if object_name:
+                try:
+                    self.delete_from_storage(object_name)
+                except Exception:
+                    pass  # Игнорируем ошибки удаления
 
 
 def example_usage():
@@ -8,6 +8,12 @@ from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, Fil
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
 from pydantic import ValidationError
 import uvicorn
 import asyncio
@@ -18,11 +24,24 @@ import time
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, List, Dict
+import errno
 import hashlib
+import secrets
 import shutil
+import threading
 import re
 import logging
 import traceback as tb
+try:
+    import orjson  # опционально, быстрее stdlib json
+except ImportError:
+    orjson = None
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter, OrderedDict
+from itertools import groupby, islice
+from operator import itemgetter
+from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
@@ -48,17 +67,20 @@ for import_root in (RUNTIME_ROOT.parent.parent, Path("/app"), Path("/root/hearyo
 from core.local_whisper_stt import LocalWhisperSTT, WhisperSettings
 from core.opus_transcribe_stt import OpusTranscriptionSTT
 from core.text_cleaner import TranscriptionCleaner
-from core.audio_preprocessing import preprocess_audio
+from core.audio_preprocessing import build_audio_filters
 
 # JTBD анализатор - опционально (поддерживает Anthropic или OpenAI-compatible endpoint)
 try:
-    from core.jtbd_analyzer import JTBDAnalyzer
+    from core.jtbd_analyzer import JTBDAnalyzer, JTBD_PROMPT_FINGERPRINT
     JTBD_AVAILABLE = True
 except ImportError:
     JTBD_AVAILABLE = False
+    JTBD_PROMPT_FINGERPRINT = ""
     logger.warning("JTBD Analyzer недоступен: не удалось импортировать модуль")
 
 from ispring_hints import DEFAULT_HINTS
+import diarization_worker
+import speaker_merge
 
 # Импортируем fallback backend; если зависимость отсутствует, сервис всё равно должен стартовать.
 try:
@@ -108,45 +130,34 @@ app = FastAPI(
 # Middleware для логирования запросов
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    # Логируем входящий запрос (минимально)
-    logger.info(f"{request.method} {request.url.path} from {request.client.host if request.client else 'unknown'}")
-    
-    # Для POST /transcribe логируем заголовки
-    if request.method == "POST" and request.url.path == "/transcribe":
-        logger.info(f"🔍 Content-Type: {request.headers.get('content-type')}")
-        logger.info(f"🔍 Content-Length: {request.headers.get('content-length')}")
-        # НЕ читаем body в middleware - это ломает multipart/form-data парсинг в FastAPI!
+    # Форматирование строк и разбор заголовков — только если INFO реально пишется.
+    # Подробности 4xx/5xx логируют exception handlers ниже; тело ответа здесь не читаем
+    log_info = logger.isEnabledFor(logging.INFO)
+    start_time = time.perf_counter()
+    path = request.url.path
+    
+    if log_info:
+        # Логируем входящий запрос (минимально)
+        logger.info("%s %s from %s", request.method, path, request.client.host if request.client else "unknown")
+        
+        # Для POST /transcribe и /upload-stream логируем заголовки
+        if request.method == "POST" and path in ("/transcribe", "/upload-stream"):
+            logger.info("🔍 Content-Type: %s", request.headers.get("content-type"))
+            logger.info("🔍 Content-Length: %s", request.headers.get("content-length"))
+            # НЕ читаем body в middleware: multipart-парсинг FastAPI и потоковая
+            # запись /upload-stream должны получить тело нетронутым
     
     try:
         response = await call_next(request)
-        duration = time.time() - start_time
-        
-        # Логируем ответ
-        logger.info(f"{request.method} {request.url.path} -> {response.status_code} ({duration:.2f}s)")
-        
-        # Если 400 на /transcribe - логируем подробности + response body
-        if response.status_code >= 400 and request.url.path == "/transcribe":
-            logger.error(f"❌ HTTP {response.status_code} on /transcribe")
-            logger.error(f"❌ Request took {duration:.2f}s")
-            
-            # Попытаемся прочитать response body для диагностики
-            if hasattr(response, 'body'):
-                try:
-                    body = response.body.decode('utf-8')[:500]  # первые 500 символов
-                    logger.error(f"❌ Response body: {body}")
-                except Exception as e:
-                    logger.error(f"❌ Could not read response body: {e}")
-            
-            logger.error(f"❌ This suggests FastAPI rejected the request before reaching the endpoint")
-            logger.error(f"❌ Possible causes: invalid Content-Type, missing required fields, or parsing error")
-        
-        return response
     except Exception as e:
-        logger.error(f"{request.method} {request.url.path} failed: {e}")
+        logger.error("%s %s failed: %s", request.method, path, e)
         logger.error(tb.format_exc())
         raise
+    
+    if log_info:
+        logger.info("%s %s -> %s (%.2fs)", request.method, path, response.status_code, time.perf_counter() - start_time)
+    return response
+
 
 # CORS для доступа из браузера
 app.add_middleware(
@@ -226,11 +237,24 @@ LOGS_DIR = resolve_runtime_dir(os.environ.get("HEARYOU_LOGS_DIR", "/app/logs"),
 # Временная директория для chunked uploads
 CHUNKS_DIR = resolve_runtime_dir(os.environ.get("HEARYOU_CHUNKS_DIR", "/app/chunks"), "chunks")
 
+# Кеш результатов диаризации (по содержимому аудио)
+DIAR_CACHE_DIR = resolve_runtime_dir(os.environ.get("HEARYOU_DIAR_CACHE_DIR", "/app/diar_cache"), "diar_cache")
+
+# Кеш embeddings окон Resemblyzer (по содержимому аудио; переиспользуется при другом числе спикеров)
+EMBED_CACHE_DIR = resolve_runtime_dir(os.environ.get("HEARYOU_EMBED_CACHE_DIR", "/app/embed_cache"), "embed_cache")
+
+# Кеш JTBD анализа (по тексту; переживает рестарт)
+JTBD_CACHE_DIR = resolve_runtime_dir(os.environ.get("HEARYOU_JTBD_CACHE_DIR", "/app/jtbd_cache"), "jtbd_cache")
+
 # Максимальный размер файла (25 ГБ - для видео, аудио экстрагируется автоматически)
 MAX_FILE_SIZE = 25 * 1024 * 1024 * 1024
 
 # Хранилище информации о chunked uploads
-chunked_uploads = {}  # {upload_id: {filename, total_chunks, received_chunks, file_path}}
+# OrderedDict как LRU: активные загрузки в конце, брошенные вытесняются из начала
+chunked_uploads = OrderedDict()  # {upload_id: {filename, total_chunks, received_chunks, chunk_dir, started_at}}
+MAX_CHUNKED_UPLOADS = 1024
+CHUNKED_UPLOAD_TTL = 24 * 3600  # Брошенные загрузки удаляются через сутки
+CHUNKED_UPLOAD_REAP_INTERVAL = 600
 
 # Whitelist разрешённых расширений (безопасность)
 # Валидация форматов отключена - принимаем любые файлы с аудио потоком (проверка через ffprobe)
@@ -242,7 +266,7 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
     handlers=[
-        logging.FileHandler(LOGS_DIR / "app.log"),
+        logging.FileHandler(LOGS_DIR / "app.log", delay=True),  # файл открывается при первой записи
         logging.StreamHandler()
     ]
 )
@@ -286,6 +310,28 @@ def create_stt_client():
         return LocalWhisperSTT(settings)
 
 
+def make_task_id() -> str:
+    """
+    ID задачи: 16 hex-символов (формат прежний)
+    
+    Случайный, а не хеш имени файла и времени: без хеширования на event loop
+    и без совпадений у одновременных загрузок одного файла.
+    """
+    return secrets.token_hex(8)
+
+
+def hash_file(file_path) -> str:
+    """
+    SHA-256 содержимого файла (hex)
+    
+    SHA-256 из OpenSSL использует SHA-NI / ARMv8 SHA, где они есть, — на таких
+    CPU он заметно быстрее blake2b и md5. file_digest читает файл блоками
+    в один буфер, так что память не растёт с размером файла.
+    """
+    with open(file_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
 def normalize_jtbd_flag(analyze_jtbd: Optional[bool], jtbd_analysis: Optional[bool] = None) -> bool:
     if analyze_jtbd is not None:
         return bool(analyze_jtbd)
@@ -302,7 +348,139 @@ cleaner = TranscriptionCleaner()  # Полный пайплайн очистки
 if DIARIZATION_BACKEND == "pyannote":
     diarizer = SpeakerDiarizationPyannote()  # Pyannote.audio (state-of-the-art)
 else:
-    diarizer = SpeakerDiarizationResemblyzer()  # Fallback: Resemblyzer
+    diarizer = SpeakerDiarizationResemblyzer(cache_dir=EMBED_CACHE_DIR)  # Fallback: Resemblyzer
+
+# Пул процессов для диаризации (запускается при старте; больше 3 процессов
+# не нужно — одновременно обрабатывается не больше 3 задач)
+DIARIZATION_PROCESSES = int(os.environ.get(
+    "DIARIZATION_PROCESSES", max(1, min(3, (os.cpu_count() or 2) // 2))
+))
+diarization_pool: Optional[ProcessPoolExecutor] = None
+
+
+def diarization_cache_path(audio_file: str, num_speakers: Optional[int] = None) -> Path:
+    """Файл кеша диаризации: хеш содержимого аудио + backend + число спикеров"""
+    digest = hash_file(audio_file)
+    return DIAR_CACHE_DIR / f"{DIARIZATION_BACKEND}_{num_speakers or 'auto'}_{digest}.json"
+
+
+def read_json_cache(cache_path: Path):
+    """Запись из кеша или None (нет записи / запись повреждена)"""
+    try:
+        return load_json(cache_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_cache(cache_path: Path, data) -> None:
+    """Атомарно записать запись в кеш (параллельная запись того же ключа безопасна)"""
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.{id(data)}.tmp")
+    try:
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to write cache {cache_path.name}: {e}")
+        tmp_path.unlink(missing_ok=True)
+
+
+async def diarize_audio(audio_file: str, num_speakers: Optional[int] = None) -> List[Dict]:
+    """
+    Диаризация основным backend
+    
+    Результат кешируется по содержимому файла: повторная обработка того же
+    аудио (ретраи, другие флаги JTBD/очистки) не запускает модель заново.
+    Сама диаризация — в пуле процессов (в потоке, если пул не запущен).
+    """
+    cache_path = await asyncio.to_thread(diarization_cache_path, audio_file, num_speakers)
+    cached = await asyncio.to_thread(read_json_cache, cache_path)
+    if cached is not None:
+        logger.info(f"Diarization cache hit: {cache_path.name}")
+        return cached
+    
+    if diarization_pool is None:
+        segments = await asyncio.to_thread(diarizer.diarize, audio_file, num_speakers=num_speakers)
+    else:
+        loop = asyncio.get_running_loop()
+        segments = await loop.run_in_executor(
+            diarization_pool, diarization_worker.diarize_file, audio_file, num_speakers
+        )
+    
+    if segments:
+        await asyncio.to_thread(write_json_cache, cache_path, segments)
+    return segments
+
+
+# LRU очищенных текстов. Ключ — хеш текста и флаги, а не сам текст: исходные
+# транскрипты не держатся в памяти ради ключей
+CLEAN_TEXT_CACHE_SIZE = 64
+clean_text_cache = OrderedDict()  # {(blake2b текста, remove_filler_words, fix_artifacts): очищенный текст}
+clean_text_cache_lock = threading.Lock()  # clean_text() вызывается из потоков (asyncio.to_thread)
+clean_text_cache_version = -1  # версия правил корректора, под которую заполнен кеш
+
+
+def clean_text(text: str, remove_filler_words: bool, fix_artifacts: bool) -> str:
+    """
+    Полная очистка текста с мемоизацией
+    
+    Повторная обработка того же аудио с теми же флагами даёт тот же текст —
+    пайплайн очистки для него не запускается второй раз. При изменении правил
+    корректора (add_custom_correction и т.п.) кеш сбрасывается.
+    """
+    global clean_text_cache_version
+    key = (hashlib.blake2b(text.encode(), digest_size=16).digest(), remove_filler_words, fix_artifacts)
+    version = cleaner.corrector.version
+    with clean_text_cache_lock:
+        if clean_text_cache_version != version:
+            clean_text_cache.clear()
+            clean_text_cache_version = version
+        cached = clean_text_cache.get(key)
+        if cached is not None:
+            clean_text_cache.move_to_end(key)
+            return cached
+    
+    result = cleaner.clean(
+        text,
+        remove_filler_sounds=True,  # Всегда убираем лишние звуки (эээ, ммм, бе, ме)
+        remove_filler_words=remove_filler_words,  # Слова-паразиты (по запросу)
+        fix_artifacts=fix_artifacts,  # Артефакты (иишка → ИИшка)
+    )
+    
+    with clean_text_cache_lock:
+        # Правила могли смениться во время очистки — такой результат не кешируем
+        if clean_text_cache_version == version:
+            clean_text_cache[key] = result
+            if len(clean_text_cache) > CLEAN_TEXT_CACHE_SIZE:
+                clean_text_cache.popitem(last=False)
+    return result
+
+
+def jtbd_cache_path(text: str) -> Path:
+    """Файл кеша JTBD: хеш текста + провайдер, модель и версия промпта/схемы"""
+    digest = hashlib.sha256(
+        f"{jtbd_analyzer.provider}\0{jtbd_analyzer.model}\0{JTBD_PROMPT_FINGERPRINT}\0{text}".encode()
+    ).hexdigest()
+    return JTBD_CACHE_DIR / f"{digest}.json"
+
+
+def analyze_jtbd_cached(text: str) -> Dict:
+    """
+    JTBD анализ с кешем на диске
+    
+    Вызов LLM — самый долгий шаг после транскрибации; для уже
+    проанализированного текста результат берётся из JTBD_CACHE_DIR.
+    Неудачные анализы (metadata.error) не кешируются.
+    """
+    cache_path = jtbd_cache_path(text)
+    cached = read_json_cache(cache_path)
+    if cached is not None:
+        logger.info(f"JTBD cache hit: {cache_path.name}")
+        return cached
+    
+    jtbd_result = jtbd_analyzer.analyze(text)
+    if not jtbd_result.get("metadata", {}).get("error"):
+        write_json_cache(cache_path, jtbd_result)
+    return jtbd_result
+
 
 # Инициализация JTBD анализатора (с обработкой ошибок если нет API ключа)
 if JTBD_AVAILABLE:
@@ -386,79 +564,236 @@ def format_with_speakers(result_data: dict) -> str:
         # Если нет chunks, вернуть обычный result
         return result_data.get('result', '')
     
-    # Собираем все слова с метаданными
-    all_words = []
+    # Собираем слова и спикеров параллельными списками (без словаря на каждое слово)
+    words = []
+    speakers = []
     
     for chunk in chunks:
         for alt in chunk.get('alternatives', []):
             for word_data in alt.get('words', []):
                 speaker_tag = word_data.get('speakerTag')
                 if speaker_tag is not None:  # Есть информация о спикере
-                    word = word_data.get('word', '')
-                    start_time = word_data.get('startTime', '0s')
-                    all_words.append({
-                        'word': word,
-                        'speaker': speaker_tag,
-                        'time': start_time
-                    })
+                    words.append(word_data.get('word', ''))
+                    speakers.append(speaker_tag)
     
     # Если нет информации о спикерах, вернуть обычный текст
-    if not all_words:
-        return result_data.get('result', '')
-    
-    # Подсчитываем уникальных спикеров
-    unique_speakers = set(w['speaker'] for w in all_words)
-    if len(unique_speakers) <= 1:
-        # Только один спикер - вернуть обычный текст
+    if not words:
         return result_data.get('result', '')
     
     # Группируем последовательно по спикерам (диалог)
-    dialog = []
-    current_speaker = None
-    current_text = []
-    
-    for word_info in all_words:
-        speaker = word_info['speaker']
-        word = word_info['word']
-        
-        if speaker != current_speaker:
-            # Сменился спикер - сохранить предыдущую реплику
-            if current_speaker is not None and current_text:
-                text = ' '.join(current_text)
-                dialog.append(f"Спикер {current_speaker}: {text}")
-            
-            # Начать новую реплику
-            current_speaker = speaker
-            current_text = [word]
-        else:
-            # Тот же спикер - добавить слово
-            current_text.append(word)
+    dialog = [
+        f"Спикер {speaker}: {' '.join(map(itemgetter(1), run))}"
+        for speaker, run in groupby(zip(speakers, words), key=itemgetter(0))
+    ]
     
-    # Добавить последнюю реплику
-    if current_speaker is not None and current_text:
-        text = ' '.join(current_text)
-        dialog.append(f"Спикер {current_speaker}: {text}")
+    # Одна реплика = один спикер - вернуть обычный текст
+    if len(dialog) <= 1:
+        return result_data.get('result', '')
     
     return '\n\n'.join(dialog)
 
 
 # Очередь задач
 task_queue = asyncio.Queue()
-tasks_status = {}  # {task_id: {status, progress, result}}
+# {task_id: {status, progress, result}}; порядок ключей — порядок создания задач
+# (по created_at), на нём держится /history
+tasks_status = {}
+# Число задач в каждом статусе (ведут register_task, update_task и evict_expired_tasks)
+status_counts = Counter()
+
+# Завершённые задачи держим в памяти сутки (результат остаётся в RESULTS_DIR)
+TASK_STATUS_TTL = 24 * 3600
+TASK_STATUS_FLUSH_INTERVAL = 30
+# Снимок tasks_status на диске, чтобы статусы и история переживали рестарт
+TASKS_SNAPSHOT_FILE = RESULTS_DIR / "tasks_status.snapshot"
+# Тяжёлые поля не пишем в снимок — они есть в файле результата
+_SNAPSHOT_SKIP_FIELDS = {"result", "jtbd", "words_with_speakers", "speaker_segments", "traceback"}
+_last_snapshot: Optional[bytes] = None
+# Сигнал завершения задачи (успех или ошибка) для ожидающих клиентов
+task_done_events: Dict[str, asyncio.Event] = {}
+# Сигнал любого обновления статуса (только для задач, у которых есть SSE-подписчики)
+task_update_events: Dict[str, asyncio.Event] = {}
+# Пустое SSE-сообщение, если статус долго не меняется (не даёт прокси закрыть соединение)
+SSE_KEEPALIVE_INTERVAL = 15
+TASK_WAIT_MAX_TIMEOUT = 300
+_FINISHED_STATUSES = ("completed", "failed", "error")
+
+
+def register_task(task_id: str, filename: str, user: str) -> None:
+    """Создать статус новой задачи в очереди"""
+    tasks_status[task_id] = {
+        "status": "queued",
+        "progress": 0,
+        "filename": filename,
+        "created_at": datetime.now().isoformat(),
+        "user": user,
+    }
+    status_counts["queued"] += 1
+
+
+def update_task(task_id: str, **fields) -> None:
+    """Обновить несколько полей статуса задачи за один вызов и разбудить SSE-подписчиков"""
+    status = tasks_status[task_id]
+    if "status" in fields:
+        status_counts[status["status"]] -= 1
+        status_counts[fields["status"]] += 1
+        # TTL в памяти отсчитывается от завершения, а не от постановки в очередь
+        if fields["status"] in _FINISHED_STATUSES and status["status"] not in _FINISHED_STATUSES:
+            fields.setdefault("finished_at", datetime.now().isoformat())
+    status.update(fields)
+    
+    event = task_update_events.get(task_id)
+    if event is not None:
+        # set + clear: уже ждущие проснутся, следующие ждут нового обновления
+        event.set()
+        event.clear()
+        if status["status"] in _FINISHED_STATUSES:
+            del task_update_events[task_id]
+
+
+def task_update_event(task_id: str) -> asyncio.Event:
+    """Event обновления статуса задачи для SSE (создаётся при первом подписчике)"""
+    event = task_update_events.get(task_id)
+    if event is None:
+        event = task_update_events[task_id] = asyncio.Event()
+    return event
+
+
+def recount_statuses() -> None:
+    """Пересчитать status_counts по tasks_status (после массовых изменений)"""
+    status_counts.clear()
+    status_counts.update(status["status"] for status in tasks_status.values())
+
+
+def task_done_event(task_id: str) -> asyncio.Event:
+    """Event завершения задачи (создаётся при первом обращении)"""
+    event = task_done_events.get(task_id)
+    if event is None:
+        event = task_done_events[task_id] = asyncio.Event()
+    return event
+
+
+def evict_expired_tasks(now: Optional[float] = None) -> int:
+    """Удалить из памяти задачи, завершённые раньше чем TASK_STATUS_TTL назад. Возвращает число удалённых"""
+    cutoff = (time.time() if now is None else now) - TASK_STATUS_TTL
+    expired = []
+    for task_id, status in tasks_status.items():
+        if status.get("status") not in _FINISHED_STATUSES:
+            continue
+        try:
+            # В снимках старых версий finished_at нет — тогда по created_at
+            finished = datetime.fromisoformat(
+                status.get("finished_at") or status.get("created_at", "")
+            ).timestamp()
+        except ValueError:
+            continue
+        if finished < cutoff:
+            expired.append(task_id)
+    for task_id in expired:
+        status_counts[tasks_status.pop(task_id)["status"]] -= 1
+        task_done_events.pop(task_id, None)
+        task_update_events.pop(task_id, None)
+    return len(expired)
+
+
+def tasks_snapshot_payload() -> Dict[str, Dict]:
+    """
+    Копия tasks_status для снимка (без тяжёлых полей)
+    
+    Вызывается в event loop: update_task добавляет ключи в статусы, и обход
+    живых словарей из потока мог бы упасть с "dictionary changed size".
+    """
+    return {
+        task_id: {k: v for k, v in status.items() if k not in _SNAPSHOT_SKIP_FIELDS}
+        for task_id, status in tasks_status.items()
+    }
+
+
+def save_tasks_snapshot(payload: Optional[Dict[str, Dict]] = None) -> bool:
+    """
+    Записать снимок tasks_status, если он изменился с прошлой записи
+    
+    Из потока передавайте payload, собранный tasks_snapshot_payload() в event loop.
+    """
+    global _last_snapshot
+    if payload is None:
+        payload = tasks_snapshot_payload()
+    snapshot = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    if snapshot == _last_snapshot:
+        return False
+    
+    tmp_path = TASKS_SNAPSHOT_FILE.with_suffix(".tmp")
+    tmp_path.write_bytes(snapshot)
+    os.replace(tmp_path, TASKS_SNAPSHOT_FILE)
+    _last_snapshot = snapshot
+    return True
+
+
+def load_tasks_snapshot() -> int:
+    """
+    Восстановить tasks_status из снимка
+    
+    Очередь в памяти рестарт не переживает, поэтому незавершённые задачи
+    помечаются как failed. Возвращает число восстановленных задач.
+    """
+    try:
+        restored = json.loads(TASKS_SNAPSHOT_FILE.read_bytes())
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to load tasks snapshot: {e}")
+        return 0
+    
+    for task_id, status in restored.items():
+        if status.get("status") not in _FINISHED_STATUSES:
+            status.update(
+                status="failed",
+                error="Обработка прервана перезапуском сервиса",
+                finished_at=datetime.now().isoformat(),
+            )
+        tasks_status.setdefault(task_id, status)
+    
+    # Восстановленные задачи старше уже созданных — вернуть порядок создания
+    ordered = sorted(tasks_status.items(), key=lambda item: item[1].get("created_at", ""))
+    tasks_status.clear()
+    tasks_status.update(ordered)
+    recount_statuses()
+    return len(restored)
+
+
+async def task_status_maintenance_loop():
+    """Периодически: выбросить старые задачи из памяти и сохранить снимок статусов"""
+    while True:
+        await asyncio.sleep(TASK_STATUS_FLUSH_INTERVAL)
+        try:
+            removed = evict_expired_tasks()
+            if removed:
+                logger.info(f"Evicted {removed} expired tasks from memory")
+            await asyncio.to_thread(save_tasks_snapshot, tasks_snapshot_payload())
+        except Exception as e:
+            logger.warning(f"Task status maintenance failed: {e}")
 
 # Rate limiting (простая защита от спама)
-from collections import defaultdict
+from collections import defaultdict, deque
 import time
 
-request_counts = defaultdict(list)  # {ip: [timestamp1, timestamp2, ...]}
 RATE_LIMIT_WINDOW = 60  # 60 секунд
 RATE_LIMIT_MAX_REQUESTS = 10  # Максимум 10 запросов в минуту
+RATE_LIMIT_CLEANUP_INTERVAL = 300  # Как часто выбрасывать IP без свежих запросов
+# {ip: deque([timestamp1, timestamp2, ...])} — не длиннее лимита, старые слева
+request_counts = defaultdict(lambda: deque(maxlen=RATE_LIMIT_MAX_REQUESTS))
 
 # Простая авторизация
 VALID_TOKENS = {
     "artem_token": "Artem",
     "test_token": "Test User",
 }
+# Заголовок Authorization целиком -> пользователь (без разбора строки на каждый запрос).
+# Голый токен без "Bearer " тоже принимается, как и раньше
+_AUTH_HEADERS = {
+    **VALID_TOKENS,
+    **{f"Bearer {token}": user for token, user in VALID_TOKENS.items()},
+}
 
 def verify_token(authorization: Optional[str] = Header(None)) -> str:
     """Проверка токена авторизации"""
@@ -466,11 +801,10 @@ def verify_token(authorization: Optional[str] = Header(None)) -> str:
         # В dev режиме разрешаем без токена
         return "anonymous"
     
-    token = authorization.replace("Bearer ", "")
-    if token in VALID_TOKENS:
-        return VALID_TOKENS[token]
-    
-    raise HTTPException(status_code=401, detail="Invalid token")
+    try:
+        return _AUTH_HEADERS[authorization]
+    except KeyError:
+        raise HTTPException(status_code=401, detail="Invalid token") from None
 
 
 def check_rate_limit(client_ip: str) -> None:
@@ -479,22 +813,51 @@ def check_rate_limit(client_ip: str) -> None:
     Максимум 10 запросов в минуту с одного IP
     """
     now = time.time()
+    timestamps = request_counts[client_ip]
     
-    # Очистка старых записей
-    request_counts[client_ip] = [
-        ts for ts in request_counts[client_ip] 
-        if now - ts < RATE_LIMIT_WINDOW
-    ]
+    # Очистка старых записей (они всегда в начале очереди)
+    while timestamps and now - timestamps[0] >= RATE_LIMIT_WINDOW:
+        timestamps.popleft()
     
     # Проверка лимита
-    if len(request_counts[client_ip]) >= RATE_LIMIT_MAX_REQUESTS:
+    if len(timestamps) >= RATE_LIMIT_MAX_REQUESTS:
         raise HTTPException(
             status_code=429,
             detail=f"Слишком много запросов. Максимум {RATE_LIMIT_MAX_REQUESTS} запросов в минуту."
         )
     
     # Добавление текущего запроса
-    request_counts[client_ip].append(now)
+    timestamps.append(now)
+
+
+def prune_rate_limits(now: Optional[float] = None) -> int:
+    """Удалить IP, у которых не осталось запросов в окне. Возвращает число удалённых"""
+    now = time.time() if now is None else now
+    stale = [
+        ip for ip, timestamps in request_counts.items()
+        if not timestamps or now - timestamps[-1] >= RATE_LIMIT_WINDOW
+    ]
+    for ip in stale:
+        del request_counts[ip]
+    return len(stale)
+
+
+async def rate_limit_cleanup_loop():
+    """Периодическая очистка request_counts, чтобы словарь не рос бесконечно"""
+    while True:
+        await asyncio.sleep(RATE_LIMIT_CLEANUP_INTERVAL)
+        removed = prune_rate_limits()
+        if removed:
+            logger.debug(f"Rate limit: dropped {removed} idle IPs")
+
+
+# Всё, кроме букв (латиница + кириллица), цифр, дефиса, подчёркивания и пробелов
+_FILENAME_BAD_CHARS = re.compile(r'[^\w\s\-а-яА-ЯёЁ]', re.UNICODE)
+_FILENAME_COLLAPSE = re.compile(r'[\s_]+')
+# Те же правила для ASCII одной таблицей: типичное имя файла обходится без regex-замены
+_FILENAME_ASCII_TABLE = str.maketrans({
+    c: '_' for c in map(chr, range(128)) if _FILENAME_BAD_CHARS.match(c)
+})
 
 
 def sanitize_filename(filename: str) -> str:
@@ -529,10 +892,12 @@ def sanitize_filename(filename: str) -> str:
         
         # Оставляем только безопасные символы:
         # буквы (латиница + кириллица), цифры, дефис, подчёркивание, пробелы
-        name = re.sub(r'[^\w\s\-а-яА-ЯёЁ]', '_', name, flags=re.UNICODE)
+        name = name.translate(_FILENAME_ASCII_TABLE)
+        if not name.isascii():
+            name = _FILENAME_BAD_CHARS.sub('_', name)
         
         # Убираем множественные пробелы и подчёркивания
-        name = re.sub(r'[\s_]+', '_', name)
+        name = _FILENAME_COLLAPSE.sub('_', name)
         
         # Убираем начальные/конечные спецсимволы
         name = name.strip('_-. ')
@@ -629,70 +994,244 @@ def probe_media_file(file_path: Path) -> dict:
         raise ValueError(f"Не удалось прочитать файл: {e}")
 
 
+# Буфер для копирования потоков загрузки: меньше системных вызовов на гигабайтных файлах
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+def save_upload_stream(source, destination: Path) -> None:
+    """Сохранить поток UploadFile на диск крупными блоками (вызывать вне event loop)"""
+    with open(destination, "wb") as target:
+        shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+
+
+def _copy_file_range(source_fd: int, target_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(source_fd, target_fd, count, offset)
+
+
+def _sendfile(source_fd: int, target_fd: int, offset: int, count: int) -> int:
+    return os.sendfile(target_fd, source_fd, offset, count)
+
+
+# Копирование в ядре, по убыванию выгоды: copy_file_range (на btrfs/xfs — reflink
+# без копирования данных), затем sendfile. Оба пишут по текущей позиции target
+_KERNEL_COPY_FUNCS = [
+    func for name, func in (("copy_file_range", _copy_file_range), ("sendfile", _sendfile))
+    if hasattr(os, name)
+]
+
+
+def append_file_contents(source, target) -> None:
+    """
+    Дописать содержимое открытого файла source в target
+    
+    Копирует в ядре (copy_file_range/sendfile, без буферов Python); если это
+    недоступно или не поддерживается для этих файлов — через copyfileobj.
+    target не должен быть открыт в режиме append (copy_file_range с O_APPEND не работает).
+    """
+    size = os.fstat(source.fileno()).st_size
+    offset = 0
+    target.flush()
+    for kernel_copy in _KERNEL_COPY_FUNCS:
+        try:
+            while offset < size:
+                copied = kernel_copy(source.fileno(), target.fileno(), offset, size - offset)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError:
+            continue
+        break
+    if offset < size:
+        source.seek(offset)
+        target.seek(0, os.SEEK_END)
+        shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+
+
+def assemble_chunks(chunk_paths: List[Path], final_path: Path) -> None:
+    """
+    Склеить чанки в итоговый файл; чанки удаляются после успешной склейки
+    
+    Первый чанк по возможности не копируется, а переименовывается в итоговый
+    файл (если чанки и загрузки на одной файловой системе) — остальные
+    дописываются к нему. При ошибке первый чанк возвращается на место, а
+    недоклеенный файл удаляется: склейку можно повторить.
+    """
+    remaining = list(chunk_paths)
+    first_chunk = None
+    if remaining:
+        first_size = os.stat(remaining[0]).st_size
+        try:
+            os.replace(remaining[0], final_path)
+            first_chunk = remaining.pop(0)
+        except OSError as e:
+            # Другая файловая система — копируем все; остальные ошибки не маскируем
+            if e.errno != errno.EXDEV:
+                raise
+    
+    try:
+        if first_chunk is None:
+            final_path.write_bytes(b"")
+        with open(final_path, "r+b") as final_file:
+            final_file.seek(0, os.SEEK_END)
+            for chunk_path in remaining:
+                with open(chunk_path, "rb") as chunk_file:
+                    append_file_contents(chunk_file, final_file)
+    except BaseException:
+        if first_chunk is not None:
+            os.truncate(final_path, first_size)
+            os.replace(final_path, first_chunk)
+        else:
+            final_path.unlink(missing_ok=True)
+        raise
+    
+    for chunk_path in remaining:
+        chunk_path.unlink()
+
+
+# Предобработка (фильтры) не должна занимать больше этого времени — иначе конвертируем без неё
+PREPROCESS_TIMEOUT = 300
+# Не перекодировать файлы, уже совпадающие с целевым форматом (OGG Opus 48 кГц моно).
+# Выключено по умолчанию: такие файлы идут в STT без фильтров предобработки
+SKIP_TRANSCODE_IF_MATCH = os.environ.get("STT_SKIP_TRANSCODE_IF_MATCH", "").strip().lower() in {"1", "true", "yes"}
+
+
+def is_target_opus(file_path: Path) -> bool:
+    """Файл — OGG с единственной дорожкой Opus 48 кГц моно (то, что выдаёт convert_to_opus)"""
+    try:
+        probe = probe_media_file(file_path)
+    except ValueError:
+        return False
+    
+    format_names = probe.get("format", {}).get("format_name", "").split(",")
+    streams = probe.get("streams", [])
+    if "ogg" not in format_names or len(streams) != 1:
+        return False
+    
+    stream = streams[0]
+    return (
+        stream.get("codec_name") == "opus"
+        and str(stream.get("sample_rate")) == "48000"
+        and stream.get("channels") == 1
+    )
+
+
+def _ffmpeg_input_error(error_msg: str) -> Optional[ValueError]:
+    """Ошибка, которую даст любой проход ffmpeg по этому файлу (повторять без фильтров бесполезно)"""
+    if "matches no streams" in error_msg:
+        return ValueError("Файл не содержит аудио дорожки")
+    if "Could not find codec parameters" in error_msg or "Invalid data" in error_msg:
+        return ValueError(
+            "Файл повреждён или имеет нестандартный формат. "
+            "Попробуйте пересохранить файл или использовать другой."
+        )
+    return None
+
+
+def convert_to_opus(source: Path, destination: Path, task_id: str) -> bool:
+    """
+    Улучшение качества + конвертация в OGG Opus одним проходом ffmpeg
+    
+    Фильтры предобработки применяются прямо при кодировании, без
+    промежуточного WAV. Если проход с фильтрами не удался или не уложился
+    в PREPROCESS_TIMEOUT, файл конвертируется без них.
+    Возвращает True, если фильтры были применены.
+    """
+    import subprocess
+    
+    decode = ['ffmpeg', '-i', str(source), '-map', '0:a:0', '-vn']
+    encode = [
+        '-c:a', 'libopus',
+        '-b:a', '48k',
+        '-ar', '48000',
+        '-ac', '1',  # Моно - быстрее
+        str(destination),
+        '-y'
+    ]
+    
+    try:
+        subprocess.run(
+            decode + ['-af', build_audio_filters()] + encode,
+            check=True, capture_output=True, timeout=PREPROCESS_TIMEOUT
+        )
+        logger.info(f"Task {task_id}: audio preprocessed and converted")
+        return True
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Task {task_id}: preprocessing timeout, converting original audio")
+    except subprocess.CalledProcessError as e:
+        error_msg = e.stderr.decode(errors="replace") if e.stderr else str(e)
+        input_error = _ffmpeg_input_error(error_msg)
+        if input_error:
+            logger.error(f"FFmpeg conversion failed for {task_id}: {error_msg}")
+            raise input_error
+        logger.warning(f"Task {task_id}: preprocessing failed: {error_msg[-200:]}, converting original audio")
+    
+    try:
+        subprocess.run(decode + encode, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        error_msg = e.stderr.decode(errors="replace") if e.stderr else str(e)
+        logger.error(f"FFmpeg conversion failed for {task_id}: {error_msg}")
+        raise _ffmpeg_input_error(error_msg) or ValueError(
+            "Не удалось обработать аудио файл. Попробуйте другой формат."
+        )
+    return False
+
+
+def load_json(raw: bytes):
+    """Разобрать JSON — через orjson, если он есть (ошибки обоих — ValueError)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def sse_event(data: dict) -> bytes:
+    """SSE-сообщение "data: <json>" сразу в байтах — через orjson, если он есть"""
+    if orjson is not None:
+        try:
+            return b"data: " + orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+        except TypeError:
+            pass
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def dump_result_json(result_data: dict) -> bytes:
+    """Сериализовать результат в JSON (UTF-8, отступ 2) — через orjson, если он есть"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                result_data,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+            )
+        except TypeError:
+            pass  # Нестандартные типы (например, numpy-скаляры без numpy-опции) — stdlib справится
+    return json.dumps(result_data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def write_result_file(result_file: Path, result_data: dict) -> None:
+    """Записать файл результата (вызывать вне event loop: файл бывает в мегабайтах)"""
+    result_file.write_bytes(dump_result_json(result_data))
+
+
 async def process_audio_file(
     file_path: Path,
     task_id: str,
     options: dict
 ):
     """Обработка аудио файла"""
+    audio_to_send = None
     try:
-        tasks_status[task_id]["status"] = "processing"
-        tasks_status[task_id]["progress"] = 10
-        tasks_status[task_id]["message"] = "Подготовка к конвертации..."
+        update_task(task_id, status="processing", progress=10, message="Подготовка к конвертации...")
         
-        import subprocess
+        # Улучшение качества и конвертация в OGG Opus (для гарантии совместимости)
+        update_task(task_id, progress=15, message="Улучшение качества и конвертация в OGG Opus...")
         
-        # NEW: Preprocess audio for better quality
-        preprocessed_file = None
-        try:
-            tasks_status[task_id]["progress"] = 15
-            tasks_status[task_id]["message"] = "Улучшение качества аудио..."
-            
-            preprocessed_file = preprocess_audio(
-                str(file_path),
-                output_file=str(TEMP_DIR / f"preprocessed_{task_id}.wav")
-            )
-            
-            # Use preprocessed file as input for conversion
-            audio_input = preprocessed_file
-            logger.info(f"Task {task_id}: audio preprocessed successfully")
-            
-        except Exception as e:
-            logger.warning(f"Task {task_id}: preprocessing failed: {e}, using original file")
-            audio_input = str(file_path)  # Fallback to original
-        
-        # Конвертация в OGG Opus (всегда, для гарантии совместимости)
-        tasks_status[task_id]["progress"] = 20
-        tasks_status[task_id]["message"] = "Конвертация в OGG Opus..."
-        
-        temp_file = TEMP_DIR / f"{task_id}.ogg"
-        
-        try:
-            subprocess.run([
-                'ffmpeg',
-                '-i', audio_input,  # Use preprocessed audio
-                '-vn',  # Игнорировать видео
-                '-c:a', 'libopus',
-                '-b:a', '48k',
-                '-ar', '48000',
-                '-ac', '1',  # Моно - быстрее
-                str(temp_file),
-                '-y'
-            ], check=True, capture_output=True)
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode() if e.stderr else str(e)
-            logger.error(f"FFmpeg conversion failed for {task_id}: {error_msg}")
-            
-            # Упрощённое сообщение для пользователя
-            if "Could not find codec parameters" in error_msg or "Invalid data" in error_msg:
-                raise ValueError(
-                    "Файл повреждён или имеет нестандартный формат. "
-                    "Попробуйте пересохранить файл или использовать другой."
-                )
-            else:
-                raise ValueError(f"Не удалось обработать аудио файл. Попробуйте другой формат.")
-        
-        audio_to_send = temp_file
+        if SKIP_TRANSCODE_IF_MATCH and await asyncio.to_thread(is_target_opus, file_path):
+            # Уже OGG Opus 48 кГц моно — отдаём в STT как есть
+            logger.info(f"Task {task_id}: source is already OGG Opus 48k mono, skipping transcode")
+            audio_to_send = file_path
+        else:
+            audio_to_send = TEMP_DIR / f"{task_id}.ogg"
+            await asyncio.to_thread(convert_to_opus, file_path, audio_to_send, task_id)
+        update_task(task_id, progress=20)
         
         # Choose transcription method based on quality_mode
         quality_mode = options.get("quality_mode", "quality")
@@ -700,8 +1239,7 @@ async def process_audio_file(
         
         # ========== FAST MODE: Local Whisper ==========
         if quality_mode == "fast":
-            tasks_status[task_id]["progress"] = 50
-            tasks_status[task_id]["message"] = "Быстрая транскрибация..."
+            update_task(task_id, progress=50, message="Быстрая транскрибация...")
             logger.info(f"Task {task_id}: using FAST mode (local Whisper)")
             
             result = await asyncio.to_thread(
@@ -714,18 +1252,17 @@ async def process_audio_file(
                 hints=DEFAULT_HINTS,
             )
             
-            tasks_status[task_id]["progress"] = 70
+            update_task(task_id, progress=70)
             
             # Speaker labeling (if requested)
             speaker_segments = None
             if options.get("speaker_labeling", False):
-                tasks_status[task_id]["message"] = "Определение спикеров..."
-                tasks_status[task_id]["progress"] = 75
+                update_task(task_id, progress=75, message="Определение спикеров...")
                 
                 try:
                     backend_name = "pyannote" if DIARIZATION_BACKEND == "pyannote" else "resemblyzer"
                     logger.info(f"Task {task_id}: running {backend_name} diarization (fast mode)")
-                    speaker_segments = await asyncio.to_thread(diarizer.diarize, str(audio_to_send), num_speakers=None)
+                    speaker_segments = await diarize_audio(str(audio_to_send))
                     
                     # Фильтруем короткие сегменты (< 2% времени)
                     if speaker_segments:
@@ -782,22 +1319,20 @@ async def process_audio_file(
         
         # ========== QUALITY MODE: Local Whisper ==========
         else:
-            tasks_status[task_id]["progress"] = 50
-            tasks_status[task_id]["message"] = "Локальная транскрибация Whisper..."
+            update_task(task_id, progress=50, message="Локальная транскрибация Whisper...")
             logger.info(f"Task {task_id}: using QUALITY mode (local Whisper)")
             
             # Если нужна диаризация - запускаем Resemblyzer параллельно
             speaker_segments = None
             used_backend = None
             if options.get("speaker_labeling", False):
-                tasks_status[task_id]["message"] = "Транскрипция + определение спикеров..."
-                tasks_status[task_id]["progress"] = 60
+                update_task(task_id, progress=60, message="Транскрипция + определение спикеров...")
                 
                 async def run_diarization():
                     try:
                         backend_name = "pyannote" if DIARIZATION_BACKEND == "pyannote" else "resemblyzer"
                         logger.info(f"Task {task_id}: starting {backend_name} diarization")
-                        result = await asyncio.to_thread(diarizer.diarize, str(audio_to_send), num_speakers=None)
+                        result = await diarize_audio(str(audio_to_send))
                         
                         # Фильтруем короткие сегменты (< 2% времени)
                         if result:
@@ -812,7 +1347,7 @@ async def process_audio_file(
                         if DIARIZATION_BACKEND == "pyannote":
                             try:
                                 logger.info(f"Task {task_id}: falling back to resemblyzer")
-                                fallback_diarizer = SpeakerDiarizationResemblyzer()
+                                fallback_diarizer = SpeakerDiarizationResemblyzer(cache_dir=EMBED_CACHE_DIR)
                                 result = await asyncio.to_thread(fallback_diarizer.diarize, str(audio_to_send), num_speakers=None)
                                 
                                 # Фильтруем короткие сегменты (< 2% времени)
@@ -829,7 +1364,7 @@ async def process_audio_file(
                 diarization_task = asyncio.create_task(run_diarization())
                 
                 # Транскрибация через выбранный STT backend
-                tasks_status[task_id]["progress"] = 70
+                update_task(task_id, progress=70)
                 result = await asyncio.to_thread(
                     stt.transcribe_sync,
                     str(audio_to_send),
@@ -841,15 +1376,13 @@ async def process_audio_file(
                 )
                 
                 # Ждём диаризацию
-                tasks_status[task_id]["message"] = "Объединение результатов..."
-                tasks_status[task_id]["progress"] = 75
+                update_task(task_id, progress=75, message="Объединение результатов...")
                 diarization_result = await diarization_task
                 speaker_segments, used_backend = diarization_result if diarization_result else (None, None)
                 
             else:
                 # Без диаризации - просто транскрибируем через выбранный backend
-                tasks_status[task_id]["message"] = "Транскрибация..."
-                tasks_status[task_id]["progress"] = 60
+                update_task(task_id, progress=60, message="Транскрибация...")
                 result = await asyncio.to_thread(
                     stt.transcribe_sync,
                     str(audio_to_send),
@@ -905,29 +1438,28 @@ async def process_audio_file(
             else:
                 text = result.get('result', '')
         
-        tasks_status[task_id]["progress"] = 70
+        update_task(task_id, progress=70)
         
         # Полная очистка текста (звуки + паразиты + артефакты)
         if options.get("clean", False) or options.get("corrections", True):
-            tasks_status[task_id]["message"] = "Улучшение качества текста..."
-            text = cleaner.clean(
+            update_task(task_id, message="Улучшение качества текста...")
+            text = await asyncio.to_thread(
+                clean_text,
                 text,
-                remove_filler_sounds=True,  # Всегда убираем лишние звуки (эээ, ммм, бе, ме)
-                remove_filler_words=options.get("clean", False),  # Слова-паразиты (по запросу)
-                fix_artifacts=options.get("corrections", True),  # Артефакты (иишка → ИИшка)
+                remove_filler_words=options.get("clean", False),
+                fix_artifacts=options.get("corrections", True),
             )
         
-        tasks_status[task_id]["progress"] = 90
+        update_task(task_id, progress=90)
         
         # JTBD анализ (если включен)
         jtbd_result = None
         if options.get("analyze_jtbd", True) and jtbd_analyzer:
             try:
-                tasks_status[task_id]["message"] = "JTBD анализ..."
-                tasks_status[task_id]["progress"] = 92
+                update_task(task_id, progress=92, message="JTBD анализ...")
                 
                 logger.info(f"Task {task_id}: starting JTBD analysis")
-                jtbd_result = jtbd_analyzer.analyze(text)
+                jtbd_result = await asyncio.to_thread(analyze_jtbd_cached, text)
                 
                 logger.info(
                     f"Task {task_id}: JTBD analysis completed, "
@@ -941,7 +1473,7 @@ async def process_audio_file(
                     "summary": f"Ошибка анализа: {str(e)}"
                 }
         
-        tasks_status[task_id]["progress"] = 95
+        update_task(task_id, progress=95)
         
         # Сохранение результата
         result_file = RESULTS_DIR / f"{task_id}.json"
@@ -962,31 +1494,15 @@ async def process_audio_file(
             "jtbd": jtbd_result,
         }
         
-        with open(result_file, 'w', encoding='utf-8') as f:
-            json.dump(result_data, f, ensure_ascii=False, indent=2)
-        
-        # Очистка временных файлов
-        if audio_to_send != file_path:
-            audio_to_send.unlink(missing_ok=True)
-        
-        # Cleanup preprocessed file
-        if preprocessed_file and preprocessed_file != str(file_path):
-            try:
-                Path(preprocessed_file).unlink(missing_ok=True)
-                logger.debug(f"Task {task_id}: cleaned up preprocessed file")
-            except Exception as e:
-                logger.warning(f"Task {task_id}: failed to cleanup preprocessed file: {e}")
+        await asyncio.to_thread(write_result_file, result_file, result_data)
         
-        tasks_status[task_id]["status"] = "completed"
-        tasks_status[task_id]["progress"] = 100
-        tasks_status[task_id]["result"] = text
-        tasks_status[task_id]["result_file"] = str(result_file)
+        update_task(task_id, status="completed", progress=100, result=text, result_file=str(result_file))
         if jtbd_result is not None:
-            tasks_status[task_id]["jtbd"] = jtbd_result
+            update_task(task_id, jtbd=jtbd_result)
         if words_with_speakers is not None:
-            tasks_status[task_id]["words_with_speakers"] = words_with_speakers
+            update_task(task_id, words_with_speakers=words_with_speakers)
         if speaker_segments_result is not None:
-            tasks_status[task_id]["speaker_segments"] = speaker_segments_result
+            update_task(task_id, speaker_segments=speaker_segments_result)
         
     except Exception as e:
         error_msg = str(e)
@@ -995,9 +1511,13 @@ async def process_audio_file(
         logger.error(f"Task {task_id} failed: {error_msg}")
         logger.debug(f"Task {task_id} traceback:\n{error_trace}")
         
-        tasks_status[task_id]["status"] = "failed"
-        tasks_status[task_id]["error"] = error_msg
-        tasks_status[task_id]["traceback"] = error_trace
+        update_task(task_id, status="failed", error=error_msg, traceback=error_trace)
+    
+    finally:
+        # Очистка временных файлов (и при ошибке тоже)
+        if audio_to_send is not None and audio_to_send != file_path:
+            audio_to_send.unlink(missing_ok=True)
+        task_done_event(task_id).set()
 
 
 async def worker():
@@ -1018,6 +1538,67 @@ async def startup_event():
     # 3 параллельных воркера
     for _ in range(3):
         asyncio.create_task(worker())
+    asyncio.create_task(rate_limit_cleanup_loop())
+    asyncio.create_task(reap_chunked_uploads_loop())
+    
+    restored = await asyncio.to_thread(load_tasks_snapshot)
+    if restored:
+        logger.info(f"Restored {restored} tasks from snapshot")
+    asyncio.create_task(task_status_maintenance_loop())
+    
+    # Диаризация — в отдельных процессах, чтобы не держать GIL основного.
+    # spawn: форк процесса с потоками и PyTorch небезопасен
+    global diarization_pool
+    if DIARIZATION_PROCESSES > 0:
+        diarization_pool = ProcessPoolExecutor(
+            max_workers=DIARIZATION_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=diarization_worker.init_worker,
+            initargs=(DIARIZATION_BACKEND, EMBED_CACHE_DIR),
+        )
+        # Процессы поднимаются по требованию: по задаче на процесс, чтобы
+        # модели загрузились сейчас, а не на первой реальной задаче
+        for _ in range(DIARIZATION_PROCESSES):
+            diarization_pool.submit(diarization_worker.ping)
+    
+    # Модель Whisper — тоже заранее, в фоне (загрузка может занять минуты)
+    warmup = getattr(stt, "warmup", None)
+    if warmup is not None:
+        asyncio.create_task(warm_up_stt(warmup))
+    
+    # numba цикл сопоставления слов со спикерами — компилируется сейчас, а не на первом merge
+    asyncio.create_task(warm_up_speaker_merge())
+
+
+async def warm_up_stt(warmup) -> None:
+    """Загрузить модель STT в фоне; ошибка не мешает старту — повторится на первой задаче"""
+    try:
+        await asyncio.to_thread(warmup)
+        logger.info("✅ STT model warmed up")
+    except Exception as e:
+        logger.warning(f"STT warmup failed: {e}")
+
+
+async def warm_up_speaker_merge() -> None:
+    """Скомпилировать цикл merge заранее; при ошибке он скомпилируется на первом merge"""
+    try:
+        await asyncio.to_thread(speaker_merge.warmup)
+    except Exception as e:
+        logger.warning(f"Speaker merge warmup failed: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановка пула диаризации и сохранение статусов задач"""
+    global diarization_pool
+    if diarization_pool is not None:
+        diarization_pool.shutdown(wait=False, cancel_futures=True)
+        diarization_pool = None
+    
+    try:
+        await asyncio.to_thread(save_tasks_snapshot, tasks_snapshot_payload())
+    except OSError as e:
+        logger.warning(f"Failed to save tasks snapshot: {e}")
 
 
 @app.get("/favicon.ico")
@@ -1067,6 +1648,28 @@ async def root(response: Response):
     """
 
 
+def forget_chunked_upload(upload_id: str) -> None:
+    """Убрать незавершённую загрузку: запись и каталог с чанками"""
+    upload_info = chunked_uploads.pop(upload_id, None)
+    if upload_info is not None:
+        shutil.rmtree(upload_info["chunk_dir"], ignore_errors=True)
+
+
+async def reap_chunked_uploads_loop():
+    """Периодически удалять загрузки, начатые больше CHUNKED_UPLOAD_TTL назад"""
+    while True:
+        await asyncio.sleep(CHUNKED_UPLOAD_REAP_INTERVAL)
+        cutoff = datetime.now().timestamp() - CHUNKED_UPLOAD_TTL
+        stale = [
+            upload_id for upload_id, info in chunked_uploads.items()
+            if datetime.fromisoformat(info["started_at"]).timestamp() < cutoff
+        ]
+        for upload_id in stale:
+            await asyncio.to_thread(forget_chunked_upload, upload_id)
+        if stale:
+            logger.info(f"Reaped {len(stale)} abandoned chunked uploads")
+
+
 @app.post("/upload-chunk")
 async def upload_chunk(
     upload_id: str = Form(...),
@@ -1095,7 +1698,14 @@ async def upload_chunk(
     logger.info(f"Chunk upload from {client_ip}: {upload_id} [{chunk_index+1}/{total_chunks}]")
     
     # Инициализация upload если первый чанк
-    if upload_id not in chunked_uploads:
+    if upload_id in chunked_uploads:
+        chunked_uploads.move_to_end(upload_id)
+    else:
+        while len(chunked_uploads) >= MAX_CHUNKED_UPLOADS:
+            oldest_id = next(iter(chunked_uploads))
+            logger.warning(f"Too many chunked uploads, dropping least recent: {oldest_id}")
+            await asyncio.to_thread(forget_chunked_upload, oldest_id)
+        
         safe_filename = sanitize_filename(filename)
         chunked_uploads[upload_id] = {
             "filename": safe_filename,
@@ -1111,8 +1721,7 @@ async def upload_chunk(
     
     # Сохранение чанка
     chunk_path = upload_info["chunk_dir"] / f"chunk_{chunk_index}"
-    with open(chunk_path, "wb") as f:
-        shutil.copyfileobj(chunk.file, f)
+    await asyncio.to_thread(save_upload_stream, chunk.file, chunk_path)
     
     upload_info["received_chunks"].add(chunk_index)
     received_count = len(upload_info["received_chunks"])
@@ -1147,13 +1756,15 @@ async def complete_upload(
     Завершение chunked upload и запуск транскрибации
     """
     
-    if upload_id not in chunked_uploads:
+    # Запись забирается до склейки: повторный /complete-upload, очистка
+    # брошенных загрузок и вытеснение не доберутся до тех же чанков
+    upload_info = chunked_uploads.pop(upload_id, None)
+    if upload_info is None:
         raise HTTPException(status_code=404, detail="Upload ID not found")
     
-    upload_info = chunked_uploads[upload_id]
-    
     # Проверка что все чанки получены
     if len(upload_info["received_chunks"]) != upload_info["total_chunks"]:
+        chunked_uploads[upload_id] = upload_info
         raise HTTPException(
             status_code=400, 
             detail=f"Incomplete upload: {len(upload_info['received_chunks'])}/{upload_info['total_chunks']} chunks"
@@ -1162,23 +1773,30 @@ async def complete_upload(
     logger.info(f"Assembling chunked upload: {upload_id}")
     
     # Объединение чанков
-    task_id = hashlib.md5(f"{upload_id}{datetime.now().isoformat()}".encode()).hexdigest()[:16]
+    task_id = make_task_id()
     final_path = UPLOAD_DIR / f"{task_id}_{upload_info['filename']}"
     
-    with open(final_path, "wb") as final_file:
-        for i in range(upload_info["total_chunks"]):
-            chunk_path = upload_info["chunk_dir"] / f"chunk_{i}"
-            with open(chunk_path, "rb") as chunk_file:
-                shutil.copyfileobj(chunk_file, final_file)
+    chunk_paths = [upload_info["chunk_dir"] / f"chunk_{i}" for i in range(upload_info["total_chunks"])]
+    try:
+        await asyncio.to_thread(assemble_chunks, chunk_paths, final_path)
+    except Exception:
+        # Чанки остались на месте — загрузку можно завершить повторно
+        chunked_uploads.setdefault(upload_id, upload_info)
+        raise
+    
+    # Чанки уже в итоговом файле
+    await asyncio.to_thread(shutil.rmtree, upload_info["chunk_dir"], ignore_errors=True)
     
-    logger.info(f"Assembled file: {final_path}, size: {final_path.stat().st_size}")
+    final_size = final_path.stat().st_size
+    logger.info(f"Assembled file: {final_path}, size: {final_size}")
     
-    # Проверка размера
-    if final_path.stat().st_size > MAX_FILE_SIZE:
+    # Проверка размера (и валидация ниже) зависит только от содержимого:
+    # повтор с теми же чанками не поможет, загрузку нужно начать заново
+    if final_size > MAX_FILE_SIZE:
         final_path.unlink()
         raise HTTPException(
             status_code=413,
-            detail=f"Файл слишком большой: {final_path.stat().st_size // (1024*1024)} МБ"
+            detail=f"Файл слишком большой: {final_size // (1024*1024)} МБ"
         )
     
     # Валидация файла
@@ -1188,10 +1806,6 @@ async def complete_upload(
         final_path.unlink()
         raise HTTPException(status_code=400, detail=str(e))
     
-    # Очистка чанков
-    shutil.rmtree(upload_info["chunk_dir"], ignore_errors=True)
-    del chunked_uploads[upload_id]
-    
     # Создание задачи на транскрибацию
     safe_language = sanitize_language_code(language)
     
@@ -1204,13 +1818,7 @@ async def complete_upload(
         "analyze_jtbd": normalize_jtbd_flag(analyze_jtbd, jtbd_analysis),
     }
     
-    tasks_status[task_id] = {
-        "status": "queued",
-        "progress": 0,
-        "filename": upload_info["filename"],
-        "created_at": datetime.now().isoformat(),
-        "user": "chunked_upload",
-    }
+    register_task(task_id, upload_info["filename"], "chunked_upload")
     
     await task_queue.put({
         "file_path": final_path,
@@ -1233,24 +1841,171 @@ async def test_upload(file: UploadFile = File(...)):
     logger.info(f"🧪 TEST: Received file={file.filename}, size={file.size}, content_type={file.content_type}")
     return {"status": "ok", "filename": file.filename, "content_type": file.content_type}
 
-@app.post("/transcribe")
+# Ограничение на обычные (не файловые) поля формы
+MAX_FORM_FIELD_SIZE = 64 * 1024
+
+_FORM_TRUE = {"1", "true", "t", "yes", "y", "on"}
+_FORM_FALSE = {"0", "false", "f", "no", "n", "off"}
+
+# Схема формы /transcribe для Swagger (тело разбирается вручную, FastAPI её не выводит)
+_TRANSCRIBE_FORM_SCHEMA = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["file"],
+                "properties": {
+                    "file": {"type": "string", "format": "binary"},
+                    "language": {"type": "string", "default": "ru-RU"},
+                    "punctuation": {"type": "boolean", "default": True},
+                    "literature": {"type": "boolean", "default": False},
+                    "clean": {"type": "boolean", "default": False},
+                    "corrections": {"type": "boolean", "default": True},
+                    "speaker_labeling": {"type": "boolean", "default": False},
+                    "analyze_jtbd": {"type": "boolean"},
+                    "jtbd_analysis": {"type": "boolean"},
+                    "quality_mode": {"type": "string", "default": "quality"},
+                },
+            }
+        }
+    },
+}
+
+
+def form_validation_error(field: str, msg: str, error_type: str) -> HTTPException:
+    """422 в формате ошибок валидации FastAPI"""
+    return HTTPException(
+        status_code=422,
+        detail=[{"loc": ["body", field], "msg": msg, "type": error_type}],
+    )
+
+
+def form_bool(fields: Dict[str, str], name: str, default: Optional[bool]) -> Optional[bool]:
+    """Булево поле формы (те же значения, что принимает FastAPI Form(bool))"""
+    value = fields.get(name)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in _FORM_TRUE:
+        return True
+    if value in _FORM_FALSE:
+        return False
+    raise form_validation_error(name, "value could not be parsed to a boolean", "bool_parsing")
+
+
+async def receive_multipart_to_file(request: Request, file_path: Path, max_size: int):
+    """
+    Потоковый разбор multipart/form-data: часть "file" пишется прямо в file_path
+    
+    Starlette перед вызовом обработчика с UploadFile целиком спулит тело
+    во временный файл, и его приходится копировать ещё раз. Здесь тело
+    разбирается по мере поступления, данные файла пишутся на диск блоками
+    COPY_BUFFER_SIZE в отдельном потоке, а превышение max_size обрывает
+    загрузку с 413 сразу. Некорректное тело — 400, как у разбора формы
+    Starlette. При ошибке файл удаляется.
+    
+    Returns:
+        (поля формы, имя загруженного файла, размер файла)
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise form_validation_error("file", "field required", "missing")
+    
+    fields: Dict[str, str] = {}
+    filename: Optional[str] = None
+    size = 0
+    pending: List[bytes] = []
+    pending_size = 0
+    
+    # Состояние текущей части
+    part = {"header_field": b"", "header_value": b"", "headers": {}, "name": None, "is_file": False, "value": bytearray()}
+    
+    def on_part_begin():
+        part.update(header_field=b"", header_value=b"", headers={}, name=None, is_file=False, value=bytearray())
+    
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+    
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+    
+    def on_header_end():
+        part["headers"][part["header_field"].lower()] = part["header_value"]
+        part["header_field"] = b""
+        part["header_value"] = b""
+    
+    def on_headers_finished():
+        nonlocal filename
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if part["name"] == "file" and b"filename" in options and filename is None:
+            filename = options[b"filename"].decode("utf-8", errors="replace")
+            part["is_file"] = True
+    
+    def on_part_data(data, start, end):
+        nonlocal size, pending_size
+        chunk = data[start:end]
+        if part["is_file"]:
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Файл слишком большой. Максимальный размер: {max_size // (1024*1024)} МБ"
+                )
+            pending.append(chunk)
+            pending_size += len(chunk)
+        else:
+            part["value"] += chunk
+            if len(part["value"]) > MAX_FORM_FIELD_SIZE:
+                raise HTTPException(status_code=413, detail="Слишком большое поле формы")
+    
+    def on_part_end():
+        if not part["is_file"] and part["name"]:
+            fields[part["name"]] = part["value"].decode("utf-8", errors="replace")
+    
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    
+    try:
+        with open(file_path, "wb") as f:
+            try:
+                async for data in request.stream():
+                    parser.write(data)
+                    if pending_size >= COPY_BUFFER_SIZE:
+                        await asyncio.to_thread(f.writelines, pending)
+                        pending = []
+                        pending_size = 0
+                parser.finalize()
+            except MultipartParseError as e:
+                raise HTTPException(status_code=400, detail=f"Некорректное тело multipart/form-data: {e}")
+            if pending:
+                await asyncio.to_thread(f.writelines, pending)
+        if filename is None:
+            raise form_validation_error("file", "field required", "missing")
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+    return fields, filename, size
+
+
+@app.post("/transcribe", openapi_extra={"requestBody": _TRANSCRIBE_FORM_SCHEMA})
 async def transcribe(
-    file: UploadFile = File(...),
-    language: str = Form("ru-RU"),
-    punctuation: bool = Form(True),
-    literature: bool = Form(False),
-    clean: bool = Form(False),
-    corrections: bool = Form(True),
-    speaker_labeling: bool = Form(False),
-    analyze_jtbd: Optional[bool] = Form(None),  # JTBD отключен по умолчанию
-    jtbd_analysis: Optional[bool] = Form(None),  # backward compatibility
-    quality_mode: str = Form("quality"),  # legacy UI switch; both modes use local Whisper
+    request: Request,
     user: str = Header(None, alias="X-User"),
     x_forwarded_for: str = Header(None, alias="X-Forwarded-For"),
     x_real_ip: str = Header(None, alias="X-Real-IP")
 ):
     """
-    Транскрибация аудио файла
+    Транскрибация аудио файла (multipart/form-data)
     
     - **file**: аудио файл (MP3, WAV, AAC, OGG и т.д.)
     - **language**: язык (ru-RU, en-US, etc.)
@@ -1261,89 +2016,77 @@ async def transcribe(
     - **corrections**: применять исправления
     - **analyze_jtbd**: анализировать по JTBD фреймворку (Jobs To Be Done)
     - **quality_mode**: legacy-переключатель UI; оба режима используют выбранный STT backend
-    """
     
-    # 🔍 STEP 1: Получили параметры
-    analyze_jtbd_flag = normalize_jtbd_flag(analyze_jtbd, jtbd_analysis)
-    logger.info(f"📥 STEP 1: Received params - file={file.filename}, language={language}, punctuation={punctuation}, literature={literature}, clean={clean}, corrections={corrections}, speaker_labeling={speaker_labeling}, analyze_jtbd={analyze_jtbd_flag}")
+    Тело разбирается потоково: файл пишется на диск по мере поступления,
+    без промежуточного SpooledTemporaryFile и повторного копирования.
+    """
     
-    # Rate limiting (защита от спама)
+    # Rate limiting (защита от спама) — до приёма тела, чтобы не качать файл зря
     # Получаем IP из headers (если за прокси) или используем заглушку
     client_ip = x_forwarded_for or x_real_ip or "direct"
-    logger.info(f"📍 STEP 2: Client IP = {client_ip}")
     if client_ip and ',' in client_ip:
         client_ip = client_ip.split(',')[0].strip()  # Первый IP из списка
     
-    logger.info(f"Upload request from {client_ip}: {file.filename} ({file.content_type})")
-    
-    logger.info("⏱️ STEP 3: Checking rate limit...")
     try:
         check_rate_limit(client_ip)
-        logger.info("✅ STEP 3: Rate limit OK")
-    except HTTPException as e:
-        logger.warning(f"❌ STEP 3: Rate limit exceeded for {client_ip}")
+    except HTTPException:
+        logger.warning("Rate limit exceeded for %s", client_ip)
         raise
     
+    # Приём тела: файл сразу во временный файл в UPLOAD_DIR (имя станет известно по ходу)
+    incoming_path = UPLOAD_DIR / f".incoming_{make_task_id()}"
+    fields, filename, file_size = await receive_multipart_to_file(request, incoming_path, MAX_FILE_SIZE)
+    
+    try:
+        language = fields.get("language", "ru-RU")
+        punctuation = form_bool(fields, "punctuation", True)
+        literature = form_bool(fields, "literature", False)
+        clean = form_bool(fields, "clean", False)
+        corrections = form_bool(fields, "corrections", True)
+        speaker_labeling = form_bool(fields, "speaker_labeling", False)
+        analyze_jtbd = form_bool(fields, "analyze_jtbd", None)
+        jtbd_analysis = form_bool(fields, "jtbd_analysis", None)  # backward compatibility
+        quality_mode = fields.get("quality_mode", "quality")  # legacy UI switch; both modes use local Whisper
+        
+        if file_size == 0:
+            logger.error("Empty upload from %s: %s", client_ip, filename)
+            raise HTTPException(status_code=400, detail="Файл пустой")
+    except HTTPException:
+        incoming_path.unlink(missing_ok=True)
+        raise
+    
+    analyze_jtbd_flag = normalize_jtbd_flag(analyze_jtbd, jtbd_analysis)
+    
     # Генерация task_id
-    logger.info("🔑 STEP 4: Generating task_id...")
-    task_id = hashlib.md5(
-        f"{file.filename}{datetime.now().isoformat()}".encode()
-    ).hexdigest()[:16]
-    logger.info(f"✅ STEP 4: task_id = {task_id}")
+    task_id = make_task_id()
     
     # Санитизация имени файла (защита от инъекций)
-    logger.info("🧹 STEP 5: Sanitizing filename...")
-    safe_filename = sanitize_filename(file.filename)
-    if file.filename != safe_filename:
-        logger.info(f"⚠️  Sanitized filename: '{file.filename}' -> '{safe_filename}'")
-    logger.info(f"✅ STEP 5: safe_filename = {safe_filename}")
+    safe_filename = sanitize_filename(filename)
+    if filename != safe_filename:
+        logger.info("Sanitized filename: %r -> %r", filename, safe_filename)
     
     # Санитизация языкового кода
-    logger.info("🌍 STEP 6: Sanitizing language code...")
     safe_language = sanitize_language_code(language)
-    logger.info(f"✅ STEP 6: safe_language = {safe_language}")
-    
-    # Проверка размера файла
-    logger.info("📏 STEP 7: Checking file size...")
-    file.file.seek(0, 2)  # Переместиться в конец файла
-    file_size = file.file.tell()
-    file.file.seek(0)  # Вернуться в начало
-    logger.info(f"✅ STEP 7: file_size = {file_size} bytes ({file_size / (1024*1024):.2f} MB)")
-    
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)} МБ, загружено: {file_size // (1024*1024)} МБ"
-        )
     
-    if file_size == 0:
-        logger.error("❌ STEP 7: File is empty")
-        raise HTTPException(status_code=400, detail="Файл пустой")
-    
-    # Сохранение файла
-    logger.info(f"💾 STEP 8: Saving file to {UPLOAD_DIR}...")
+    # Файл уже на диске — только переименовать (тот же каталог, без копирования)
     file_path = UPLOAD_DIR / f"{task_id}_{safe_filename}"
     try:
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-        logger.info(f"✅ STEP 8: File saved to {file_path}")
-    except Exception as e:
-        logger.error(f"❌ STEP 8: Failed to save file: {e}")
+        os.replace(incoming_path, file_path)
+    except OSError as e:
+        logger.error("Failed to save file %s: %s", file_path, e)
+        incoming_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=f"Ошибка при сохранении файла: {e}")
     
     # Проверка безопасности файла
-    logger.info(f"🔒 STEP 9: Validating file security...")
     try:
         validate_file_security(safe_filename, file_path)
-        logger.info(f"✅ STEP 9: File validated successfully: {safe_filename}")
     except ValueError as e:
         # Удаляем небезопасный файл
-        logger.error(f"❌ STEP 9: File validation failed: {safe_filename}, reason: {e}")
+        logger.error("File validation failed: %s, reason: %s", safe_filename, e)
         file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=str(e))
     
     # Опции (используем санитизированный язык)
-    logger.info("⚙️ STEP 10: Creating options...")
     options = {
         "language": safe_language,
         "punctuation": punctuation,
@@ -1354,27 +2097,125 @@ async def transcribe(
         "analyze_jtbd": analyze_jtbd_flag,
         "quality_mode": quality_mode,  # "fast" or "quality"
     }
-    logger.info(f"✅ STEP 10: options = {options}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("transcribe task=%s options=%s", task_id, options)
     
     # Создание задачи (используем санитизированное имя для отображения)
-    logger.info("📋 STEP 11: Creating task status...")
-    tasks_status[task_id] = {
+    register_task(task_id, safe_filename, user or "anonymous")  # Санитизированное имя для безопасного отображения
+    
+    # Добавление в очередь
+    await task_queue.put({
+        "file_path": file_path,
+        "task_id": task_id,
+        "options": options,
+    })
+    # Одна итоговая запись на запрос (ленивое %-форматирование)
+    logger.info("transcribe accepted task=%s file=%s size=%d ip=%s", task_id, safe_filename, file_size, client_ip)
+    
+    return {
+        "task_id": task_id,
         "status": "queued",
-        "progress": 0,
-        "filename": safe_filename,  # Санитизированное имя для безопасного отображения
-        "created_at": datetime.now().isoformat(),
-        "user": user or "anonymous",
+        "message": "Задача добавлена в очередь"
     }
-    logger.info(f"✅ STEP 11: Task status created for {task_id}")
+
+
+async def receive_body_to_file(request: Request, file_path: Path, max_size: int) -> int:
+    """
+    Записать тело запроса в файл по мере поступления (без multipart и спулинга в /tmp)
+    
+    Данные копятся до COPY_BUFFER_SIZE и пишутся на диск в отдельном потоке,
+    чтобы event loop не ждал диск. Возвращает размер файла.
+    """
+    size = 0
+    pending: List[bytes] = []
+    pending_size = 0
+    try:
+        with open(file_path, "wb") as f:
+            async for data in request.stream():
+                size += len(data)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Файл слишком большой. Максимальный размер: {max_size // (1024*1024)} МБ"
+                    )
+                pending.append(data)
+                pending_size += len(data)
+                if pending_size >= COPY_BUFFER_SIZE:
+                    await asyncio.to_thread(f.writelines, pending)
+                    pending = []
+                    pending_size = 0
+            if pending:
+                await asyncio.to_thread(f.writelines, pending)
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+    return size
+
+
+@app.post("/upload-stream")
+async def upload_stream(
+    request: Request,
+    filename: str,
+    language: str = "ru-RU",
+    punctuation: bool = True,
+    literature: bool = False,
+    clean: bool = False,
+    corrections: bool = True,
+    speaker_labeling: bool = False,
+    analyze_jtbd: Optional[bool] = None,
+    jtbd_analysis: Optional[bool] = None,  # backward compatibility
+    quality_mode: str = "quality",
+    user: str = Header(None, alias="X-User"),
+    x_forwarded_for: str = Header(None, alias="X-Forwarded-For"),
+    x_real_ip: str = Header(None, alias="X-Real-IP")
+):
+    """
+    Транскрибация файла, переданного телом запроса (без multipart)
+    
+    Файл пишется в UPLOAD_DIR по мере поступления байтов, поэтому размер
+    загрузки не влияет ни на память, ни на остальные запросы.
+    Опции — те же, что у /transcribe, но в query string.
+    """
+    client_ip = x_forwarded_for or x_real_ip or "direct"
+    if client_ip and ',' in client_ip:
+        client_ip = client_ip.split(',')[0].strip()
+    check_rate_limit(client_ip)
+    
+    task_id = make_task_id()
+    safe_filename = sanitize_filename(filename)
+    safe_language = sanitize_language_code(language)
+    logger.info(f"Stream upload from {client_ip}: {safe_filename} ({request.headers.get('content-length')} bytes)")
+    
+    file_path = UPLOAD_DIR / f"{task_id}_{safe_filename}"
+    file_size = await receive_body_to_file(request, file_path, MAX_FILE_SIZE)
+    if file_size == 0:
+        file_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="Файл пустой")
+    
+    try:
+        validate_file_security(safe_filename, file_path)
+    except ValueError as e:
+        file_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    options = {
+        "language": safe_language,
+        "punctuation": punctuation,
+        "literature": literature,
+        "clean": clean,
+        "corrections": corrections,
+        "speaker_labeling": speaker_labeling,
+        "analyze_jtbd": normalize_jtbd_flag(analyze_jtbd, jtbd_analysis),
+        "quality_mode": quality_mode,
+    }
+    
+    register_task(task_id, safe_filename, user or "anonymous")
     
-    # Добавление в очередь
-    logger.info("📤 STEP 12: Adding task to queue...")
     await task_queue.put({
         "file_path": file_path,
         "task_id": task_id,
         "options": options,
     })
-    logger.info(f"✅ STEP 12: Task {task_id} added to queue")
     
     return {
         "task_id": task_id,
@@ -1392,14 +2233,41 @@ async def get_status(task_id: str):
     return tasks_status[task_id]
 
 
+@app.get("/status/{task_id}/wait")
+async def wait_status(task_id: str, timeout: float = 30):
+    """
+    Дождаться завершения задачи и вернуть её статус (long polling)
+    
+    По истечении timeout (не больше TASK_WAIT_MAX_TIMEOUT секунд)
+    возвращается текущий статус, даже если задача ещё не завершена.
+    """
+    if task_id not in tasks_status:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    if tasks_status[task_id]["status"] not in _FINISHED_STATUSES:
+        timeout = min(max(timeout, 0), TASK_WAIT_MAX_TIMEOUT)
+        try:
+            await asyncio.wait_for(task_done_event(task_id).wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    if task_id not in tasks_status:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return tasks_status[task_id]
+
 
 @app.get("/status/{task_id}/stream")
 async def stream_status(task_id: str):
-    """SSE endpoint для получения обновлений статуса в реальном времени"""
+    """
+    SSE endpoint для получения обновлений статуса в реальном времени
+    
+    Сообщение отправляется только когда воркер обновил статус (update_task
+    будит подписчиков), без опроса; при долгой тишине — keepalive-комментарий.
+    """
     async def event_generator():
         while True:
             if task_id not in tasks_status:
-                yield f"data: {{\"error\": \"Task not found\"}}\n\n"
+                yield sse_event({"error": "Task not found"})
                 break
             
             task = tasks_status[task_id]
@@ -1417,15 +2285,14 @@ async def stream_status(task_id: str):
                 elif task.get("result_file"):
                     result_path = RESULTS_DIR / f"{task_id}.json"
                     if result_path.exists():
-                        with open(result_path, "r", encoding="utf-8") as f:
-                            result_data = json.load(f)
-                            data["result"] = result_data.get("text", "")
-                            if result_data.get("jtbd") is not None:
-                                data["jtbd"] = result_data.get("jtbd")
-                            if result_data.get("words_with_speakers") is not None:
-                                data["words_with_speakers"] = result_data.get("words_with_speakers")
-                            if result_data.get("speaker_segments") is not None:
-                                data["speaker_segments"] = result_data.get("speaker_segments")
+                        result_data = load_json(await asyncio.to_thread(result_path.read_bytes))
+                        data["result"] = result_data.get("text", "")
+                        if result_data.get("jtbd") is not None:
+                            data["jtbd"] = result_data.get("jtbd")
+                        if result_data.get("words_with_speakers") is not None:
+                            data["words_with_speakers"] = result_data.get("words_with_speakers")
+                        if result_data.get("speaker_segments") is not None:
+                            data["speaker_segments"] = result_data.get("speaker_segments")
                 if task.get("jtbd") is not None and "jtbd" not in data:
                     data["jtbd"] = task.get("jtbd")
                 if task.get("words_with_speakers") is not None and "words_with_speakers" not in data:
@@ -1433,12 +2300,24 @@ async def stream_status(task_id: str):
                 if task.get("speaker_segments") is not None and "speaker_segments" not in data:
                     data["speaker_segments"] = task.get("speaker_segments")
             
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            sent = (task["status"], task.get("progress"), task.get("message"))
+            yield sse_event(data)
             
-            if task["status"] in ["completed", "failed", "error"]:
+            if sent[0] in _FINISHED_STATUSES:
                 break
             
-            await asyncio.sleep(1)
+            # Пока отправлялось сообщение, статус мог измениться — тогда сразу следующее
+            current = tasks_status.get(task_id)
+            if current is None or (current["status"], current.get("progress"), current.get("message")) != sent:
+                continue
+            
+            # await напрямую (не wait_for): подписка на event происходит сразу, без окна,
+            # в котором можно пропустить set()
+            try:
+                async with asyncio.timeout(SSE_KEEPALIVE_INTERVAL):
+                    await task_update_event(task_id).wait()
+            except TimeoutError:
+                yield b": keepalive\n\n"
     
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -1450,9 +2329,8 @@ async def get_result(task_id: str):
     result_file = RESULTS_DIR / f"{task_id}.json"
     
     if result_file.exists():
-        # Файл есть - возвращаем результат
-        with open(result_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        # Файл уже JSON — отдаём байты как есть, без разбора и повторной сериализации
+        return FileResponse(result_file, media_type="application/json")
     
     # Файла нет - проверяем in-memory статус
     if task_id not in tasks_status:
@@ -1482,6 +2360,14 @@ async def get_result(task_id: str):
     )
 
 
+def content_disposition(filename: str) -> str:
+    """Заголовок attachment; не-ASCII имена — через filename* (RFC 5987), как в FileResponse"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
 @app.get("/download/{task_id}")
 async def download_result(task_id: str):
     """Скачать результат как текстовый файл"""
@@ -1494,22 +2380,18 @@ async def download_result(task_id: str):
             detail="Результат не найден. Возможно файл был удалён или срок хранения истёк."
         )
     
-    with open(result_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Создать TXT файл
-    txt_file = TEMP_DIR / f"{task_id}.txt"
-    txt_file.write_text(data.get("result") or data.get("text", ""), encoding='utf-8')
+    data = load_json(await asyncio.to_thread(result_file.read_bytes))
     
     # Имя файла из результата или из in-memory статуса
     filename = data.get("original_filename", "transcript.txt")
     if not filename.endswith('.txt'):
         filename = filename.rsplit('.', 1)[0] + '.txt'
     
-    return FileResponse(
-        txt_file,
-        media_type='text/plain',
-        filename=filename
+    # TXT собирается в памяти — без записи во временный файл и повторного чтения
+    return Response(
+        content=(data.get("result") or data.get("text", "")).encode("utf-8"),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": content_disposition(filename)},
     )
 
 
@@ -1518,11 +2400,8 @@ async def get_history(limit: int = 50):
     """Получить историю транскрибаций"""
     history = []
     
-    for task_id, status in sorted(
-        tasks_status.items(),
-        key=lambda x: x[1].get("created_at", ""),
-        reverse=True
-    )[:limit]:
+    # tasks_status упорядочен по созданию: последние limit задач — с конца, без сортировки
+    for task_id, status in islice(reversed(tasks_status.items()), max(limit, 0)):
         history.append({
             "task_id": task_id,
             "filename": status.get("filename"),
@@ -1537,18 +2416,12 @@ async def get_history(limit: int = 50):
 @app.get("/stats")
 async def get_stats():
     """Статистика сервиса"""
-    total = len(tasks_status)
-    completed = sum(1 for s in tasks_status.values() if s["status"] == "completed")
-    failed = sum(1 for s in tasks_status.values() if s["status"] == "failed")
-    queued = sum(1 for s in tasks_status.values() if s["status"] == "queued")
-    processing = sum(1 for s in tasks_status.values() if s["status"] == "processing")
-    
     return {
-        "total_tasks": total,
-        "completed": completed,
-        "failed": failed,
-        "queued": queued,
-        "processing": processing,
+        "total_tasks": len(tasks_status),
+        "completed": status_counts["completed"],
+        "failed": status_counts["failed"],
+        "queued": status_counts["queued"],
+        "processing": status_counts["processing"],
         "queue_size": task_queue.qsize(),
     }
 
@@ -1565,6 +2438,31 @@ async def get_supported_formats():
     }
 
 
+def tail_lines(path: Path, count: int, block_size: int = 64 * 1024) -> List[str]:
+    """
+    Последние count строк файла
+    
+    Файл читается с конца блоками по block_size, пока не наберётся
+    достаточно переводов строк — память и чтение не зависят от размера лога.
+    """
+    if count <= 0:
+        return []
+    blocks = []
+    newlines = 0
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        # count + 1 переводов строк: начало первой из нужных строк тоже прочитано
+        while position > 0 and newlines <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+            blocks.append(block)
+            newlines += block.count(b"\n")
+    data = b"".join(reversed(blocks))
+    return [line.decode("utf-8", errors="replace") for line in data.splitlines()[-count:]]
+
+
 @app.get("/logs")
 async def get_logs(lines: int = 100):
     """
@@ -1578,34 +2476,55 @@ async def get_logs(lines: int = 100):
         return {"logs": [], "message": "Логи пока пусты"}
     
     try:
-        # Читаем последние N строк
-        with open(log_file, 'r', encoding='utf-8') as f:
-            all_lines = f.readlines()
-            last_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
+        last_lines = await asyncio.to_thread(tail_lines, log_file, lines)
         
         return {
             "logs": [line.strip() for line in last_lines],
-            "total_lines": len(all_lines),
-            "showing": len(last_lines)
+            "showing": len(last_lines),
+            "file_size": log_file.stat().st_size,
         }
     except Exception as e:
         logger.error(f"Failed to read logs: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка чтения логов: {e}")
 
 
+# Параллельные unlink при очистке
+CLEANUP_WORKERS = 8
+
+
+def remove_stale_files(directories: List[Path], cutoff: float) -> int:
+    """
+    Удалить файлы старше cutoff (mtime) из directories. Возвращает число удалённых
+    
+    os.scandir отдаёт тип файла без лишнего stat, удаление идёт в пуле потоков.
+    Подкаталоги и снимок статусов задач не трогаются.
+    """
+    stale = []
+    for directory in directories:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if (entry.is_file(follow_symlinks=False)
+                        and entry.path != str(TASKS_SNAPSHOT_FILE)
+                        and entry.stat(follow_symlinks=False).st_mtime < cutoff):
+                    stale.append(entry.path)
+    
+    def unlink(path: str) -> bool:
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False  # Уже удалён (например, задачей, которая завершилась параллельно)
+    
+    with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+        return sum(executor.map(unlink, stale))
+
+
 @app.delete("/cleanup")
 async def cleanup_old_files(days: int = 7):
     """Очистка старых файлов"""
-    import time
-    
     cutoff = time.time() - (days * 86400)
-    cleaned = 0
-    
-    for dir in [UPLOAD_DIR, RESULTS_DIR, TEMP_DIR]:
-        for file in dir.iterdir():
-            if file.stat().st_mtime < cutoff:
-                file.unlink()
-                cleaned += 1
+    directories = [UPLOAD_DIR, RESULTS_DIR, TEMP_DIR, DIAR_CACHE_DIR, EMBED_CACHE_DIR, JTBD_CACHE_DIR]
+    cleaned = await asyncio.to_thread(remove_stale_files, directories, cutoff)
     
     return {"cleaned_files": cleaned}
 
@@ -13,13 +13,32 @@ HearYou Core - общие модули для всех сервисов
     from core.local_whisper_stt import LocalWhisperSTT
     from core.filler_words_filter import FillerWordsFilter
     from core.stt_corrections import TranscriptionCorrector
+
+При импорте в фоновом потоке прогревается глобальный корректор (автомат словаря,
+regex-проходы), чтобы первый correct() не платил за построение. Дождаться
+прогрева можно через warmup_done.wait().
 """
 
+import threading
+
 from .local_whisper_stt import LocalWhisperSTT, WhisperSettings
 from .opus_transcribe_stt import OpusTranscriptionSTT
 from .stt_provider import STTProvider
 from .filler_words_filter import FillerWordsFilter
-from .stt_corrections import TranscriptionCorrector, correct_transcription
+from .stt_corrections import StreamingCorrector, TranscriptionCorrector, correct_transcription, corrector
+
+# Выставляется, когда фоновый прогрев корректора завершён
+warmup_done = threading.Event()
+
+
+def _warmup():
+    try:
+        corrector.warmup()
+    finally:
+        warmup_done.set()
+
+
+threading.Thread(target=_warmup, name='hearyou-core-warmup', daemon=True).start()
 
 __all__ = [
     'LocalWhisperSTT',
@@ -28,7 +47,9 @@ __all__ = [
     'STTProvider',
     'FillerWordsFilter',
     'TranscriptionCorrector',
+    'StreamingCorrector',
     'correct_transcription',
+    'warmup_done',
 ]
 
 __version__ = '1.0.0'
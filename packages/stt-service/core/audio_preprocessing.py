@@ -15,6 +15,26 @@ import tempfile
 logger = logging.getLogger(__name__)
 
 
+def build_audio_filters(
+    highpass_freq: int = 200,
+    lowpass_freq: int = 3000,
+    noise_floor: int = -25
+) -> str:
+    """
+    Build the ffmpeg -af chain used for preprocessing
+    
+    Exposed separately so callers can apply the same filters inside their own
+    ffmpeg pass (e.g. together with the final encode) instead of writing an
+    intermediate WAV file.
+    """
+    return (
+        f"highpass=f={highpass_freq},"
+        f"lowpass=f={lowpass_freq},"
+        f"afftdn=nf={noise_floor},"
+        f"loudnorm"
+    )
+
+
 class AudioPreprocessor:
     """Audio preprocessing for improved STT quality using ffmpeg"""
     
@@ -104,11 +124,10 @@ class AudioPreprocessor:
         )
         
         # Build ffmpeg command with audio filters
-        audio_filters = (
-            f"highpass=f={self.highpass_freq},"
-            f"lowpass=f={self.lowpass_freq},"
-            f"afftdn=nf={self.noise_floor},"
-            f"loudnorm"
+        audio_filters = build_audio_filters(
+            highpass_freq=self.highpass_freq,
+            lowpass_freq=self.lowpass_freq,
+            noise_floor=self.noise_floor
         )
         
         ffmpeg_cmd = [
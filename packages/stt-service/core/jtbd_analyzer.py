@@ -5,12 +5,21 @@ JTBD (Jobs To Be Done) Analyzer для HearYou
 """
 
 import os
+import re
 import json
+import hashlib
+import time
+import asyncio
 import logging
 from typing import Dict, List, Optional, Any
 
 import requests
 
+try:
+    import orjson  # опционально, разбирает и сериализует JSON быстрее stdlib
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_ANTHROPIC_MODEL = "claude-sonnet-4-5-20250929"
@@ -19,6 +28,191 @@ DEFAULT_APINET_BASE_URL = "https://apinet.cloud/v1"
 DEFAULT_OPUS_CHAT_MODEL = "gpt-4o-mini"
 DEFAULT_OPUS_BASE_URL = "https://api.openai.com/v1"
 
+# С какого размера пакета analyze_batch использует Anthropic Message Batches API
+BATCH_API_MIN_TEXTS = 10
+BATCH_API_POLL_INTERVAL = 10
+# Сколько запросов пакета идёт одновременно без Batches API
+ANALYZE_BATCH_CONCURRENCY = 8
+
+# HTTP-клиент Anthropic: пул keep-alive соединений на анализатор и ретраи SDK
+# (429 / 5xx / 529 overloaded, экспоненциальная задержка с jitter)
+ANTHROPIC_MAX_RETRIES = 5
+ANTHROPIC_MAX_CONNECTIONS = 32
+ANTHROPIC_TIMEOUT = 600.0
+ANTHROPIC_CONNECT_TIMEOUT = 10.0
+
+# Статическая часть промпта (не зависит от транскрипции) — кешируется на стороне Anthropic
+JTBD_PROMPT_INSTRUCTIONS = """Проанализируй следующую транскрипцию по фреймворку Jobs To Be Done (JTBD).
+
+КОНТЕКСТ:
+Это транскрипция аудио/видео записи. Твоя задача — извлечь элементы JTBD для понимания потребностей пользователя.
+
+ФРЕЙМВОРК JTBD:
+1. **Jobs** (Работы) — основные цели и задачи, которые пользователь хочет выполнить
+   - Функциональные работы (что нужно сделать)
+   - Эмоциональные работы (как хочется себя чувствовать)
+   - Социальные работы (как хочется выглядеть в глазах других)
+
+2. **Pains** (Боли) — проблемы, препятствия, риски
+   - Нежелательные результаты
+   - Проблемы и сложности
+   - Риски и страхи
+   - Барьеры к достижению цели
+
+3. **Gains** (Выгоды) — желаемые результаты, улучшения
+   - Требуемые выгоды (минимум, без которого не обойтись)
+   - Ожидаемые выгоды (стандартные ожидания)
+   - Желаемые выгоды (приятные сюрпризы)
+   - Неожиданные выгоды (превышение ожиданий)
+
+4. **Context** (Контекст) — ситуации и условия
+   - Когда возникает потребность
+   - Где происходит
+   - С кем взаимодействует
+   - Какие ограничения существуют
+
+5. **Triggers** (Триггеры) — что запускает работу
+   - События, запускающие потребность
+   - Моменты переключения (switching moments)
+   - Проблемы, требующие решения прямо сейчас
+
+ИНСТРУКЦИИ:
+- Извлеки все значимые элементы из каждой категории
+- Цитируй конкретные фразы из транскрипции (в кавычках)
+- Укажи уровень уверенности (confidence): high/medium/low
+- Если какая-то категория не представлена в тексте — верни пустой массив
+- Используй оригинальные формулировки из текста, минимизируй интерпретацию
+- Один элемент = одна чёткая мысль (не объединяй разные идеи в один пункт)
+
+"""
+
+
+# Динамическая часть: заголовок перед транскрипцией и формат ответа (для провайдеров без tool_use)
+JTBD_TRANSCRIPT_HEADER = "ТРАНСКРИПЦИЯ:\n"
+
+JTBD_RESPONSE_FORMAT = """
+
+ФОРМАТ ОТВЕТА (строго JSON):
+{
+  "jobs": [
+    {
+      "text": "описание работы/цели",
+      "quote": "прямая цитата из транскрипции",
+      "type": "functional|emotional|social",
+      "confidence": "high|medium|low"
+    }
+  ],
+  "pains": [
+    {
+      "text": "описание боли/проблемы",
+      "quote": "прямая цитата из транскрипции",
+      "severity": "critical|high|medium|low",
+      "confidence": "high|medium|low"
+    }
+  ],
+  "gains": [
+    {
+      "text": "описание выгоды/результата",
+      "quote": "прямая цитата из транскрипции",
+      "type": "required|expected|desired|unexpected",
+      "confidence": "high|medium|low"
+    }
+  ],
+  "context": [
+    {
+      "text": "описание контекста/ситуации",
+      "quote": "прямая цитата из транскрипции",
+      "dimension": "when|where|who|constraints",
+      "confidence": "high|medium|low"
+    }
+  ],
+  "triggers": [
+    {
+      "text": "описание триггера/события",
+      "quote": "прямая цитата из транскрипции",
+      "type": "event|problem|switching_moment",
+      "confidence": "high|medium|low"
+    }
+  ],
+  "summary": "краткое резюме: основная работа пользователя и ключевые инсайты (2-3 предложения)"
+}
+
+        Верни ТОЛЬКО валидный JSON, без дополнительных комментариев."""
+
+
+# Восстановление JSON из ответа в прозе: блок ```json ... ``` (язык необязателен)
+# или, если блока нет, всё от первой { до последней }
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL | re.IGNORECASE)
+_JSON_OBJECT_RE = re.compile(r"(\{.*\})", re.DOTALL)
+
+
+def _jtbd_item_schema(attribute: str, values: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {
+            "text": {"type": "string"},
+            "quote": {"type": "string", "description": "прямая цитата из транскрипции"},
+            attribute: {"type": "string", "enum": values},
+            "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+        },
+        "required": ["text", "quote", attribute, "confidence"],
+    }
+
+
+# Tool с JSON-схемой ответа: Anthropic возвращает уже разобранный dict
+JTBD_TOOL = {
+    "name": "emit_jtbd",
+    "description": "Сохранить элементы JTBD, извлечённые из транскрипции.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "jobs": {"type": "array", "items": _jtbd_item_schema("type", ["functional", "emotional", "social"])},
+            "pains": {"type": "array", "items": _jtbd_item_schema("severity", ["critical", "high", "medium", "low"])},
+            "gains": {"type": "array", "items": _jtbd_item_schema("type", ["required", "expected", "desired", "unexpected"])},
+            "context": {"type": "array", "items": _jtbd_item_schema("dimension", ["when", "where", "who", "constraints"])},
+            "triggers": {"type": "array", "items": _jtbd_item_schema("type", ["event", "problem", "switching_moment"])},
+            "summary": {
+                "type": "string",
+                "description": "краткое резюме: основная работа пользователя и ключевые инсайты (2-3 предложения)",
+            },
+        },
+        "required": ["jobs", "pains", "gains", "context", "triggers", "summary"],
+    },
+}
+
+# Отпечаток промпта и схемы ответа: входит в ключ кешей анализа, чтобы после
+# их правки не отдавались результаты, полученные по старой версии
+JTBD_PROMPT_FINGERPRINT = hashlib.sha256(
+    json.dumps(
+        [JTBD_PROMPT_INSTRUCTIONS, JTBD_RESPONSE_FORMAT, JTBD_TOOL], ensure_ascii=False, sort_keys=True
+    ).encode()
+).hexdigest()[:16]
+
+# Секции Markdown-отчёта: (ключ результата, заголовок, атрибут элемента, подпись атрибута)
+MARKDOWN_SECTIONS = (
+    ("jobs", "## 🎯 Jobs (Работы)\n", "type", "Type"),
+    ("pains", "## 😰 Pains (Боли)\n", "severity", "Severity"),
+    ("gains", "## 🎁 Gains (Выгоды)\n", "type", "Type"),
+    ("context", "## 🌍 Context (Контекст)\n", "dimension", "Dimension"),
+    ("triggers", "## 🚀 Triggers (Триггеры)\n", "type", "Type"),
+)
+
+
+def _json_loads(text: str) -> Any:
+    """json.loads через orjson, если он установлен (orjson.JSONDecodeError — подкласс json.JSONDecodeError)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _http2_available() -> bool:
+    """httpx поддерживает HTTP/2 только при установленном пакете h2"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
 
 def _load_key_from_env_file(path: str, key_name: str) -> Optional[str]:
     env_path = os.path.expanduser(path)
@@ -127,16 +321,48 @@ class JTBDAnalyzer:
                 )
                 self.base_url = (base_url or os.getenv("APINET_BASE_URL", DEFAULT_APINET_BASE_URL)).strip() or DEFAULT_APINET_BASE_URL
             self.client = None
+            self.async_client = None
+            self._new_async_client = None
         else:
             self.model = model
             self.base_url = None
             try:
-                from anthropic import Anthropic
+                import httpx
+                from anthropic import (
+                    Anthropic,
+                    AsyncAnthropic,
+                    DefaultAsyncHttpxClient,
+                    DefaultHttpxClient,
+                )
             except ImportError as error:
                 raise ImportError(
                     "Пакет anthropic не установлен. Установите его или используйте APINET_API_KEY."
                 ) from error
-            self.client = Anthropic(api_key=self.api_key)
+            http_options = {
+                "http2": _http2_available(),
+                "limits": httpx.Limits(
+                    max_keepalive_connections=ANTHROPIC_MAX_CONNECTIONS,
+                    max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                ),
+                "timeout": httpx.Timeout(ANTHROPIC_TIMEOUT, connect=ANTHROPIC_CONNECT_TIMEOUT),
+            }
+            self.client = Anthropic(
+                api_key=self.api_key,
+                max_retries=ANTHROPIC_MAX_RETRIES,
+                http_client=DefaultHttpxClient(**http_options),
+            )
+
+            # Соединения async-клиента привязаны к event loop, в котором открыты:
+            # analyze_batch (свой loop на каждый asyncio.run) создаёт клиент заново
+            def new_async_client():
+                return AsyncAnthropic(
+                    api_key=self.api_key,
+                    max_retries=ANTHROPIC_MAX_RETRIES,
+                    http_client=DefaultAsyncHttpxClient(**http_options),
+                )
+
+            self._new_async_client = new_async_client
+            self.async_client = new_async_client()
 
         logger.info("JTBDAnalyzer initialized with provider=%s model=%s", self.provider, self.model)
     
@@ -150,97 +376,8 @@ class JTBDAnalyzer:
         Returns:
             Готовый промпт для Claude
         """
-        return f"""Проанализируй следующую транскрипцию по фреймворку Jobs To Be Done (JTBD).
-
-КОНТЕКСТ:
-Это транскрипция аудио/видео записи. Твоя задача — извлечь элементы JTBD для понимания потребностей пользователя.
-
-ФРЕЙМВОРК JTBD:
-1. **Jobs** (Работы) — основные цели и задачи, которые пользователь хочет выполнить
-   - Функциональные работы (что нужно сделать)
-   - Эмоциональные работы (как хочется себя чувствовать)
-   - Социальные работы (как хочется выглядеть в глазах других)
-
-2. **Pains** (Боли) — проблемы, препятствия, риски
-   - Нежелательные результаты
-   - Проблемы и сложности
-   - Риски и страхи
-   - Барьеры к достижению цели
-
-3. **Gains** (Выгоды) — желаемые результаты, улучшения
-   - Требуемые выгоды (минимум, без которого не обойтись)
-   - Ожидаемые выгоды (стандартные ожидания)
-   - Желаемые выгоды (приятные сюрпризы)
-   - Неожиданные выгоды (превышение ожиданий)
-
-4. **Context** (Контекст) — ситуации и условия
-   - Когда возникает потребность
-   - Где происходит
-   - С кем взаимодействует
-   - Какие ограничения существуют
-
-5. **Triggers** (Триггеры) — что запускает работу
-   - События, запускающие потребность
-   - Моменты переключения (switching moments)
-   - Проблемы, требующие решения прямо сейчас
-
-ИНСТРУКЦИИ:
-- Извлеки все значимые элементы из каждой категории
-- Цитируй конкретные фразы из транскрипции (в кавычках)
-- Укажи уровень уверенности (confidence): high/medium/low
-- Если какая-то категория не представлена в тексте — верни пустой массив
-- Используй оригинальные формулировки из текста, минимизируй интерпретацию
-- Один элемент = одна чёткая мысль (не объединяй разные идеи в один пункт)
-
-ТРАНСКРИПЦИЯ:
-{text}
-
-ФОРМАТ ОТВЕТА (строго JSON):
-{{
-  "jobs": [
-    {{
-      "text": "описание работы/цели",
-      "quote": "прямая цитата из транскрипции",
-      "type": "functional|emotional|social",
-      "confidence": "high|medium|low"
-    }}
-  ],
-  "pains": [
-    {{
-      "text": "описание боли/проблемы",
-      "quote": "прямая цитата из транскрипции",
-      "severity": "critical|high|medium|low",
-      "confidence": "high|medium|low"
-    }}
-  ],
-  "gains": [
-    {{
-      "text": "описание выгоды/результата",
-      "quote": "прямая цитата из транскрипции",
-      "type": "required|expected|desired|unexpected",
-      "confidence": "high|medium|low"
-    }}
-  ],
-  "context": [
-    {{
-      "text": "описание контекста/ситуации",
-      "quote": "прямая цитата из транскрипции",
-      "dimension": "when|where|who|constraints",
-      "confidence": "high|medium|low"
-    }}
-  ],
-  "triggers": [
-    {{
-      "text": "описание триггера/события",
-      "quote": "прямая цитата из транскрипции",
-      "type": "event|problem|switching_moment",
-      "confidence": "high|medium|low"
-    }}
-  ],
-  "summary": "краткое резюме: основная работа пользователя и ключевые инсайты (2-3 предложения)"
-}}
-
-        Верни ТОЛЬКО валидный JSON, без дополнительных комментариев."""
+        # Шаблон не форматируется: склеиваются готовые константы и текст
+        return "".join((JTBD_PROMPT_INSTRUCTIONS, JTBD_TRANSCRIPT_HEADER, text, JTBD_RESPONSE_FORMAT))
 
     def _extract_chat_output_text(self, response: Dict[str, Any]) -> str:
         parts = []
@@ -265,20 +402,65 @@ class JTBDAnalyzer:
             "output_tokens": usage.get("output_tokens", usage.get("completion_tokens", 0)) or 0,
         }
 
+    def _anthropic_params(self, text: str, max_tokens: int) -> Dict[str, Any]:
+        """Параметры запроса Messages API (общие для stream и batches)"""
+        # Статические инструкции помечены cache_control: при повторных вызовах
+        # (analyze_batch) оплачиваются и обрабатываются только токены транскрипции
+        return {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": JTBD_PROMPT_INSTRUCTIONS,
+                        "cache_control": {"type": "ephemeral"},
+                    },
+                    {"type": "text", "text": JTBD_TRANSCRIPT_HEADER + text},
+                ],
+            }],
+            # Формат ответа задаётся схемой tool, а не текстом промпта
+            "tools": [JTBD_TOOL],
+            "tool_choice": {"type": "tool", "name": JTBD_TOOL["name"]},
+        }
+
     def _analyze_with_anthropic(self, text: str, max_tokens: int) -> Dict[str, Any]:
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=max_tokens,
-            messages=[{"role": "user", "content": self._build_prompt(text)}],
-        )
+        # Streaming: текст принимается по мере генерации, без ожидания полного ответа
+        parts = []
+        with self.client.messages.stream(**self._anthropic_params(text, max_tokens)) as stream:
+            for text_chunk in stream.text_stream:
+                parts.append(text_chunk)
+            message = stream.get_final_message()
+        return self._anthropic_result_data(message, "".join(parts))
+
+    async def _analyze_with_anthropic_async(self, text: str, max_tokens: int, client: Any) -> Dict[str, Any]:
+        parts = []
+        async with client.messages.stream(**self._anthropic_params(text, max_tokens)) as stream:
+            async for text_chunk in stream.text_stream:
+                parts.append(text_chunk)
+            message = await stream.get_final_message()
+        return self._anthropic_result_data(message, "".join(parts))
+
+    def _anthropic_result_data(self, message: Any, response_text: str = "") -> Dict[str, Any]:
+        parsed = None
+        text_parts = [response_text] if response_text else []
+        for block in getattr(message, "content", None) or []:
+            block_type = getattr(block, "type", None)
+            if block_type == "tool_use" and getattr(block, "name", None) == JTBD_TOOL["name"]:
+                parsed = dict(block.input)
+            elif block_type == "text" and not response_text:
+                text_parts.append(block.text)
 
-        response_text = message.content[0].text
         usage = {
             "input_tokens": getattr(message.usage, "input_tokens", 0) or 0,
             "output_tokens": getattr(message.usage, "output_tokens", 0) or 0,
+            "cache_read_input_tokens": getattr(message.usage, "cache_read_input_tokens", 0) or 0,
+            "cache_creation_input_tokens": getattr(message.usage, "cache_creation_input_tokens", 0) or 0,
         }
         return {
-            "response_text": response_text,
+            "response_text": "".join(text_parts),
+            "parsed": parsed,
             "usage": usage,
         }
 
@@ -350,53 +532,103 @@ class JTBDAnalyzer:
             else:
                 result_data = self._analyze_with_anthropic(text, max_tokens)
 
-            response_text = result_data["response_text"]
-            usage = result_data["usage"]
-
-            logger.debug("%s response length: %s chars", self.provider.title(), len(response_text))
-
-            # Парсинг JSON
-            try:
-                result = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON from JTBD provider response: {e}")
-                logger.debug(f"Raw response: {response_text[:500]}")
-                
-                # Попытка извлечь JSON из markdown блока
-                if "```json" in response_text:
-                    json_start = response_text.find("```json") + 7
-                    json_end = response_text.find("```", json_start)
-                    json_text = response_text[json_start:json_end].strip()
-                    result = json.loads(json_text)
-                else:
-                    raise ValueError("Не удалось извлечь JSON из ответа Claude")
-            
-            # Добавление метаданных
-            result["metadata"] = {
-                "model": self.model,
-                "provider": self.provider,
-                "input_length": len(text),
-                "input_tokens": usage["input_tokens"],
-                "output_tokens": usage["output_tokens"],
-                "total_elements": (
-                    len(result.get("jobs", [])) +
-                    len(result.get("pains", [])) +
-                    len(result.get("gains", [])) +
-                    len(result.get("context", [])) +
-                    len(result.get("triggers", []))
-                )
-            }
-            
-            logger.info(
-                f"JTBD analysis completed: {result['metadata']['total_elements']} elements, "
-                f"{result['metadata']['input_tokens']} in / {result['metadata']['output_tokens']} out tokens"
-            )
+            return self._build_result(text, result_data)
             
-            return result
+        except Exception as e:
+            logger.error(f"JTBD analysis failed: {e}")
+            return self._empty_result(f"Ошибка анализа: {str(e)}")
+
+    async def analyze_async(self, text: str, max_tokens: int = 4000) -> Dict[str, Any]:
+        """
+        Асинхронный вариант analyze() — не блокирует event loop на сетевом I/O
+        
+        Anthropic вызывается через AsyncAnthropic, OpenAI-compatible провайдер
+        (requests) выполняется в thread pool.
+        
+        Args:
+            text: текст транскрипции
+            max_tokens: максимальное количество токенов для ответа
             
+        Returns:
+            Словарь с элементами JTBD (как в analyze)
+        """
+        return await self._analyze_async(text, max_tokens, self.async_client)
+
+    async def _analyze_async(self, text: str, max_tokens: int, client: Any) -> Dict[str, Any]:
+        """analyze_async() с заданным AsyncAnthropic (он должен принадлежать текущему loop)"""
+        if not text or not text.strip():
+            logger.warning("Empty text provided for JTBD analysis")
+            return self._empty_result("Пустой текст")
+
+        try:
+            logger.info(f"Starting async JTBD analysis ({len(text)} chars)")
+
+            if self.provider == "apinet":
+                result_data = await asyncio.to_thread(self._analyze_with_apinet, text, max_tokens)
+            else:
+                result_data = await self._analyze_with_anthropic_async(text, max_tokens, client)
+
+            return self._build_result(text, result_data)
+
         except Exception as e:
             logger.error(f"JTBD analysis failed: {e}")
             return self._empty_result(f"Ошибка анализа: {str(e)}")
+
+    def _build_result(self, text: str, result_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Разбор ответа провайдера в структуру JTBD с метаданными
+        
+        Args:
+            text: исходный текст транскрипции
+            result_data: {"response_text": ..., "usage": {...}} от провайдера
+            
+        Returns:
+            Словарь с элементами JTBD и metadata
+        """
+        response_text = result_data["response_text"]
+        usage = result_data["usage"]
+
+        logger.debug("%s response length: %s chars", self.provider.title(), len(response_text))
+
+        # Парсинг JSON (ответ через tool_use уже разобран SDK)
+        try:
+            result = result_data.get("parsed")
+            if result is None:
+                result = _json_loads(response_text)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse JSON from JTBD provider response: {e}")
+            logger.debug(f"Raw response: {response_text[:500]}")
+            
+            # Попытка извлечь JSON из markdown блока (```json или просто ```),
+            # в крайнем случае — от первой { до последней }
+            match = _JSON_FENCE_RE.search(response_text) or _JSON_OBJECT_RE.search(response_text)
+            if match is None:
+                raise ValueError("Не удалось извлечь JSON из ответа Claude")
+            result = _json_loads(match.group(1))
+        
+        # Добавление метаданных
+        result["metadata"] = {
+            "model": self.model,
+            "provider": self.provider,
+            "input_length": len(text),
+            "input_tokens": usage["input_tokens"],
+            "output_tokens": usage["output_tokens"],
+            "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0),
+            "total_elements": (
+                len(result.get("jobs", [])) +
+                len(result.get("pains", [])) +
+                len(result.get("gains", [])) +
+                len(result.get("context", [])) +
+                len(result.get("triggers", []))
+            )
+        }
+        
+        logger.info(
+            f"JTBD analysis completed: {result['metadata']['total_elements']} elements, "
+            f"{result['metadata']['input_tokens']} in / {result['metadata']['output_tokens']} out tokens"
+        )
+        
+        return result
     
     def _empty_result(self, error: str = "") -> Dict[str, Any]:
         """
@@ -422,25 +654,131 @@ class JTBDAnalyzer:
             }
         }
     
-    def analyze_batch(self, texts: List[str], max_tokens: int = 4000) -> List[Dict[str, Any]]:
+    def analyze_batch(
+        self,
+        texts: List[str],
+        max_tokens: int = 4000,
+        poll_interval: int = BATCH_API_POLL_INTERVAL,
+    ) -> List[Dict[str, Any]]:
         """
         Пакетный анализ нескольких транскрипций
         
+        Для Anthropic и пакетов от BATCH_API_MIN_TEXTS текстов используется
+        Message Batches API (одна задача, ~50% дешевле, результат — после
+        обработки всего пакета). Иначе — конкурентно, как analyze_batch_async(),
+        в отдельном event loop со своим async-клиентом; внутри уже работающего
+        loop (например, из сервиса) — последовательно через analyze().
+        
         Args:
             texts: список текстов для анализа
             max_tokens: максимальное количество токенов для каждого ответа
+            poll_interval: интервал опроса статуса batch-задачи (секунды)
             
         Returns:
             Список результатов JTBD анализа
         """
-        results = []
+        if self.provider == "anthropic" and len(texts) >= BATCH_API_MIN_TEXTS:
+            return self._analyze_batch_with_batches_api(texts, max_tokens, poll_interval)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._analyze_batch_with_own_client(texts, max_tokens))
+        # asyncio.run внутри работающего loop невозможен, а блокировать его
+        # ожиданием другого потока нельзя — синхронный клиент, по одному тексту
+        return [self.analyze(text, max_tokens=max_tokens) for text in texts]
+
+    async def _analyze_batch_with_own_client(self, texts: List[str], max_tokens: int) -> List[Dict[str, Any]]:
+        """analyze_batch_async() с async-клиентом, который живёт и закрывается в этом loop"""
+        client = self._new_async_client() if self._new_async_client is not None else None
+        try:
+            return await self._analyze_batch_async(texts, max_tokens, ANALYZE_BATCH_CONCURRENCY, client)
+        finally:
+            if client is not None:
+                await client.close()
+
+    def _analyze_batch_with_batches_api(
+        self,
+        texts: List[str],
+        max_tokens: int,
+        poll_interval: int,
+    ) -> List[Dict[str, Any]]:
+        """Анализ пакета через Anthropic Message Batches API"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        requests_payload = []
         
         for i, text in enumerate(texts):
-            logger.info(f"Analyzing text {i+1}/{len(texts)}")
-            result = self.analyze(text, max_tokens=max_tokens)
-            results.append(result)
+            if not text or not text.strip():
+                results[i] = self._empty_result("Пустой текст")
+                continue
+            requests_payload.append({
+                "custom_id": f"t{i}",
+                "params": self._anthropic_params(text, max_tokens),
+            })
+        
+        if requests_payload:
+            try:
+                batch = self.client.messages.batches.create(requests=requests_payload)
+                logger.info(f"JTBD batch {batch.id} submitted: {len(requests_payload)} texts")
+                
+                while batch.processing_status != "ended":
+                    time.sleep(poll_interval)
+                    batch = self.client.messages.batches.retrieve(batch.id)
+                
+                for entry in self.client.messages.batches.results(batch.id):
+                    index = int(entry.custom_id[1:])
+                    if entry.result.type != "succeeded":
+                        results[index] = self._empty_result(f"Ошибка анализа: batch {entry.result.type}")
+                        continue
+                    message = entry.result.message
+                    try:
+                        result_data = self._anthropic_result_data(message)
+                        results[index] = self._build_result(texts[index], result_data)
+                    except Exception as e:
+                        logger.error(f"JTBD analysis failed: {e}")
+                        results[index] = self._empty_result(f"Ошибка анализа: {str(e)}")
+            except Exception as e:
+                logger.error(f"JTBD batch analysis failed: {e}")
+                return [
+                    result or self._empty_result(f"Ошибка анализа: {str(e)}")
+                    for result in results
+                ]
+        
+        return [result or self._empty_result("Результат batch не получен") for result in results]
+
+    async def analyze_batch_async(
+        self,
+        texts: List[str],
+        max_tokens: int = 4000,
+        max_concurrency: int = ANALYZE_BATCH_CONCURRENCY,
+    ) -> List[Dict[str, Any]]:
+        """
+        Конкурентный пакетный анализ (не более max_concurrency запросов одновременно)
         
-        return results
+        Args:
+            texts: список текстов для анализа
+            max_tokens: максимальное количество токенов для каждого ответа
+            max_concurrency: ограничение числа одновременных запросов к API
+            
+        Returns:
+            Список результатов JTBD анализа в порядке texts
+        """
+        return await self._analyze_batch_async(texts, max_tokens, max_concurrency, self.async_client)
+
+    async def _analyze_batch_async(
+        self,
+        texts: List[str],
+        max_tokens: int,
+        max_concurrency: int,
+        client: Any,
+    ) -> List[Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def _guarded(index: int, text: str) -> Dict[str, Any]:
+            async with semaphore:
+                logger.info(f"Analyzing text {index + 1}/{len(texts)}")
+                return await self._analyze_async(text, max_tokens, client)
+
+        return list(await asyncio.gather(*(_guarded(i, text) for i, text in enumerate(texts))))
     
     def format_as_markdown(self, result: Dict[str, Any]) -> str:
         """
@@ -458,50 +796,17 @@ class JTBDAnalyzer:
         if result.get("summary"):
             md.append(f"## 📋 Summary\n\n{result['summary']}\n")
         
-        # Jobs
-        if result.get("jobs"):
-            md.append("## 🎯 Jobs (Работы)\n")
-            for job in result["jobs"]:
-                md.append(f"- **{job['text']}**")
-                if job.get("quote"):
-                    md.append(f"  > \"{job['quote']}\"")
-                md.append(f"  - Type: {job.get('type', 'N/A')}, Confidence: {job.get('confidence', 'N/A')}\n")
-        
-        # Pains
-        if result.get("pains"):
-            md.append("## 😰 Pains (Боли)\n")
-            for pain in result["pains"]:
-                md.append(f"- **{pain['text']}**")
-                if pain.get("quote"):
-                    md.append(f"  > \"{pain['quote']}\"")
-                md.append(f"  - Severity: {pain.get('severity', 'N/A')}, Confidence: {pain.get('confidence', 'N/A')}\n")
-        
-        # Gains
-        if result.get("gains"):
-            md.append("## 🎁 Gains (Выгоды)\n")
-            for gain in result["gains"]:
-                md.append(f"- **{gain['text']}**")
-                if gain.get("quote"):
-                    md.append(f"  > \"{gain['quote']}\"")
-                md.append(f"  - Type: {gain.get('type', 'N/A')}, Confidence: {gain.get('confidence', 'N/A')}\n")
-        
-        # Context
-        if result.get("context"):
-            md.append("## 🌍 Context (Контекст)\n")
-            for ctx in result["context"]:
-                md.append(f"- **{ctx['text']}**")
-                if ctx.get("quote"):
-                    md.append(f"  > \"{ctx['quote']}\"")
-                md.append(f"  - Dimension: {ctx.get('dimension', 'N/A')}, Confidence: {ctx.get('confidence', 'N/A')}\n")
-        
-        # Triggers
-        if result.get("triggers"):
-            md.append("## 🚀 Triggers (Триггеры)\n")
-            for trigger in result["triggers"]:
-                md.append(f"- **{trigger['text']}**")
-                if trigger.get("quote"):
-                    md.append(f"  > \"{trigger['quote']}\"")
-                md.append(f"  - Type: {trigger.get('type', 'N/A')}, Confidence: {trigger.get('confidence', 'N/A')}\n")
+        # Jobs / Pains / Gains / Context / Triggers — одна таблица, один цикл
+        for key, header, attribute, label in MARKDOWN_SECTIONS:
+            items = result.get(key)
+            if not items:
+                continue
+            md.append(header)
+            for item in items:
+                md.append(f"- **{item['text']}**")
+                if item.get("quote"):
+                    md.append(f"  > \"{item['quote']}\"")
+                md.append(f"  - {label}: {item.get(attribute, 'N/A')}, Confidence: {item.get('confidence', 'N/A')}\n")
         
         # Metadata
         if result.get("metadata"):
@@ -535,6 +840,9 @@ if __name__ == "__main__":
     result = analyzer.analyze(text)
     
     # Вывод
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if orjson is not None:
+        print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
     print("\n" + "="*80 + "\n")
     print(analyzer.format_as_markdown(result))
@@ -10,6 +10,7 @@ speaker diarization merge code.
 from __future__ import annotations
 
 import os
+import threading
 import time
 import uuid
 from dataclasses import dataclass
@@ -86,10 +87,18 @@ class LocalWhisperSTT:
     def __init__(self, settings: Optional[WhisperSettings] = None):
         self.settings = settings or WhisperSettings.from_env()
         self._model = None
+        self._model_lock = threading.Lock()
         self._operations: Dict[str, Dict] = {}
 
     @property
     def model(self):
+        if self._model is not None:
+            return self._model
+        # Concurrent first tasks must not load the model twice
+        with self._model_lock:
+            return self._load_model()
+
+    def _load_model(self):
         if self._model is None:
             try:
                 from faster_whisper import WhisperModel
@@ -111,6 +120,10 @@ class LocalWhisperSTT:
             self._model = WhisperModel(self.settings.model, **kwargs)
         return self._model
 
+    def warmup(self) -> None:
+        """Load the model ahead of the first request (download + init can take minutes)."""
+        self.model
+
     def transcribe_sync(
         self,
         audio_file: str,
@@ -11,8 +11,6 @@ import uuid
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import requests
-
 
 def _env(name: str, default: str) -> str:
     value = os.getenv(name, "").strip()
@@ -145,6 +143,9 @@ class OpusTranscriptionSTT:
 
         payload["timestamp_granularities[]"] = "word"
 
+        # Imported lazily: requests costs ~90 ms and only the remote call needs it.
+        import requests
+
         with open(audio_file, "rb") as audio_handle:
             files = {"file": (Path(audio_file).name, audio_handle)}
             response = requests.post(
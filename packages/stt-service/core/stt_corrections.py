@@ -3,11 +3,151 @@
 Post-processing для исправления частых ошибок транскрипции
 """
 
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import re
+import os
 import json
+import pickle
+import threading
 from pathlib import Path
 
+try:
+    import ahocorasick  # pyahocorasick — опционально, ускоряет поиск по словарю
+except ImportError:
+    ahocorasick = None
+
+try:
+    import orjson  # опционально, разбирает JSON быстрее stdlib
+except ImportError:
+    orjson = None
+
+
+# Символы, которые могут стоять вплотную к слову из словаря (кроме пробелов)
+WORD_PUNCTUATION = '.,!?;:'
+
+# Все границы слова (пробельные символы + пунктуация) → ' ', длина строки не меняется.
+# Regex, а не str.translate: translate ищет в таблице каждый не-ASCII символ
+# отдельно (на кириллице ~4.5 мс на 10 000 слов), а regex-движок проходит
+# строку в C и трогает только совпадения (сам пробел в класс не входит)
+_BOUNDARY_RE = re.compile('[' + re.escape(
+    WORD_PUNCTUATION + ''.join(chr(i) for i in range(0x3001) if chr(i).isspace() and chr(i) != ' ')
+) + ']')
+
+
+def _required_literal(pattern: str) -> Optional[str]:
+    """
+    Самая длинная подстрока, которая входит в любое совпадение паттерна
+    
+    Разбираются только простые паттерны: буквы, 'буква+', \\b, \\s* и \\s+,
+    а также lookahead/lookbehind без вложенных скобок и классов (нулевая ширина,
+    в совпадение ничего не добавляют). Для остальных возвращается None —
+    такой паттерн применяется всегда.
+    """
+    runs = []
+    run = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith(('\\s*', '\\s+'), i):
+            runs.append(run)
+            run = ''
+            i += 3
+            continue
+        if pattern.startswith('\\b', i):
+            runs.append(run)
+            run = ''
+            i += 2
+            continue
+        if pattern.startswith(('(?=', '(?!', '(?<=', '(?<!'), i):
+            # Проверка нулевой ширины: пропускаем до закрывающей скобки
+            i += 4 if pattern[i + 2] == '<' else 3
+            while i < len(pattern) and pattern[i] != ')':
+                if pattern[i] in '([':
+                    return None
+                i += 2 if pattern[i] == '\\' else 1
+            if i >= len(pattern):
+                return None
+            runs.append(run)
+            run = ''
+            i += 1
+            continue
+        
+        char = pattern[i]
+        if not (char.isalnum() or char in ' -'):
+            return None
+        quantifier = pattern[i + 1:i + 2]
+        if quantifier in ('*', '?', '{'):
+            return None
+        if quantifier == '+':
+            # "и+ришка": любое совпадение содержит "и" и "иришка", но не "ии"
+            runs.append(run + char)
+            run = char
+            i += 2
+            continue
+        run += char
+        i += 1
+    runs.append(run)
+    
+    literal = max(runs, key=len).casefold()
+    return literal or None
+
+
+def _read_corrections_file(path: Path) -> Dict[str, str]:
+    """
+    Прочитать JSON с исправлениями в плоский словарь
+    
+    Уже объединённый словарь сохраняется рядом в .pkl: следующие процессы
+    (короткие запуски transcribe.py) загружают его без разбора JSON.
+    Кеш считается устаревшим, если JSON изменён позже .pkl.
+    """
+    cache_path = path.with_suffix('.pkl')
+    try:
+        if cache_path.stat().st_mtime >= path.stat().st_mtime:
+            with open(cache_path, 'rb') as f:
+                flat = pickle.load(f)
+            if isinstance(flat, dict):
+                return flat
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass  # Нет кеша или он повреждён — разбираем JSON
+    
+    if orjson is not None:
+        data = orjson.loads(path.read_bytes())
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    
+    # Объединить все категории
+    flat = {}
+    for category, words in data.items():
+        if category.startswith('_'):  # Пропустить комментарии
+            continue
+        if isinstance(words, dict):
+            flat.update(words)
+    
+    # Запись через временный файл: параллельные процессы не прочитают недописанный кеш
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(flat, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # Каталог только для чтения — работаем без кеша
+    
+    return flat
+
+
+@lru_cache(maxsize=1)
+def _load_corrections_cached(path: str, mtime: float) -> Dict[str, str]:
+    """
+    Загрузить словарь исправлений из файла
+    
+    Кешируется по (path, mtime): повторные TranscriptionCorrector() не читают
+    файл заново, а изменённый файл перечитывается автоматически.
+    """
+    flat = _read_corrections_file(Path(path))
+    print(f"✅ Загружено {len(flat)} дополнительных исправлений из {Path(path).name}")
+    return flat
+
 
 class TranscriptionCorrector:
     """Исправляет частые ошибки в транскрипции"""
@@ -59,6 +199,40 @@ class TranscriptionCorrector:
             (r'\bл\s*м\s*с\b', 'LMS'),
             (r'\bа\s*п\s*и\b', 'API'),
         ]
+        
+        # Автомат словаря строится лениво и перестраивается при изменении набора
+        # ключей (и через add_*, и при прямой правке словаря)
+        self._matcher = None
+        self._matcher_keys: Optional[frozenset] = None
+        self._matcher_lock = threading.Lock()
+        self._version = 0
+        
+        # Фонетические паттерны компилируются один раз при создании
+        self._compiled_phonetic: List[Tuple[re.Pattern, str]] = []
+        self._phonetic_literals: List[Optional[str]] = []
+        self._phonetic_replacements: Dict[str, str] = {}
+        self._phonetic_regex_cache: Dict[Tuple[int, ...], re.Pattern] = {}
+        self._phonetic_fusable = True
+        self._phonetic_size = -1
+        self._compile_phonetic()
+    
+    def __copy__(self) -> "TranscriptionCorrector":
+        """
+        Дешёвая копия без повторной загрузки словаря и компиляции паттернов
+        
+        Словарь и списки паттернов копируются: add_* у копии не меняют оригинал.
+        Построенный автомат и скомпилированные regex неизменяемы и разделяются.
+        """
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.corrections = dict(self.corrections)
+        clone.phonetic_patterns = list(self.phonetic_patterns)
+        clone._compiled_phonetic = list(self._compiled_phonetic)
+        clone._phonetic_literals = list(self._phonetic_literals)
+        clone._phonetic_replacements = dict(self._phonetic_replacements)
+        clone._phonetic_regex_cache = dict(self._phonetic_regex_cache)
+        clone._matcher_lock = threading.Lock()
+        return clone
     
     def _load_ispring_corrections(self):
         """Загрузить дополнительные исправления из ispring_corrections.json"""
@@ -68,22 +242,150 @@ class TranscriptionCorrector:
             return
         
         try:
-            with open(corrections_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Объединить все категории
-            count = 0
-            for category, words in data.items():
-                if category.startswith('_'):  # Пропустить комментарии
-                    continue
-                if isinstance(words, dict):
-                    self.corrections.update(words)
-                    count += len(words)
-            
-            print(f"✅ Загружено {count} дополнительных исправлений из ispring_corrections.json")
+            self.corrections.update(
+                _load_corrections_cached(str(corrections_file), corrections_file.stat().st_mtime)
+            )
         except Exception as e:
             print(f"⚠️  Не удалось загрузить ispring_corrections.json: {e}")
     
+    def _build_matcher(self):
+        """Построить автомат поиска по ключам словаря (Aho–Corasick или regex)"""
+        keys = frozenset(self.corrections)
+        
+        if not keys:
+            self._matcher = None
+        elif ahocorasick is not None:
+            # Ключи обрамлены пробелами, а текст нормализуется так же, поэтому
+            # автомат находит только совпадения на границах слов — вхождения
+            # внутри слов ("апи" в "записи") не доходят до Python-кода
+            automaton = ahocorasick.Automaton()
+            for key in keys:
+                automaton.add_word(' ' + _BOUNDARY_RE.sub(' ', key) + ' ', (len(key), key))
+            automaton.make_automaton()
+            self._matcher = automaton
+        else:
+            # Fallback: одна alternation, длинные ключи первыми (leftmost-longest)
+            boundary = r'[^\s' + re.escape(WORD_PUNCTUATION) + ']'
+            alternation = '|'.join(re.escape(key) for key in sorted(keys, key=len, reverse=True))
+            self._matcher = re.compile(f'(?<!{boundary})(?:{alternation})(?!{boundary})')
+        
+        # Ключи выставляются последними: другие потоки не увидят недостроенный автомат
+        self._version += 1
+        self._matcher_keys = keys
+    
+    def _ensure_matcher(self):
+        """Перестроить автомат, если набор ключей словаря изменился"""
+        if self._matcher_keys != self.corrections.keys():
+            # Если автомат сейчас строит фоновый прогрев — дождаться его, а не строить второй
+            with self._matcher_lock:
+                if self._matcher_keys != self.corrections.keys():
+                    self._build_matcher()
+    
+    @property
+    def version(self) -> int:
+        """
+        Версия правил исправления
+        
+        Растёт при изменении набора ключей словаря и фонетических паттернов:
+        кеши поверх correct() сравнивают её, чтобы не отдавать устаревший текст.
+        Замена значения у существующего ключа версию не меняет — для неё
+        используйте add_correction().
+        """
+        self._ensure_matcher()
+        return self._version
+    
+    def _find_matches(self, low: str) -> List[Tuple[int, int, str]]:
+        """Найти непересекающиеся вхождения ключей словаря: [(start, end, key), ...]"""
+        self._ensure_matcher()
+        if self._matcher is None:
+            return []
+        
+        if ahocorasick is None:
+            return [(m.start(), m.end(), m.group()) for m in self._matcher.finditer(low)]
+        
+        # Индекс end_index указывает на замыкающий пробел в ' ' + текст + ' ',
+        # т.е. совпадение в исходном тексте заканчивается ровно на end_index - 1
+        padded = ' ' + _BOUNDARY_RE.sub(' ', low) + ' '
+        candidates = [
+            (end_index - 1 - key_length, end_index - 1, key)
+            for end_index, (key_length, key) in self._matcher.iter(padded)
+        ]
+        if len(candidates) < 2:
+            return candidates
+        
+        # Самое левое, при равенстве — самое длинное совпадение
+        candidates.sort(key=lambda match: (match[0], match[0] - match[1]))
+        matches = []
+        last_end = 0
+        for start, end, key in candidates:
+            if start >= last_end:
+                matches.append((start, end, key))
+                last_end = end
+        return matches
+    
+    def _compile_phonetic(self):
+        """Скомпилировать фонетические паттерны (по отдельности и общей alternation)"""
+        self._compiled_phonetic = [
+            (re.compile(pattern, re.IGNORECASE), replacement)
+            for pattern, replacement in self.phonetic_patterns
+        ]
+        self._build_phonetic_regex()
+    
+    def _build_phonetic_regex(self):
+        """Подготовить объединение паттернов в alternation (один проход по тексту)"""
+        self._phonetic_size = len(self._compiled_phonetic)
+        self._phonetic_literals = [_required_literal(regex.pattern) for regex, _ in self._compiled_phonetic]
+        self._phonetic_replacements = {
+            f'p{i}': replacement for i, (_, replacement) in enumerate(self._compiled_phonetic)
+        }
+        # Alternation строится под набор паттернов, которые могут совпасть в тексте
+        self._phonetic_regex_cache: Dict[Tuple[int, ...], re.Pattern] = {}
+        
+        # Паттерны с группами нельзя объединить без сдвига номеров backreference
+        self._phonetic_fusable = not any(regex.groups for regex, _ in self._compiled_phonetic)
+        self._version += 1
+    
+    def _phonetic_regex_for(self, active: Tuple[int, ...]) -> re.Pattern:
+        """Alternation из выбранных паттернов; имя группы p{i} — индекс паттерна"""
+        regex = self._phonetic_regex_cache.get(active)
+        if regex is None:
+            if len(self._phonetic_regex_cache) >= 64:
+                self._phonetic_regex_cache.clear()
+            regex = re.compile(
+                '|'.join(f'(?P<p{i}>{self._compiled_phonetic[i][0].pattern})' for i in active),
+                re.IGNORECASE,
+            )
+            self._phonetic_regex_cache[active] = regex
+        return regex
+    
+    def _apply_phonetic(self, text: str) -> str:
+        """Применить фонетические замены"""
+        if self._phonetic_size != len(self.phonetic_patterns):
+            # phonetic_patterns изменили напрямую, минуя add_phonetic_pattern()
+            self._compile_phonetic()
+        
+        # Префильтр: паттерн, обязательной подстроки которого нет в тексте,
+        # совпасть не может — его не нужно прогонять regex-движком
+        low = text.casefold()
+        active = tuple(
+            i for i, literal in enumerate(self._phonetic_literals)
+            if literal is None or literal in low
+        )
+        if not active:
+            return text
+        
+        if not self._phonetic_fusable:
+            for i in active:
+                regex, replacement = self._compiled_phonetic[i]
+                text = regex.sub(replacement, text)
+            return text
+        
+        def dispatch(match: re.Match) -> str:
+            replacement = self._phonetic_replacements[match.lastgroup]
+            return match.expand(replacement) if '\\' in replacement else replacement
+        
+        return self._phonetic_regex_for(active).sub(dispatch, text)
+    
     def correct(self, text: str, use_phonetic: bool = True) -> str:
         """
         Исправить текст
@@ -95,52 +397,130 @@ class TranscriptionCorrector:
         Returns:
             Исправленный текст
         """
-        result = text
+        # Простые замены (по словарю) — один проход автомата по casefold-тексту.
+        # Совпадения — смещения в исходной строке: текст между ними копируется
+        # как есть (\n\n между спикерами и исходные пробелы сохраняются).
+        low = text.casefold()
+        if len(low) != len(text):
+            # Редкие символы меняют длину при casefold() ('ß' → 'ss') — не сдвигаем смещения
+            low = ''.join(c.casefold() if len(c.casefold()) == 1 else c for c in text)
         
-        # Простые замены (по словарю)
-        # ВАЖНО: Сохраняем \n\n для разделения спикеров!
-        blocks = result.split('\n\n')
-        corrected_blocks = []
-        
-        for block in blocks:
-            words = block.split()
-            corrected_words = []
-            
-            for word in words:
-                # Убрать пунктуацию для сравнения
-                clean_word = word.lower().strip('.,!?;:')
-                
-                if clean_word in self.corrections:
-                    # Заменить, сохранив пунктуацию
-                    replacement = self.corrections[clean_word]
-                    # Добавить обратно пунктуацию если была
-                    suffix = word[len(clean_word):]
-                    corrected_words.append(replacement + suffix)
-                else:
-                    corrected_words.append(word)
-            
-            corrected_blocks.append(' '.join(corrected_words))
-        
-        result = '\n\n'.join(corrected_blocks)
+        parts = []
+        position = 0
+        for start, end, key in self._find_matches(low):
+            parts.append(text[position:start])
+            parts.append(self.corrections[key])
+            position = end
+        parts.append(text[position:])
+        result = ''.join(parts)
         
         # Фонетические замены (regex)
         if use_phonetic:
-            for pattern, replacement in self.phonetic_patterns:
-                result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
+            result = self._apply_phonetic(result)
         
         return result
     
+    def warmup(self):
+        """Заранее построить автомат словаря и прогнать regex-проходы"""
+        self.correct("разминка иишка API")
+    
     def add_correction(self, wrong: str, correct: str):
         """Добавить новую замену"""
-        self.corrections[wrong.lower()] = correct
+        self.corrections[wrong.casefold()] = correct
+        self._version += 1
+    
+    def add_corrections(self, mapping: Dict[str, str]):
+        """Добавить много замен сразу (автомат перестроится один раз при следующем correct())"""
+        self.corrections.update((wrong.casefold(), correct) for wrong, correct in mapping.items())
+        self._version += 1
     
     def add_phonetic_pattern(self, pattern: str, replacement: str):
         """Добавить фонетический паттерн"""
         self.phonetic_patterns.append((pattern, replacement))
+        self._compiled_phonetic.append((re.compile(pattern, re.IGNORECASE), replacement))
+        self._build_phonetic_regex()
 
 
 # Глобальный корректор (можно использовать везде)
 corrector = TranscriptionCorrector()
+_default_corrector = corrector  # внутри StreamingCorrector имя corrector занято параметром
+
+
+class StreamingCorrector:
+    """
+    Исправление текста, который приходит частями (сегменты STT)
+    
+    feed() возвращает исправленный префикс накопленного текста, а хвост
+    (не короче окна: holdback и самый длинный ключ) придерживает до следующей
+    части: так многословные ключи и паттерны на стыке частей тоже
+    исправляются. Между частями переносится только этот хвост; безопасность
+    разреза проверяется по окну вокруг него, а не по всему буферу. Каждый
+    символ потока исправляется один раз (плюс хвост на каждой части), поэтому
+    работа линейна по длине потока.
+    
+    Склейка всех feed() + flush() совпадает с correct() всего текста, если
+    совпадения не длиннее holdback символов.
+    """
+    
+    def __init__(
+        self,
+        corrector: Optional[TranscriptionCorrector] = None,
+        use_phonetic: bool = True,
+        holdback: int = 64,
+    ):
+        self.corrector = corrector or _default_corrector
+        self.use_phonetic = use_phonetic
+        self.holdback = holdback
+        self._buffer = ''
+        self._longest_key = 0
+        self._corrector_version = -1
+    
+    def _correct(self, text: str) -> str:
+        return self.corrector.correct(text, use_phonetic=self.use_phonetic)
+    
+    def feed(self, chunk: str) -> str:
+        """Добавить часть текста, вернуть готовую исправленную часть (может быть пустой)"""
+        self._buffer += chunk
+        
+        # Ключ словаря, начавшийся до точки разреза, должен целиком помещаться в буфер
+        if self._corrector_version != self.corrector.version:
+            self._corrector_version = self.corrector.version
+            self._longest_key = max(map(len, self.corrector.corrections), default=0)
+        window = max(self.holdback, self._longest_key + 1)
+        limit = len(self._buffer) - window
+        if limit <= 0:
+            return ''
+        
+        # Пробелы левее уже проверялись на прошлых частях: ищем только среди новых
+        lowest = max(0, limit - len(chunk) - window)
+        for _ in range(3):
+            # Резать после пробельного символа, чтобы хвост начинался со слова
+            cut = self._space_before(lowest, limit) + 1
+            if cut <= 0:
+                return ''
+            # Разрез безопасен, если ни одно совпадение его не пересекает. Совпадения
+            # не длиннее окна, поэтому достаточно окна до и после разреза
+            # (окно по возможности тоже начинается со слова)
+            start = max(0, cut - 2 * window)
+            start = max(start, self._space_before(start, cut - window) + 1)
+            end = cut + window
+            if self._correct(self._buffer[start:cut]) + self._correct(self._buffer[cut:end]) == \
+                    self._correct(self._buffer[start:end]):
+                head, self._buffer = self._buffer[:cut], self._buffer[cut:]
+                return self._correct(head)
+            limit = cut - 1
+        return ''
+    
+    def _space_before(self, lowest: int, limit: int) -> int:
+        """Последний пробел или перевод строки в буфере[lowest:limit] (-1, если нет)"""
+        if limit <= lowest:
+            return -1
+        return max(self._buffer.rfind(' ', lowest, limit), self._buffer.rfind('\n', lowest, limit))
+    
+    def flush(self) -> str:
+        """Вернуть исправленный остаток буфера (в конце потока)"""
+        tail, self._buffer = self._buffer, ''
+        return self._correct(tail) if tail else ''
 
 
 def correct_transcription(text: str) -> str:
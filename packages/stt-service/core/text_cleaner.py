@@ -3,13 +3,15 @@
 Полный пайплайн улучшения качества транскрипции
 """
 
+from typing import Optional
+
 try:
     from .filler_words_filter import FillerWordsFilter
-    from .stt_corrections import TranscriptionCorrector
+    from .stt_corrections import TranscriptionCorrector, corrector as default_corrector
 except ImportError:
     # Fallback для прямого запуска
     from filler_words_filter import FillerWordsFilter
-    from stt_corrections import TranscriptionCorrector
+    from stt_corrections import TranscriptionCorrector, corrector as default_corrector
 
 
 class TranscriptionCleaner:
@@ -22,9 +24,15 @@ class TranscriptionCleaner:
     3. Исправление артефактов транскрипции (иишка → ИИшка)
     """
     
-    def __init__(self):
+    def __init__(self, corrector: Optional[TranscriptionCorrector] = None):
+        """
+        Args:
+            corrector: Корректор артефактов. По умолчанию — общий экземпляр из
+                stt_corrections (словарь не загружается повторно); передайте
+                свой, если нужны изолированные add_custom_correction().
+        """
         self.filler_filter = FillerWordsFilter()
-        self.corrector = TranscriptionCorrector()
+        self.corrector = corrector or default_corrector
     
     def clean(
         self, 
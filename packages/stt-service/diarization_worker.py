@@ -0,0 +1,60 @@
+"""
+Диаризация в отдельных процессах
+
+Resemblyzer и pyannote (NumPy/PyTorch + чистый Python) держат GIL большую
+часть времени: в потоке они тормозят event loop FastAPI и не дают двум
+диаризациям идти параллельно. Функции этого модуля выполняются в
+ProcessPoolExecutor: модель загружается один раз на процесс (initializer),
+а в каждую задачу передаётся только путь к файлу.
+
+Модуль намеренно лёгкий — spawn-процесс импортирует только его,
+а не app.py.
+"""
+
+import logging
+from pathlib import Path
+from typing import List, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Диаризатор текущего процесса пула (создаётся в init_worker)
+_diarizer = None
+
+
+def init_worker(backend: str, embed_cache_dir: Optional[Path] = None) -> None:
+    """
+    Initializer процесса пула: создать диаризатор и заранее загрузить модель
+    
+    embed_cache_dir — кеш embeddings окон для Resemblyzer (pyannote его не использует).
+
+    Ошибка загрузки не роняет процесс (иначе весь пул станет неработоспособным):
+    модель попробует загрузиться ещё раз при первом diarize(), и ошибка
+    вернётся вызывающему как обычное исключение.
+    """
+    global _diarizer
+
+    if backend == "pyannote":
+        from speaker_diarization_pyannote import SpeakerDiarizationPyannote
+        _diarizer = SpeakerDiarizationPyannote()
+        warmup = _diarizer._init_pipeline
+    else:
+        from speaker_diarization_resemblyzer import SpeakerDiarizationResemblyzer
+        _diarizer = SpeakerDiarizationResemblyzer(cache_dir=embed_cache_dir)
+        warmup = _diarizer._init_encoder
+
+    try:
+        warmup()
+    except Exception as e:
+        logger.warning(f"Diarization worker warmup failed ({backend}): {e}")
+
+
+def diarize_file(audio_file: str, num_speakers: Optional[int] = None) -> List[Dict]:
+    """Диаризация файла диаризатором текущего процесса"""
+    if _diarizer is None:
+        raise RuntimeError("Diarization worker is not initialized")
+    return _diarizer.diarize(audio_file, num_speakers=num_speakers)
+
+
+def ping() -> bool:
+    """Пустая задача: заставляет пул поднять процесс (и загрузить модель) заранее"""
+    return _diarizer is not None
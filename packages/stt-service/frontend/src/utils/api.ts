@@ -6,16 +6,19 @@ export const uploadFile = async (
   jtbdAnalysis: boolean,
   qualityMode: 'fast' | 'quality' = 'quality'
 ): Promise<string> => {
-  const formData = new FormData();
-  formData.append('file', file);
-  formData.append('speaker_labeling', speakerLabeling.toString());
-  formData.append('analyze_jtbd', jtbdAnalysis.toString());
-  formData.append('jtbd_analysis', jtbdAnalysis.toString());
-  formData.append('quality_mode', qualityMode);
-
-  const response = await fetch('/transcribe', {
+  // Файл уходит телом запроса как есть: сервер пишет его на диск по мере
+  // поступления, без разбора multipart
+  const params = new URLSearchParams({
+    filename: file.name,
+    speaker_labeling: speakerLabeling.toString(),
+    analyze_jtbd: jtbdAnalysis.toString(),
+    quality_mode: qualityMode,
+  });
+
+  const response = await fetch(`/upload-stream?${params}`, {
     method: 'POST',
-    body: formData,
+    headers: { 'Content-Type': file.type || 'application/octet-stream' },
+    body: file,
   });
 
   if (!response.ok) {
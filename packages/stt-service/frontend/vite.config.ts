@@ -8,6 +8,7 @@ export default defineConfig({
     port: 5173,
     proxy: {
       '/transcribe': 'http://localhost:8000',
+      '/upload-stream': 'http://localhost:8000',
       '/status': 'http://localhost:8000',
       '/result': 'http://localhost:8000',
       '/history': 'http://localhost:8000',
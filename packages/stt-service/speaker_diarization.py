@@ -7,6 +7,7 @@ Speaker Diarization с использованием pyannote.audio
 
 import os
 import logging
+from itertools import groupby
 from typing import List, Dict, Optional
 from pathlib import Path
 
@@ -108,14 +109,12 @@ def merge_transcription_with_speakers(
     
     def parse_time(time_str: str) -> float:
         """Конвертирует '1.540s' -> 1.54"""
-        return float(time_str.rstrip('s'))
+        return float(time_str[:-1] if time_str.endswith('s') else time_str)
     
     # Добавляем speaker к каждому слову
     result = []
     
     for word in words:
-        word_copy = word.copy()
-        
         # Берём среднее время слова
         start_time = parse_time(word.get("startTime", "0s"))
         end_time = parse_time(word.get("endTime", "0s"))
@@ -140,8 +139,7 @@ def merge_transcription_with_speakers(
             )
             speaker = closest["speaker"]
         
-        word_copy["speaker"] = speaker or "UNKNOWN"
-        result.append(word_copy)
+        result.append({**word, "speaker": speaker or "UNKNOWN"})
     
     return result
 
@@ -159,27 +157,11 @@ def format_with_speakers(words: List[Dict]) -> str:
     if not words:
         return ""
     
-    lines = []
-    current_speaker = None
-    current_line = []
-    
-    for word in words:
-        speaker = word.get("speaker", "UNKNOWN")
-        word_text = word.get("word", "")
-        
-        if speaker != current_speaker:
-            # Новый спикер - сохраняем предыдущую строку
-            if current_line:
-                lines.append(f"{current_speaker}: {' '.join(current_line)}")
-            
-            current_speaker = speaker
-            current_line = [word_text]
-        else:
-            current_line.append(word_text)
-    
-    # Последняя строка
-    if current_line:
-        lines.append(f"{current_speaker}: {' '.join(current_line)}")
+    # Соседние слова одного спикера — одна реплика
+    lines = [
+        f"{speaker}: {' '.join(word.get('word', '') for word in run)}"
+        for speaker, run in groupby(words, key=lambda word: word.get("speaker", "UNKNOWN"))
+    ]
     
     return "\n".join(lines)
 
@@ -6,22 +6,116 @@ Speaker Diarization с использованием Resemblyzer
 """
 
 import os
+import hashlib
 import logging
+import zipfile
+from contextlib import nullcontext
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 
+# Сопоставление слов со спикерами — общее для обоих диаризаторов
+from speaker_merge import merge_transcription_with_speakers, format_with_speakers  # noqa: F401
+
 logger = logging.getLogger(__name__)
 
+# Encoder на GPU в fp16 (autocast); на CPU не влияет
+RESEMBLYZER_FP16 = os.getenv("RESEMBLYZER_FP16", "true").lower() == "true"
+
+
+# Кластеризация embeddings: "kmeans" (O(n·k) памяти и времени) или "agglomerative"
+# (cosine/average, O(n²) — матрица расстояний всех окон)
+RESEMBLYZER_CLUSTERING = os.getenv("RESEMBLYZER_CLUSTERING", "kmeans").lower()
+# С этого числа окон (~1.5 часа при шаге 1 с) — MiniBatchKMeans
+_MINIBATCH_KMEANS_FROM = 5000
+
+# Окон в одном прогоне encoder
+EMBED_BATCH_WINDOWS = 256
+
+# Частота дискретизации encoder и размер блока чтения (кадров исходного файла)
+SAMPLE_RATE = 16000
+_LOAD_BLOCK_FRAMES = 1 << 16
+
+
+def load_audio_16k(audio_file: str) -> np.ndarray:
+    """
+    Аудио файла: моно float32, 16 кГц
+    
+    Файл читается блоками (soundfile) и ресемплируется потоково (soxr, то же
+    качество, что у librosa.load по умолчанию) сразу в итоговый буфер — в
+    памяти нет полной записи на исходной частоте. Форматы, которые libsndfile
+    не читает, загружаются через librosa.load.
+    """
+    import soundfile as sf
+    import soxr
+    
+    try:
+        f = sf.SoundFile(audio_file)
+    except RuntimeError:
+        import librosa
+        wav, _ = librosa.load(audio_file, sr=SAMPLE_RATE, mono=True)
+        return wav
+    
+    with f:
+        stream = soxr.ResampleStream(f.samplerate, SAMPLE_RATE, 1, dtype='float32')
+        
+        def resampled_chunks():
+            for block in f.blocks(blocksize=_LOAD_BLOCK_FRAMES, dtype='float32', always_2d=True):
+                yield stream.resample_chunk(block.mean(axis=1))
+            yield stream.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+        
+        wav = np.empty(int(f.frames * SAMPLE_RATE / f.samplerate) + 1, dtype=np.float32)
+        position = 0
+        for chunk in resampled_chunks():
+            if position + len(chunk) > len(wav):
+                wav = np.resize(wav, position + len(chunk))
+            wav[position:position + len(chunk)] = chunk
+            position += len(chunk)
+    return wav[:position]
+
+
+def cluster_embeddings(embeddings: np.ndarray, num_speakers: int, algorithm: str = "kmeans") -> np.ndarray:
+    """
+    Метки кластеров (спикеров) для embeddings окон
+    
+    На L2-нормированных векторах евклидово расстояние монотонно косинусному,
+    поэтому KMeans группирует так же по косинусной близости, но без матрицы
+    n×n, которую строит AgglomerativeClustering.
+    """
+    # float32, как на выходе encoder: без копии, и вдвое меньше данных, чем в float64
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if algorithm == "agglomerative":
+        from sklearn.cluster import AgglomerativeClustering
+        return AgglomerativeClustering(
+            n_clusters=num_speakers,
+            metric='cosine',
+            linkage='average'
+        ).fit_predict(embeddings)
+    
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    normalized = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-9)
+    if len(normalized) >= _MINIBATCH_KMEANS_FROM:
+        model = MiniBatchKMeans(n_clusters=num_speakers, batch_size=256, n_init=4, random_state=0)
+    else:
+        model = KMeans(n_clusters=num_speakers, n_init=4, random_state=0)
+    return model.fit_predict(normalized)
+
 
 class SpeakerDiarizationResemblyzer:
     """
     Определение спикеров в аудио файле с помощью Resemblyzer
     """
     
-    def __init__(self):
-        """Инициализация"""
+    def __init__(self, cache_dir: Optional[Path] = None):
+        """
+        Инициализация
+        
+        Args:
+            cache_dir: Каталог кеша embeddings окон (None — без кеша)
+        """
         self.encoder = None
+        self.cache_dir = cache_dir
+        self._autocast = nullcontext
         
     def _init_encoder(self):
         """Ленивая инициализация encoder (только когда нужно)"""
@@ -30,20 +124,99 @@ class SpeakerDiarizationResemblyzer:
         
         try:
             from resemblyzer import VoiceEncoder
+            import torch
             
-            logger.info("Загружаю Resemblyzer voice encoder...")
-            self.encoder = VoiceEncoder()
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            logger.info(f"Загружаю Resemblyzer voice encoder ({device})...")
+            self.encoder = VoiceEncoder(device=device)
+            # Вход encoder — fp32 mel-спектрограммы из numpy, поэтому autocast, а не .half()
+            if device == "cuda" and RESEMBLYZER_FP16:
+                self._autocast = lambda: torch.autocast("cuda", dtype=torch.float16)
             logger.info("✅ Encoder загружен успешно")
             
         except Exception as e:
             logger.error(f"Ошибка инициализации Resemblyzer: {e}")
             raise
     
+    def _embed_windows(
+        self, audio_file: str, min_segment_duration: float
+    ) -> Tuple[Optional[np.ndarray], List[float], float]:
+        """
+        Embeddings окон аудио: (embeddings, начала окон в секундах, длительность)
+        
+        Для аудио короче двух сегментов embeddings = None.
+        """
+        wav, sr = load_audio_16k(audio_file), SAMPLE_RATE
+        duration = len(wav) / sr
+        logger.info(f"Аудио загружено: {duration:.2f} сек, {sr} Hz")
+        
+        # Разбиваем на сегменты по min_segment_duration
+        if len(wav) // int(min_segment_duration * sr) < 2:
+            return None, [], duration
+        
+        # Окна по 1.6 с с шагом min_segment_duration, как в embed_utterance(return_partials=True):
+        # mel-спектрограмма считается один раз на всё аудио, а окна идут в encoder
+        # пачками по EMBED_BATCH_WINDOWS — один прогон на пачку, а не на сегмент, и
+        # без тензора всех окон сразу (на часовой записи это сотни МБ активаций LSTM).
+        # preprocess_wav не используем: он вырезает тишину и сдвигает таймкоды
+        import torch
+        from resemblyzer.audio import wav_to_mel_spectrogram
+        
+        wav_slices, mel_slices = self.encoder.compute_partial_slices(
+            len(wav), rate=1.0 / min_segment_duration, min_coverage=0.75
+        )
+        if wav_slices[-1].stop >= len(wav):
+            wav = np.pad(wav, (0, wav_slices[-1].stop - len(wav)), "constant")
+        mel = wav_to_mel_spectrogram(wav)
+        
+        batches = []
+        with torch.no_grad(), self._autocast():
+            for lo in range(0, len(mel_slices), EMBED_BATCH_WINDOWS):
+                mels = np.stack([mel[mel_slice] for mel_slice in mel_slices[lo:lo + EMBED_BATCH_WINDOWS]])
+                batch = self.encoder(torch.from_numpy(mels).to(self.encoder.device))
+                batches.append(batch.float().cpu().numpy())
+        return np.concatenate(batches), [wav_slice.start / sr for wav_slice in wav_slices], duration
+    
+    def _embed_windows_cached(
+        self, audio_file: str, min_segment_duration: float
+    ) -> Tuple[Optional[np.ndarray], List[float], float]:
+        """
+        _embed_windows с кешем на диске по содержимому аудио
+        
+        Повторная диаризация того же файла (ретрай, другое число спикеров)
+        не декодирует аудио и не прогоняет encoder — только кластеризация.
+        """
+        if self.cache_dir is None:
+            return self._embed_windows(audio_file, min_segment_duration)
+        
+        with open(audio_file, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        cache_path = self.cache_dir / f"{digest}_{min_segment_duration}.npz"
+        try:
+            with np.load(cache_path) as cached:
+                return cached["embeddings"], cached["starts"].tolist(), float(cached["duration"])
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass  # Нет записи или она повреждена — считаем заново
+        
+        embeddings, starts, duration = self._embed_windows(audio_file, min_segment_duration)
+        if embeddings is not None:
+            # Через временный файл: параллельный процесс не прочитает недописанную запись
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, embeddings=embeddings, starts=np.asarray(starts), duration=duration)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                logger.warning(f"Failed to write embeddings cache {cache_path.name}: {e}")
+                tmp_path.unlink(missing_ok=True)
+        return embeddings, starts, duration
+    
     def diarize(
         self, 
         audio_file: str, 
         num_speakers: Optional[int] = None,
-        min_segment_duration: float = 1.0
+        min_segment_duration: float = 1.0,
+        clustering: Optional[str] = None
     ) -> List[Dict]:
         """
         Определяет спикеров в аудио файле
@@ -52,6 +225,8 @@ class SpeakerDiarizationResemblyzer:
             audio_file: Путь к аудио файлу
             num_speakers: Ожидаемое количество спикеров (если None - автоопределение)
             min_segment_duration: Минимальная длительность сегмента в секундах
+                                  (шаг окон encoder, не больше длины окна 1.6 с)
+            clustering: "kmeans" или "agglomerative" (None — RESEMBLYZER_CLUSTERING)
         
         Returns:
             Список сегментов: [{"speaker": "SPEAKER_00", "start": 1.5, "end": 5.3}, ...]
@@ -61,47 +236,19 @@ class SpeakerDiarizationResemblyzer:
         logger.info(f"Начинаю диаризацию: {audio_file}")
         
         try:
-            from resemblyzer import preprocess_wav
-            import librosa
-            from sklearn.cluster import AgglomerativeClustering
+            embeddings, starts, duration = self._embed_windows_cached(audio_file, min_segment_duration)
             
-            # Загружаем аудио
-            wav, sr = librosa.load(audio_file, sr=16000, mono=True)
-            logger.info(f"Аудио загружено: {len(wav)/sr:.2f} сек, {sr} Hz")
-            
-            # Разбиваем на сегменты по min_segment_duration
-            segment_samples = int(min_segment_duration * sr)
-            n_segments = len(wav) // segment_samples
-            
-            if n_segments < 2:
-                logger.warning(f"Аудио слишком короткое ({len(wav)/sr:.2f}s), создаю 1 спикера")
+            if embeddings is None:
+                logger.warning(f"Аудио слишком короткое ({duration:.2f}s), создаю 1 спикера")
                 return [{
                     "speaker": "SPEAKER_00",
                     "start": 0.0,
-                    "end": len(wav) / sr
+                    "end": duration
                 }]
             
-            # Создаём embeddings для каждого сегмента
-            embeddings = []
-            segment_times = []
+            # Сегмент окна — от его начала до начала следующего (сетка без перекрытий)
+            segment_times = list(zip(starts, starts[1:] + [duration]))
             
-            for i in range(n_segments):
-                start_sample = i * segment_samples
-                end_sample = min((i + 1) * segment_samples, len(wav))
-                segment = wav[start_sample:end_sample]
-                
-                if len(segment) < sr * 0.5:  # Пропускаем слишком короткие
-                    continue
-                
-                # Получаем embedding
-                embedding = self.encoder.embed_utterance(segment)
-                embeddings.append(embedding)
-                
-                start_time = start_sample / sr
-                end_time = end_sample / sr
-                segment_times.append((start_time, end_time))
-            
-            embeddings = np.array(embeddings)
             logger.info(f"Создано {len(embeddings)} embeddings")
             
             # Определяем количество спикеров если не задано
@@ -117,42 +264,26 @@ class SpeakerDiarizationResemblyzer:
             if num_speakers == 1:
                 labels = np.zeros(len(embeddings), dtype=int)
             else:
-                clustering = AgglomerativeClustering(
-                    n_clusters=num_speakers,
-                    metric='cosine',
-                    linkage='average'
-                )
-                labels = clustering.fit_predict(embeddings)
-            
-            # Формируем результат
-            segments = []
-            current_speaker = labels[0]
-            current_start = segment_times[0][0]
+                labels = cluster_embeddings(embeddings, num_speakers, clustering or RESEMBLYZER_CLUSTERING)
             
-            for i in range(len(labels)):
-                speaker = labels[i]
-                start, end = segment_times[i]
-                
-                if speaker != current_speaker:
-                    # Закрываем предыдущий сегмент
-                    segments.append({
-                        "speaker": f"SPEAKER_{current_speaker:02d}",
-                        "start": current_start,
-                        "end": segment_times[i-1][1]
-                    })
-                    
-                    # Начинаем новый сегмент
-                    current_speaker = speaker
-                    current_start = start
+            # Формируем результат: одна строка-метка на спикера, общая для всех его сегментов
+            labels = np.asarray(labels)
+            speaker_names = [f"SPEAKER_{k:02d}" for k in range(int(labels.max()) + 1)]
             
-            # Последний сегмент
-            segments.append({
-                "speaker": f"SPEAKER_{current_speaker:02d}",
-                "start": current_start,
-                "end": segment_times[-1][1]
-            })
+            # Границы сегментов — окна, где метка меняется (один проход NumPy вместо цикла)
+            boundaries = (np.flatnonzero(np.diff(labels)) + 1).tolist()
+            firsts = [0] + boundaries
+            lasts = [b - 1 for b in boundaries] + [len(labels) - 1]
+            segments = [
+                {
+                    "speaker": speaker_names[labels[first]],
+                    "start": segment_times[first][0],
+                    "end": segment_times[last][1],
+                }
+                for first, last in zip(firsts, lasts)
+            ]
             
-            logger.info(f"✅ Найдено {len(set(labels))} спикеров, "
+            logger.info(f"✅ Найдено {len(np.unique(labels))} спикеров, "
                        f"{len(segments)} сегментов")
             
             return segments
@@ -164,101 +295,6 @@ class SpeakerDiarizationResemblyzer:
             raise
 
 
-def merge_transcription_with_speakers(
-    words: List[Dict],
-    speaker_segments: List[Dict]
-) -> List[Dict]:
-    """
-    Объединяет транскрипцию от Yandex с диаризацией от Resemblyzer
-    
-    Args:
-        words: Слова от Yandex: [{"word": "текст", "startTime": "1.5s", ...}, ...]
-        speaker_segments: Сегменты от Resemblyzer: [{"speaker": "SPEAKER_00", "start": 1.5, "end": 5.3}, ...]
-    
-    Returns:
-        Слова с добавленным полем speaker: [{"word": "текст", "speaker": "SPEAKER_00", ...}, ...]
-    """
-    
-    def parse_time(time_str: str) -> float:
-        """Конвертирует '1.540s' -> 1.54"""
-        if isinstance(time_str, (int, float)):
-            return float(time_str)
-        return float(str(time_str).rstrip('s'))
-    
-    # Добавляем speaker к каждому слову
-    result = []
-    
-    for word in words:
-        word_copy = word.copy()
-        
-        # Берём среднее время слова
-        start_time = parse_time(word.get("startTime", "0s"))
-        end_time = parse_time(word.get("endTime", "0s"))
-        word_mid_time = (start_time + end_time) / 2
-        
-        # Ищем какой спикер говорил в это время
-        speaker = None
-        for segment in speaker_segments:
-            if segment["start"] <= word_mid_time <= segment["end"]:
-                speaker = segment["speaker"]
-                break
-        
-        # Если не нашли - берём ближайший сегмент
-        if speaker is None and speaker_segments:
-            # Находим ближайший по времени
-            closest = min(
-                speaker_segments,
-                key=lambda s: min(
-                    abs(s["start"] - word_mid_time),
-                    abs(s["end"] - word_mid_time)
-                )
-            )
-            speaker = closest["speaker"]
-        
-        word_copy["speaker"] = speaker or "UNKNOWN"
-        result.append(word_copy)
-    
-    return result
-
-
-def format_with_speakers(words: List[Dict]) -> str:
-    """
-    Форматирует текст с разделением по спикерам
-    
-    Args:
-        words: Слова с полем speaker
-    
-    Returns:
-        Отформатированный текст с разделением спикеров
-    """
-    if not words:
-        return ""
-    
-    lines = []
-    current_speaker = None
-    current_line = []
-    
-    for word in words:
-        speaker = word.get("speaker", "UNKNOWN")
-        word_text = word.get("word", "")
-        
-        if speaker != current_speaker:
-            # Новый спикер - сохраняем предыдущую строку
-            if current_line:
-                lines.append(f"{current_speaker}: {' '.join(current_line)}")
-            
-            current_speaker = speaker
-            current_line = [word_text]
-        else:
-            current_line.append(word_text)
-    
-    # Последняя строка
-    if current_line:
-        lines.append(f"{current_speaker}: {' '.join(current_line)}")
-    
-    return "\n\n".join(lines)
-
-
 # Для тестирования
 if __name__ == "__main__":
     diarizer = SpeakerDiarizationResemblyzer()
@@ -0,0 +1,235 @@
+"""
+Сопоставление слов транскрипции с сегментами спикеров
+
+Общее для обоих диаризаторов (pyannote и Resemblyzer): слово получает
+спикера сегмента, в который попадает его середина, иначе — ближайшего.
+"""
+
+import io
+from bisect import bisect_left
+from typing import List, Dict, Optional
+
+try:
+    import numpy as np  # без NumPy (лёгкие окружения) — перебор сегментов на Python
+except ImportError:
+    np = None
+
+try:
+    from numba import njit  # опционально (ставится вместе с librosa): нативный цикл сопоставления
+except ImportError:
+    njit = None
+
+
+# Ограничение на размер матрицы "слова × сегменты" в одном блоке (элементов)
+_MERGE_BLOCK_ELEMENTS = 1 << 20
+
+
+def _segment_indices_numpy(mids: List[float], starts: List[float], ends: List[float]) -> List[int]:
+    """
+    Индекс сегмента для каждого слова: первый содержащий середину слова, иначе ближайший
+    
+    То же, что перебор сегментов в merge_transcription_with_speakers, но
+    сравнения "все слова × все сегменты" выполняются в NumPy блоками
+    (argmax/argmin, как и min(), при равенстве берут первый сегмент).
+    """
+    starts_arr = np.asarray(starts, dtype=np.float64)
+    ends_arr = np.asarray(ends, dtype=np.float64)
+    mids_arr = np.asarray(mids, dtype=np.float64)
+    block = max(1, _MERGE_BLOCK_ELEMENTS // len(starts_arr))
+    
+    indices = np.empty(len(mids_arr), dtype=np.intp)
+    for lo in range(0, len(mids_arr), block):
+        mid = mids_arr[lo:lo + block, None]
+        inside = (starts_arr <= mid) & (mid <= ends_arr)
+        found = inside.argmax(axis=1)
+        # Расстояния считаем только для слов вне всех сегментов
+        outside = ~inside[np.arange(len(mid)), found]
+        if outside.any():
+            gap_mid = mid[outside]
+            distance = np.minimum(np.abs(starts_arr - gap_mid), np.abs(ends_arr - gap_mid))
+            found[outside] = distance.argmin(axis=1)
+        indices[lo:lo + block] = found
+    return indices.tolist()
+
+
+def _nearest_segment_loop(mids, starts, ends, indices) -> None:
+    """
+    То же, что _segment_indices_numpy, обычными циклами — для компиляции numba
+    
+    Для каждого слова — первый содержащий сегмент (с выходом из цикла сразу),
+    иначе ближайший; при равенстве расстояний — первый, как у min().
+    """
+    for i in range(mids.size):
+        mid = mids[i]
+        found = -1
+        best = 0
+        best_distance = np.inf
+        for j in range(starts.size):
+            if starts[j] <= mid <= ends[j]:
+                found = j
+                break
+            distance = min(abs(starts[j] - mid), abs(ends[j] - mid))
+            if distance < best_distance:
+                best_distance = distance
+                best = j
+        indices[i] = found if found >= 0 else best
+
+
+_nearest_segment_jit = njit(cache=True)(_nearest_segment_loop) if njit is not None and np is not None else None
+
+
+def _segment_indices_numba(mids: List[float], starts: List[float], ends: List[float]) -> List[int]:
+    """_segment_indices_numpy без матриц "слова × сегменты": скомпилированный numba цикл"""
+    indices = np.empty(len(mids), dtype=np.int64)
+    _nearest_segment_jit(
+        np.asarray(mids, dtype=np.float64),
+        np.asarray(starts, dtype=np.float64),
+        np.asarray(ends, dtype=np.float64),
+        indices,
+    )
+    return indices.tolist()
+
+
+# Перебор сегментов для всех слов сразу: numba, иначе NumPy, иначе None (поштучно в Python)
+if _nearest_segment_jit is not None:
+    _segment_indices = _segment_indices_numba
+elif np is not None:
+    _segment_indices = _segment_indices_numpy
+else:
+    _segment_indices = None
+
+
+def warmup() -> None:
+    """
+    Скомпилировать numba цикл заранее (при старте сервиса), а не на первом merge
+    
+    С cache=True компиляция нужна один раз на образ, дальше — загрузка из кеша.
+    """
+    if _nearest_segment_jit is not None:
+        _segment_indices_numba([0.0], [0.0], [1.0])
+
+
+def _parse_time(time_str: str) -> float:
+    """Конвертирует '1.540s' -> 1.54"""
+    if isinstance(time_str, str):
+        return float(time_str[:-1] if time_str.endswith('s') else time_str)
+    return float(time_str)
+
+
+def _parse_times(time_strs: List) -> List[float]:
+    """
+    _parse_time для списка: строки склеиваются, 's' заменяется пробелом и всё
+    разбирается одним split — без вызова функции на каждое слово
+    
+    Нестроковые или нестандартные значения — поэлементно через _parse_time.
+    """
+    try:
+        times = list(map(float, " ".join(time_strs).replace("s", " ").split()))
+    except (TypeError, ValueError):
+        times = None
+    if times is None or len(times) != len(time_strs):
+        return [_parse_time(time_str) for time_str in time_strs]
+    return times
+
+
+def merge_transcription_with_speakers(
+    words: List[Dict],
+    speaker_segments: List[Dict]
+) -> List[Dict]:
+    """
+    Объединяет транскрипцию от Yandex с диаризацией (pyannote или Resemblyzer)
+    
+    Args:
+        words: Слова от Yandex: [{"word": "текст", "startTime": "1.5s", ...}, ...]
+        speaker_segments: Сегменты диаризатора: [{"speaker": "SPEAKER_00", "start": 1.5, "end": 5.3}, ...]
+    
+    Returns:
+        Слова с добавленным полем speaker: [{"word": "текст", "speaker": "SPEAKER_00", ...}, ...]
+    """
+    
+    # Сегменты по порядку и без перекрытий (концы строго возрастают) — ищем
+    # бинарным поиском; иначе перебираем все сегменты (numba или NumPy, если есть)
+    starts = [segment["start"] for segment in speaker_segments]
+    ends = [segment["end"] for segment in speaker_segments]
+    ordered = all(
+        start <= end for start, end in zip(starts, ends)
+    ) and all(
+        ends[i] <= starts[i + 1] and ends[i] < ends[i + 1]
+        for i in range(len(speaker_segments) - 1)
+    )
+    
+    def find_speaker(word_mid_time: float) -> Optional[str]:
+        if not speaker_segments:
+            return None
+        
+        if ordered:
+            # Первый сегмент, который заканчивается не раньше слова
+            i = bisect_left(ends, word_mid_time)
+            if i < len(ends) and starts[i] <= word_mid_time:
+                return speaker_segments[i]["speaker"]
+            # Слово в паузе: ближайший из соседних сегментов (при равенстве — предыдущий)
+            if i == 0:
+                return speaker_segments[0]["speaker"]
+            if i == len(ends) or word_mid_time - ends[i - 1] <= starts[i] - word_mid_time:
+                return speaker_segments[i - 1]["speaker"]
+            return speaker_segments[i]["speaker"]
+        
+        # Ищем какой спикер говорил в это время
+        for segment in speaker_segments:
+            if segment["start"] <= word_mid_time <= segment["end"]:
+                return segment["speaker"]
+        
+        # Если не нашли - берём ближайший сегмент
+        closest = min(
+            speaker_segments,
+            key=lambda s: min(
+                abs(s["start"] - word_mid_time),
+                abs(s["end"] - word_mid_time)
+            )
+        )
+        return closest["speaker"]
+    
+    # Берём среднее время слова
+    word_starts = _parse_times([word.get("startTime", "0s") for word in words])
+    word_ends = _parse_times([word.get("endTime", "0s") for word in words])
+    mids = [(start + end) / 2 for start, end in zip(word_starts, word_ends)]
+    
+    if speaker_segments and not ordered and _segment_indices is not None:
+        speakers = [
+            speaker_segments[i]["speaker"] or "UNKNOWN"
+            for i in _segment_indices(mids, starts, ends)
+        ]
+    else:
+        speakers = [find_speaker(mid) or "UNKNOWN" for mid in mids]
+    
+    # Добавляем speaker к каждому слову (новые словари — исходные слова не меняем)
+    return [{**word, "speaker": speaker} for word, speaker in zip(words, speakers)]
+
+
+def format_with_speakers(words: List[Dict]) -> str:
+    """
+    Форматирует текст с разделением по спикерам
+    
+    Args:
+        words: Слова с полем speaker
+    
+    Returns:
+        Отформатированный текст с разделением спикеров
+    """
+    # Соседние слова одного спикера — одна реплика; текст пишется сразу в буфер,
+    # без промежуточных списков слов и строк на каждую реплику
+    buffer = io.StringIO()
+    current_speaker = None
+    for word in words:
+        speaker = word.get("speaker", "UNKNOWN")
+        if speaker != current_speaker:
+            if current_speaker is not None:
+                buffer.write("\n\n")
+            buffer.write(speaker)
+            buffer.write(": ")
+            current_speaker = speaker
+        else:
+            buffer.write(" ")
+        buffer.write(word.get("word", ""))
+    
+    return buffer.getvalue()
@@ -4,20 +4,115 @@ Pytest fixtures для HearYou STT тестов
 """
 
 import pytest
-import sys
-import os
-from pathlib import Path
-from unittest.mock import Mock, MagicMock
-import tempfile
+import copy
+from types import MappingProxyType
+from unittest.mock import Mock
 import json
-import wave
+import struct
 
-PROJECT_ROOT = Path(__file__).parent.parent
+try:
+    import orjson  # опционально, как и в коде сервиса
+except ImportError:
+    orjson = None
 
-# Добавляем путь к core модулям и FastAPI сервису
-sys.path.insert(0, str(PROJECT_ROOT))
-sys.path.insert(0, str(PROJECT_ROOT / "core"))
-sys.path.insert(0, str(PROJECT_ROOT / "packages" / "stt-service"))
+
+def _dump_json(data) -> bytes:
+    """JSON в UTF-8 байты (orjson, без него — stdlib)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+# Простейший WAV: 1 секунда тишины, 16 kHz, 16-bit, моно (RIFF-заголовок + PCM)
+_WAV_PCM = b'\x00' * 32000
+WAV_BYTES = (
+    b'RIFF' + struct.pack('<I', 36 + len(_WAV_PCM)) + b'WAVE'
+    + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, 16000, 16000 * 2, 2, 16)
+    + b'data' + struct.pack('<I', len(_WAV_PCM)) + _WAV_PCM
+)
+
+
+# Неизменяемые данные для fixtures: собираются один раз при импорте conftest
+_CORRECTIONS_DICT = MappingProxyType({
+    "иришка": "ИИшка",
+    "мелишка": "милишка",
+    "свита": "свит"
+})
+
+_YANDEX_RESPONSE = MappingProxyType({
+    "result": "Привет мир это тестовая транскрипция"
+})
+
+_YANDEX_CHUNKS_RESPONSE = MappingProxyType({
+    "chunks": [
+        {
+            "alternatives": [
+                {
+                    "text": "Привет",
+                    "words": [
+                        {
+                            "word": "Привет",
+                            "startTime": "0.0s",
+                            "endTime": "0.5s",
+                            "speakerTag": "1"
+                        }
+                    ]
+                }
+            ]
+        },
+        {
+            "alternatives": [
+                {
+                    "text": "Как дела",
+                    "words": [
+                        {
+                            "word": "Как",
+                            "startTime": "0.6s",
+                            "endTime": "0.8s",
+                            "speakerTag": "2"
+                        },
+                        {
+                            "word": "дела",
+                            "startTime": "0.8s",
+                            "endTime": "1.0s",
+                            "speakerTag": "2"
+                        }
+                    ]
+                }
+            ]
+        }
+    ]
+})
+
+# Ответ check_operation для mock_async_operation: тесты его только читают
+_CHECK_OPERATION_RESULT = {
+    "done": True,
+    "response": {
+        "chunks": [
+            {
+                "alternatives": [
+                    {
+                        "text": "Тестовая транскрипция",
+                        "words": []
+                    }
+                ]
+            }
+        ]
+    }
+}
+
+
+class _S3Stub:
+    """Минимальный S3 клиент: запоминает вызовы, ничего не делает (дешевле Mock)"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def upload_file(self, *args, **kwargs):
+        self.calls.append(("upload_file", args, kwargs))
+    
+    def delete_object(self, *args, **kwargs):
+        self.calls.append(("delete_object", args, kwargs))
 
 
 @pytest.fixture
@@ -33,15 +128,19 @@ def mock_env_vars(monkeypatch):
     monkeypatch.setenv("WHISPER_COMPUTE_TYPE", "int8")
 
 
-@pytest.fixture
-def mock_local_stt(mocker):
-    """Mock локального STT-провайдера."""
-    mock_response = {
+@pytest.fixture(scope="session")
+def _cached_stt_response():
+    """Ответ локального STT для моков (собирается один раз)"""
+    return {
         "result": "Тестовая транскрипция текста"
     }
 
-    mock_transcribe = mocker.patch("core.local_whisper_stt.LocalWhisperSTT.transcribe_sync")
-    mock_transcribe.return_value = mock_response
+
+@pytest.fixture
+def mock_local_stt(monkeypatch, _cached_stt_response):
+    """Mock локального STT-провайдера."""
+    mock_transcribe = Mock(return_value=copy.deepcopy(_cached_stt_response))
+    monkeypatch.setattr("core.local_whisper_stt.LocalWhisperSTT.transcribe_sync", mock_transcribe)
 
     return mock_transcribe
 
@@ -53,59 +152,72 @@ def mock_yandex_api(mock_local_stt):
 
 
 @pytest.fixture
-def mock_s3_client(mocker):
-    """Legacy no-op S3 client mock для старых пропущенных тестов."""
-    mock_client = MagicMock()
-    mock_client.upload_file.return_value = None
-    mock_client.delete_object.return_value = None
-    return mock_client
+def mock_s3_client(monkeypatch):
+    """Legacy no-op S3 client для старых пропущенных тестов (вызовы — в stub.calls)"""
+    stub = _S3Stub()
+    monkeypatch.setattr("boto3.client", lambda *args, **kwargs: stub)
+    return stub
+
+
+@pytest.fixture(scope="session")
+def test_audio_file(tmp_path_factory):
+    """Тестовый WAV файл (1 секунда тишины), один на сессию — тесты его только читают"""
+    path = tmp_path_factory.mktemp("audio") / "test.wav"
+    path.write_bytes(WAV_BYTES)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def _base_corrector():
+    """TranscriptionCorrector, созданный один раз на сессию"""
+    from stt_corrections import TranscriptionCorrector
+    
+    return TranscriptionCorrector()
 
 
 @pytest.fixture
-def test_audio_file():
-    """Создать тестовый WAV файл"""
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-        # Создать простейший WAV файл (1 секунда тишины)
-        with wave.open(f.name, 'wb') as wav:
-            wav.setnchannels(1)  # Моно
-            wav.setsampwidth(2)  # 16-bit
-            wav.setframerate(16000)  # 16kHz
-            wav.writeframes(b'\x00' * 32000)  # 1 секунда тишины
-        
-        yield f.name
-        
-        # Cleanup
-        try:
-            os.unlink(f.name)
-        except:
-            pass
+def corrector(_base_corrector):
+    """Копия общего корректора: изменения в тесте не утекают в другие тесты"""
+    return copy.copy(_base_corrector)
+
+
+@pytest.fixture(scope="module")
+def filler():
+    """Общий FillerWordsFilter модуля — для тестов, которые его не меняют"""
+    from filler_words_filter import FillerWordsFilter
+    
+    return FillerWordsFilter()
 
 
 @pytest.fixture
+def filler_fresh():
+    """Отдельный FillerWordsFilter для тестов, которые добавляют паттерны"""
+    from filler_words_filter import FillerWordsFilter
+    
+    return FillerWordsFilter()
+
+
+@pytest.fixture(scope="session")
 def test_text_with_fillers():
     """Пример текста со словами-паразитами"""
     return "Эээ ну вот я думаю что эээ это хорошо короче типа"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_text_with_errors():
     """Пример текста с частыми ошибками транскрипции"""
     return "иришка мелишка свита"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_corrections_dict():
     """Словарь тестовых исправлений"""
-    return {
-        "иришка": "ИИшка",
-        "мелишка": "милишка",
-        "свита": "свит"
-    }
+    return _CORRECTIONS_DICT
 
 
 @pytest.fixture
-def test_corrections_file():
-    """Создать временный JSON файл с исправлениями"""
+def test_corrections_file(tmp_path):
+    """Временный JSON файл с исправлениями (.pkl-кеш словаря ляжет рядом, в tmp_path)"""
     corrections = {
         "test_words": {
             "тест": "TEST",
@@ -113,115 +225,70 @@ def test_corrections_file():
         }
     }
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix=".json", delete=False, encoding='utf-8') as f:
-        json.dump(corrections, f, ensure_ascii=False)
-        yield f.name
-        
-    # Cleanup
-    try:
-        os.unlink(f.name)
-    except:
-        pass
+    path = tmp_path / "corrections.json"
+    path.write_bytes(_dump_json(corrections))
+    return str(path)
 
 
 @pytest.fixture
-def mock_async_operation(mocker):
+def mock_async_operation(monkeypatch):
     """Mock асинхронной операции локального STT."""
     operation_id = "test_operation_123"
-    mock_check = mocker.patch("core.local_whisper_stt.LocalWhisperSTT.check_operation")
-    mock_check.return_value = {
-        "done": True,
-        "response": {
-            "chunks": [
-                {
-                    "alternatives": [
-                        {
-                            "text": "Тестовая транскрипция",
-                            "words": []
-                        }
-                    ]
-                }
-            ]
-        }
-    }
+    monkeypatch.setattr(
+        "core.local_whisper_stt.LocalWhisperSTT.check_operation",
+        lambda self, operation_id: _CHECK_OPERATION_RESULT,
+    )
     
     return operation_id
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_yandex_response():
     """Legacy fixture: типичный ответ STT API."""
-    return {
-        "result": "Привет мир это тестовая транскрипция"
-    }
+    return _YANDEX_RESPONSE
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_yandex_chunks_response():
     """Legacy fixture: ответ STT API с chunks (для speaker diarization)."""
-    return {
-        "chunks": [
-            {
-                "alternatives": [
-                    {
-                        "text": "Привет",
-                        "words": [
-                            {
-                                "word": "Привет",
-                                "startTime": "0.0s",
-                                "endTime": "0.5s",
-                                "speakerTag": "1"
-                            }
-                        ]
-                    }
-                ]
-            },
-            {
-                "alternatives": [
-                    {
-                        "text": "Как дела",
-                        "words": [
-                            {
-                                "word": "Как",
-                                "startTime": "0.6s",
-                                "endTime": "0.8s",
-                                "speakerTag": "2"
-                            },
-                            {
-                                "word": "дела",
-                                "startTime": "0.8s",
-                                "endTime": "1.0s",
-                                "speakerTag": "2"
-                            }
-                        ]
-                    }
-                ]
-            }
-        ]
-    }
+    return _YANDEX_CHUNKS_RESPONSE
 
 
-@pytest.fixture
-def mock_ffprobe(mocker):
-    """Mock ffprobe для валидации файлов"""
+@pytest.fixture(scope="session")
+def _cached_ffprobe_result():
+    """Результат ffprobe для моков (собирается один раз)"""
     import subprocess
     
-    mock_result = Mock()
-    mock_result.returncode = 0
-    mock_result.stdout = json.dumps({
-        "streams": [
-            {"codec_type": "audio", "codec_name": "pcm_s16le"}
-        ]
-    })
+    return subprocess.CompletedProcess(
+        args=["ffprobe"],
+        returncode=0,
+        stdout=_dump_json({
+            "streams": [
+                {"codec_type": "audio", "codec_name": "pcm_s16le"}
+            ]
+        }).decode(),
+    )
+
+
+@pytest.fixture
+def mock_ffprobe(monkeypatch, _cached_ffprobe_result):
+    """Mock ffprobe для валидации файлов"""
+    mock_result = copy.copy(_cached_ffprobe_result)
     
-    mocker.patch("subprocess.run", return_value=mock_result)
+    monkeypatch.setattr("subprocess.run", lambda *args, **kwargs: mock_result)
     
     return mock_result
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def app_client():
-    """FastAPI test client"""
+    """
+    FastAPI test client, один на сессию
+    
+    Без `with`: startup (воркеры очереди, пул диаризации, снапшот задач,
+    загрузка модели Whisper) в тестах не запускается. Состояния между
+    запросами клиент не хранит — тесты подменяют глобалы app через monkeypatch.
+    """
     from fastapi.testclient import TestClient
     from app import app
     
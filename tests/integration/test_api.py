@@ -4,17 +4,16 @@ Integration тесты для FastAPI приложения
 """
 
 import pytest
-from pathlib import Path
-import sys
 import json
+from collections import Counter
 from io import BytesIO
 
-sys.path.insert(0, str(Path(__file__).parent.parent.parent / "packages" / "stt-service"))
 
 # Тесты требуют запущенный сервер или используют TestClient
 # Для unit-тестов используем моки
 
 
+@pytest.mark.xdist_group("api_ro")
 class TestHealthEndpoint:
     """Тесты health endpoint"""
     
@@ -23,7 +22,8 @@ class TestHealthEndpoint:
         response = app_client.get("/")
         
         assert response.status_code == 200
-        assert "html" in response.text.lower()
+        assert response.headers["content-type"].startswith("text/html")
+        assert b"<html" in response.content[:256].lower()
     
     def test_health_check(self, app_client):
         """Тест health check (если есть endpoint)"""
@@ -33,6 +33,7 @@ class TestHealthEndpoint:
         assert response.status_code == 200
 
 
+@pytest.mark.xdist_group("api_ro")
 class TestStatsEndpoint:
     """Тесты статистики"""
     
@@ -59,6 +60,7 @@ class TestStatsEndpoint:
         assert isinstance(data["failed"], int)
 
 
+@pytest.mark.xdist_group("api_ro")
 class TestFormatsEndpoint:
     """Тесты поддерживаемых форматов"""
     
@@ -80,6 +82,7 @@ class TestFormatsEndpoint:
         assert isinstance(data["max_file_size_mb"], (int, float))
 
 
+@pytest.mark.xdist_group("api_ro")
 class TestHistoryEndpoint:
     """Тесты истории транскрибаций"""
     
@@ -100,8 +103,28 @@ class TestHistoryEndpoint:
         
         data = response.json()
         assert len(data) <= 10
+    
+    def test_history_newest_first_after_snapshot_restore(self, app_client, monkeypatch, tmp_path):
+        """Восстановленные из снимка задачи встают по created_at, история — от новых к старым"""
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "TASKS_SNAPSHOT_FILE", tmp_path / "tasks.snapshot")
+        monkeypatch.setattr(app_module, "tasks_status", {})
+        monkeypatch.setattr(app_module, "status_counts", Counter())
+        (tmp_path / "tasks.snapshot").write_text(json.dumps({
+            "old": {"status": "completed", "created_at": "2026-01-01T10:00:00"},
+            "older": {"status": "failed", "created_at": "2026-01-01T09:00:00"},
+        }))
+        app_module.tasks_status["new"] = {"status": "queued", "created_at": "2026-01-02T10:00:00"}
+        
+        app_module.load_tasks_snapshot()
+        
+        response = app_client.get("/history", params={"limit": 2})
+        assert [item["task_id"] for item in response.json()] == ["new", "old"]
+        assert app_client.get("/stats").json()["completed"] == 1
 
 
+@pytest.mark.xdist_group("api_rw")
 class TestUploadEndpoint:
     """Тесты загрузки файлов"""
     
@@ -136,6 +159,78 @@ class TestUploadEndpoint:
         # Должна быть ошибка 422 (validation error)
         assert response.status_code == 422
     
+    def test_upload_stream_requires_filename(self, app_client):
+        """Потоковая загрузка без имени файла"""
+        response = app_client.post("/upload-stream", content=b"data")
+        
+        assert response.status_code == 422
+    
+    def test_upload_stream_empty_body(self, app_client):
+        """Пустое тело отклоняется, файл не остаётся на диске"""
+        from app import UPLOAD_DIR
+        
+        before = set(UPLOAD_DIR.iterdir())
+        response = app_client.post("/upload-stream", params={"filename": "empty.mp3"}, content=b"")
+        
+        assert response.status_code == 400
+        assert set(UPLOAD_DIR.iterdir()) == before
+    
+    def test_transcribe_streams_multipart_to_disk(self, app_client, monkeypatch, tmp_path):
+        """Файл из multipart пишется на диск как есть, поля формы разбираются"""
+        import asyncio
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "UPLOAD_DIR", tmp_path)
+        monkeypatch.setattr(app_module, "validate_file_security", lambda name, path: None)
+        monkeypatch.setattr(app_module, "task_queue", asyncio.Queue())
+        
+        payload = bytes(range(256)) * 4096
+        response = app_client.post("/transcribe", files={"file": ("запись.mp3", BytesIO(payload))}, data={
+            "language": "en-US", "clean": "true", "corrections": "off",
+        })
+        
+        assert response.status_code == 200
+        queued = app_module.task_queue.get_nowait()
+        assert queued["file_path"].read_bytes() == payload
+        assert queued["options"]["language"] == "en-US"
+        assert queued["options"]["clean"] is True
+        assert queued["options"]["corrections"] is False
+        assert queued["options"]["punctuation"] is True
+        assert [p.name for p in tmp_path.iterdir()] == [queued["file_path"].name]
+    
+    @pytest.mark.parametrize("files,data,status", [
+        ({"file": ("big.mp3", BytesIO(b"x" * 2048))}, {}, 413),
+        ({"file": ("empty.mp3", BytesIO(b""))}, {}, 400),
+        ({"other": ("a.mp3", BytesIO(b"data"))}, {}, 422),
+        ({"file": ("a.mp3", BytesIO(b"data"))}, {"clean": "maybe"}, 422),
+    ])
+    def test_transcribe_rejects_without_leftovers(self, app_client, monkeypatch, tmp_path, files, data, status):
+        """Отклонённая загрузка не оставляет файлов"""
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "UPLOAD_DIR", tmp_path)
+        monkeypatch.setattr(app_module, "MAX_FILE_SIZE", 1024)
+        
+        response = app_client.post("/transcribe", files=files, data=data)
+        
+        assert response.status_code == status
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_transcribe_rejects_malformed_multipart(self, app_client, monkeypatch, tmp_path):
+        """Тело, которое не разбирается как multipart, — 400, а не 500"""
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "UPLOAD_DIR", tmp_path)
+        
+        response = app_client.post(
+            "/transcribe",
+            content=b"garbage",
+            headers={"Content-Type": "multipart/form-data; boundary=abc"},
+        )
+        
+        assert response.status_code == 400
+        assert list(tmp_path.iterdir()) == []
+    
     @pytest.mark.skip(reason="Требует моков")
     def test_upload_invalid_language(self, app_client, test_audio_file):
         """Тест с невалидным языковым кодом"""
@@ -149,30 +244,180 @@ class TestUploadEndpoint:
         assert response.status_code == 200
 
 
+@pytest.mark.xdist_group("api_ro")
+class TestMissingTask:
+    """Эндпоинты задачи для несуществующего task_id"""
+    
+    @pytest.mark.parametrize("path", [
+        "/status/nonexistent_task_id",
+        "/result/nonexistent_task_id",
+        "/download/nonexistent_task_id",
+    ])
+    def test_missing_task_returns_404(self, app_client, path):
+        """Статус, результат и скачивание несуществующей задачи — 404"""
+        assert app_client.get(path).status_code == 404
+
+
+@pytest.mark.xdist_group("api_ro")
 class TestStatusEndpoint:
     """Тесты проверки статуса задачи"""
     
-    def test_status_not_found(self, app_client):
-        """Тест статуса несуществующей задачи"""
-        response = app_client.get("/status/nonexistent_task_id")
-        
-        assert response.status_code == 404
-    
     @pytest.mark.skip(reason="Требует создания задачи")
     def test_status_existing_task(self, app_client):
         """Тест статуса существующей задачи"""
         # Создать задачу, затем проверить статус
         pass
+    
+    def test_status_snapshot_roundtrip_and_eviction(self, monkeypatch, tmp_path):
+        """Снимок статусов переживает рестарт, старые завершённые задачи вытесняются"""
+        import asyncio
+        from datetime import datetime, timedelta
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "TASKS_SNAPSHOT_FILE", tmp_path / "tasks.snapshot")
+        monkeypatch.setattr(app_module, "_last_snapshot", None)
+        monkeypatch.setattr(app_module, "tasks_status", {})
+        monkeypatch.setattr(app_module, "status_counts", Counter())
+        
+        now = datetime.now()
+        old = (now - timedelta(seconds=app_module.TASK_STATUS_TTL + 60)).isoformat()
+        app_module.tasks_status.update({
+            "done": {"status": "completed", "created_at": now.isoformat(), "result": "текст"},
+            "running": {"status": "processing", "created_at": now.isoformat(), "progress": 50},
+            "stale": {"status": "failed", "created_at": old},
+            "stale_error": {"status": "error", "created_at": old},
+            # Долго ждала в очереди, но завершилась только что — не вытесняется
+            "slow": {"status": "processing", "created_at": old},
+        })
+        monkeypatch.setattr(app_module, "task_done_events", {"stale_error": asyncio.Event()})
+        app_module.update_task("running", progress=60, message="Транскрибация...")
+        app_module.update_task("slow", status="completed")
+        
+        assert app_module.evict_expired_tasks(now.timestamp()) == 2
+        assert "slow" in app_module.tasks_status
+        assert "stale_error" not in app_module.task_done_events
+        assert app_module.save_tasks_snapshot(app_module.tasks_snapshot_payload()) is True
+        assert app_module.save_tasks_snapshot() is False  # ничего не изменилось
+        
+        app_module.tasks_status.clear()
+        assert app_module.load_tasks_snapshot() == 3
+        assert "finished_at" in app_module.tasks_status["slow"]
+        assert "result" not in app_module.tasks_status["done"]
+        assert app_module.tasks_status["running"]["status"] == "failed"
+        assert app_module.tasks_status["running"]["progress"] == 60
+
+    def test_wait_returns_when_task_finishes(self, monkeypatch):
+        """Ожидание просыпается по событию завершения, а не по таймауту"""
+        import asyncio
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "tasks_status", {"t1": {"status": "processing"}})
+        monkeypatch.setattr(app_module, "status_counts", Counter())
+        monkeypatch.setattr(app_module, "task_done_events", {})
+        
+        async def scenario():
+            async def finish():
+                await asyncio.sleep(0.01)
+                app_module.update_task("t1", status="completed")
+                app_module.task_done_event("t1").set()
+            
+            asyncio.create_task(finish())
+            return await asyncio.wait_for(app_module.wait_status("t1", timeout=60), timeout=5)
+        
+        assert asyncio.run(scenario())["status"] == "completed"
+    
+    def test_wait_timeout_returns_current_status(self, app_client, monkeypatch):
+        """По таймауту возвращается текущий статус; неизвестная задача — 404"""
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "tasks_status", {"t1": {"status": "processing"}})
+        monkeypatch.setattr(app_module, "status_counts", Counter())
+        monkeypatch.setattr(app_module, "task_done_events", {})
+        
+        response = app_client.get("/status/t1/wait", params={"timeout": 0})
+        assert response.status_code == 200
+        assert response.json()["status"] == "processing"
+        assert app_client.get("/status/missing/wait").status_code == 404
 
 
+    def test_stream_pushes_updates_without_polling(self, monkeypatch):
+        """SSE отправляет сообщение на каждое обновление статуса, а не раз в секунду"""
+        import asyncio
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "tasks_status", {})
+        monkeypatch.setattr(app_module, "status_counts", Counter())
+        monkeypatch.setattr(app_module, "task_update_events", {})
+        monkeypatch.setattr(app_module, "SSE_KEEPALIVE_INTERVAL", 0.05)
+        app_module.register_task("t1", "запись.mp3", "anonymous")
+        
+        async def scenario():
+            stream = (await app_module.stream_status("t1")).body_iterator
+            messages = [await stream.__anext__()]
+            messages.append(await stream.__anext__())  # keepalive: статус не менялся
+            
+            app_module.update_task("t1", status="processing", progress=40)
+            messages.append(await asyncio.wait_for(stream.__anext__(), timeout=1))
+            
+            app_module.update_task("t1", status="failed", error="boom")
+            messages.append(await asyncio.wait_for(stream.__anext__(), timeout=1))
+            messages.extend([message async for message in stream])
+            return messages
+        
+        messages = asyncio.run(scenario())
+        
+        assert messages[1] == b": keepalive\n\n"
+        payloads = [json.loads(m[len(b"data: "):]) for m in messages if m.startswith(b"data: ")]
+        assert [(p["status"], p["progress"]) for p in payloads] == [
+            ("queued", 0), ("processing", 40), ("failed", 40),
+        ]
+        assert payloads[0]["filename"] == "запись.mp3"
+        assert app_module.task_update_events == {}
+    
+    def test_stats_counters_follow_transitions(self, app_client, monkeypatch):
+        """Счётчики /stats меняются при переходах статуса и вытеснении"""
+        from datetime import datetime, timedelta
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "tasks_status", {})
+        monkeypatch.setattr(app_module, "status_counts", Counter())
+        
+        app_module.register_task("a", "a.mp3", "anonymous")
+        app_module.register_task("b", "b.mp3", "anonymous")
+        app_module.update_task("a", status="processing", progress=10)
+        app_module.update_task("a", progress=50)
+        app_module.update_task("b", status="failed", error="boom")
+        
+        stats = app_client.get("/stats").json()
+        assert (stats["total_tasks"], stats["queued"], stats["processing"], stats["failed"]) == (2, 0, 1, 1)
+        
+        app_module.tasks_status["b"]["finished_at"] = (
+            datetime.now() - timedelta(seconds=app_module.TASK_STATUS_TTL + 60)
+        ).isoformat()
+        app_module.evict_expired_tasks()
+        app_module.update_task("a", status="completed")
+        
+        stats = app_client.get("/stats").json()
+        assert (stats["total_tasks"], stats["processing"], stats["completed"], stats["failed"]) == (1, 0, 1, 0)
+
+
+@pytest.mark.xdist_group("api_ro")
 class TestResultEndpoint:
     """Тесты получения результатов"""
     
-    def test_result_not_found(self, app_client):
-        """Тест результата несуществующей задачи"""
-        response = app_client.get("/result/nonexistent_task_id")
+    def test_result_served_from_file_as_is(self, app_client, monkeypatch, tmp_path):
+        """Файл результата отдаётся байт в байт, без повторной сериализации"""
+        import app as app_module
         
-        assert response.status_code == 404
+        monkeypatch.setattr(app_module, "RESULTS_DIR", tmp_path)
+        raw = json.dumps({"task_id": "abc", "result": "Привет"}, ensure_ascii=False, indent=2).encode("utf-8")
+        (tmp_path / "abc.json").write_bytes(raw)
+        
+        response = app_client.get("/result/abc")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == raw
     
     @pytest.mark.skip(reason="Требует завершённой задачи")
     def test_result_completed_task(self, app_client):
@@ -181,14 +426,50 @@ class TestResultEndpoint:
         pass
 
 
+class TestResultFile:
+    """Тесты записи файла результата"""
+    
+    def test_result_json_roundtrip(self, tmp_path):
+        """Файл результата — читаемый UTF-8 JSON с отступами"""
+        from app import write_result_file
+        
+        result_data = {
+            "task_id": "abc",
+            "result": "Привет, мир",
+            "speaker_segments": [{"speaker": "SPEAKER_00", "start": 0.5, "end": 1.25}],
+            "jtbd": None,
+        }
+        result_file = tmp_path / "abc.json"
+        write_result_file(result_file, result_data)
+        
+        raw = result_file.read_text(encoding="utf-8")
+        assert "Привет, мир" in raw
+        assert '\n  "task_id"' in raw
+        assert json.loads(raw) == result_data
+
+
+@pytest.mark.xdist_group("api_ro")
 class TestDownloadEndpoint:
     """Тесты скачивания результатов"""
     
-    def test_download_not_found(self, app_client):
-        """Тест скачивания несуществующего результата"""
-        response = app_client.get("/download/nonexistent_task_id")
+    def test_download_builds_txt_in_memory(self, app_client, monkeypatch, tmp_path):
+        """TXT собирается из результата без временного файла, кириллическое имя — через filename*"""
+        import app as app_module
         
-        assert response.status_code == 404
+        monkeypatch.setattr(app_module, "RESULTS_DIR", tmp_path / "results")
+        monkeypatch.setattr(app_module, "TEMP_DIR", tmp_path / "temp")
+        (tmp_path / "results").mkdir()
+        (tmp_path / "temp").mkdir()
+        result = {"result": "Привет, мир", "original_filename": "встреча.mp3"}
+        (tmp_path / "results" / "abc.json").write_text(json.dumps(result), encoding="utf-8")
+        
+        response = app_client.get("/download/abc")
+        
+        assert response.status_code == 200
+        assert response.text == "Привет, мир"
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "filename*=utf-8''%D0%B2%D1%81%D1%82%D1%80%D0%B5%D1%87%D0%B0.txt" in response.headers["content-disposition"]
+        assert list((tmp_path / "temp").iterdir()) == []
 
 
 class TestSanitization:
@@ -213,6 +494,20 @@ class TestSanitization:
         result = sanitize_filename(long_name)
         assert len(result) <= 210  # 200 + расширение
     
+    @pytest.mark.parametrize("filename, expected", [
+        ("interview (final) v2.MP3", "interview_final_v2.mp3"),
+        ("интервью №1 — Ёлка!.wav", "интервью_1_Ёлка.wav"),
+        ("a;b|c$d\te.ogg", "a_b_c_d_e.ogg"),
+        ("ça va 🎙️.m4a", "ça_va.m4a"),
+        ("noext", "noext.mp3"),
+        ("!!!.mp3", "file.mp3"),
+    ])
+    def test_filename_sanitization_chars(self, filename, expected):
+        """ASCII- и не-ASCII-символы заменяются по одним правилам"""
+        from app import sanitize_filename
+        
+        assert sanitize_filename(filename) == expected
+    
     def test_language_sanitization(self):
         """Тест санитизации языкового кода"""
         from app import sanitize_language_code
@@ -226,6 +521,27 @@ class TestSanitization:
         assert sanitize_language_code("xx-XX") == "ru-RU"
 
 
+class TestAuth:
+    """Тесты проверки токена"""
+
+    @pytest.mark.parametrize("header,expected", [
+        (None, "anonymous"),
+        ("Bearer artem_token", "Artem"),
+        ("test_token", "Test User"),
+    ])
+    def test_verify_token_accepts(self, header, expected):
+        from app import verify_token
+        assert verify_token(header) == expected
+
+    @pytest.mark.parametrize("header", ["Bearer nope", "Bearer ", "bearer artem_token"])
+    def test_verify_token_rejects(self, header):
+        from app import verify_token
+        from fastapi import HTTPException
+        with pytest.raises(HTTPException) as exc_info:
+            verify_token(header)
+        assert exc_info.value.status_code == 401
+
+
 class TestRateLimiting:
     """Тесты rate limiting"""
     
@@ -235,8 +551,33 @@ class TestRateLimiting:
         # Отправить >10 запросов за минуту
         # Должен получить 429 Too Many Requests
         pass
+    
+    def test_rate_limit_window_and_prune(self, monkeypatch):
+        """Лимит по скользящему окну, пустые IP вычищаются"""
+        from fastapi import HTTPException
+        import app as app_module
+        
+        now = [1000.0]
+        monkeypatch.setattr(app_module.time, "time", lambda: now[0])
+        ip = "203.0.113.7"
+        app_module.request_counts.pop(ip, None)
+        
+        for _ in range(app_module.RATE_LIMIT_MAX_REQUESTS):
+            app_module.check_rate_limit(ip)
+        with pytest.raises(HTTPException) as exc_info:
+            app_module.check_rate_limit(ip)
+        assert exc_info.value.status_code == 429
+        
+        now[0] += app_module.RATE_LIMIT_WINDOW
+        app_module.check_rate_limit(ip)
+        assert len(app_module.request_counts[ip]) == 1
+        
+        now[0] += app_module.RATE_LIMIT_WINDOW
+        assert app_module.prune_rate_limits() >= 1
+        assert ip not in app_module.request_counts
 
 
+@pytest.mark.xdist_group("api_rw")
 class TestChunkedUpload:
     """Тесты загрузки больших файлов по частям"""
     
@@ -258,6 +599,141 @@ class TestChunkedUpload:
         assert "upload_id" in result
         assert "complete" in result
     
+    def test_assemble_chunks_concatenates_and_removes_parts(self, tmp_path):
+        """Чанки склеиваются по порядку, а сами части удаляются"""
+        from app import assemble_chunks
+        
+        parts = [b"first-", b"", b"second-" * 1000, b"third"]
+        chunk_paths = []
+        for i, data in enumerate(parts):
+            chunk_path = tmp_path / f"chunk_{i}"
+            chunk_path.write_bytes(data)
+            chunk_paths.append(chunk_path)
+        
+        final_path = tmp_path / "final.mp3"
+        assemble_chunks(chunk_paths, final_path)
+        
+        assert final_path.read_bytes() == b"".join(parts)
+        assert not any(path.exists() for path in chunk_paths)
+    
+    def test_chunked_uploads_evict_least_recent(self, app_client, monkeypatch, tmp_path):
+        """При переполнении вытесняется самая давно активная загрузка вместе с чанками"""
+        import app as app_module
+        from collections import OrderedDict
+
+        monkeypatch.setattr(app_module, "CHUNKS_DIR", tmp_path)
+        monkeypatch.setattr(app_module, "MAX_CHUNKED_UPLOADS", 2)
+        monkeypatch.setattr(app_module, "chunked_uploads", OrderedDict())
+
+        def send(upload_id, index):
+            response = app_client.post("/upload-chunk", data={
+                "upload_id": upload_id,
+                "chunk_index": index,
+                "total_chunks": 3,
+                "filename": "test.mp3"
+            }, files={"chunk": (f"chunk_{index}", BytesIO(b"data"))})
+            assert response.status_code == 200
+
+        send("first", 0)
+        send("second", 0)
+        send("first", 1)  # "first" снова активна, самая старая теперь "second"
+        send("third", 0)
+
+        assert list(app_module.chunked_uploads) == ["first", "third"]
+        assert not (tmp_path / "second").exists()
+        assert (tmp_path / "first" / "chunk_1").exists()
+
+    def test_assemble_chunks_without_kernel_copy(self, monkeypatch, tmp_path):
+        """Если копирование в ядре недоступно, чанки дописываются через copyfileobj"""
+        import app as app_module
+        
+        def unsupported(*args):
+            raise OSError("not supported")
+        
+        monkeypatch.setattr(app_module, "_KERNEL_COPY_FUNCS", [unsupported])
+        
+        parts = [b"a" * 10, b"b" * 20, b"c"]
+        chunk_paths = []
+        for i, data in enumerate(parts):
+            chunk_path = tmp_path / f"chunk_{i}"
+            chunk_path.write_bytes(data)
+            chunk_paths.append(chunk_path)
+        
+        final_path = tmp_path / "final.mp3"
+        app_module.assemble_chunks(chunk_paths, final_path)
+        
+        assert final_path.read_bytes() == b"".join(parts)
+    
+    def test_assemble_chunks_failure_keeps_chunks(self, tmp_path):
+        """Ошибка посреди склейки не съедает чанки: первый возвращается на место"""
+        import app as app_module
+        
+        parts = [b"first-", b"second-", b"third"]
+        chunk_paths = []
+        for i, data in enumerate(parts):
+            chunk_path = tmp_path / f"chunk_{i}"
+            chunk_path.write_bytes(data)
+            chunk_paths.append(chunk_path)
+        chunk_paths[2].unlink()  # чанк пропал — open() даст FileNotFoundError
+        
+        final_path = tmp_path / "final.mp3"
+        with pytest.raises(FileNotFoundError):
+            app_module.assemble_chunks(chunk_paths, final_path)
+        
+        assert not final_path.exists()
+        assert [path.read_bytes() for path in chunk_paths[:2]] == parts[:2]
+    
+    def test_assemble_chunks_copies_across_filesystems(self, monkeypatch, tmp_path):
+        """EXDEV при переименовании — первый чанк тоже копируется"""
+        import errno
+        import app as app_module
+        
+        def cross_device(src, dst):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        
+        monkeypatch.setattr(app_module.os, "replace", cross_device)
+        
+        parts = [b"a" * 10, b"b" * 20]
+        chunk_paths = []
+        for i, data in enumerate(parts):
+            chunk_path = tmp_path / f"chunk_{i}"
+            chunk_path.write_bytes(data)
+            chunk_paths.append(chunk_path)
+        
+        final_path = tmp_path / "final.mp3"
+        app_module.assemble_chunks(chunk_paths, final_path)
+        
+        assert final_path.read_bytes() == b"".join(parts)
+        assert not any(path.exists() for path in chunk_paths)
+    
+    def test_complete_upload_restores_entry_when_assembly_fails(self, app_client, monkeypatch, tmp_path):
+        """Пока идёт склейка, загрузки нет в chunked_uploads; при ошибке она возвращается"""
+        import app as app_module
+        from collections import OrderedDict
+        
+        uploads = OrderedDict()
+        uploads["up"] = {
+            "filename": "test.mp3",
+            "total_chunks": 1,
+            "received_chunks": {0},
+            "chunk_dir": tmp_path,
+            "started_at": "2026-01-01T00:00:00",
+        }
+        seen_during_assembly = []
+        
+        def failing_assemble(chunk_paths, final_path):
+            seen_during_assembly.append("up" in uploads)
+            raise OSError("disk full")
+        
+        monkeypatch.setattr(app_module, "chunked_uploads", uploads)
+        monkeypatch.setattr(app_module, "assemble_chunks", failing_assemble)
+        
+        with pytest.raises(OSError):
+            app_client.post("/complete-upload", data={"upload_id": "up"})
+        
+        assert seen_during_assembly == [False]
+        assert list(uploads) == ["up"]
+    
     @pytest.mark.skip(reason="Требует сложной настройки")
     def test_complete_upload(self, app_client):
         """Тест завершения chunked upload"""
@@ -292,6 +768,22 @@ class TestConcurrency:
         pass
 
 
+class TestLogs:
+    """Тесты чтения логов"""
+    
+    @pytest.mark.parametrize("count", [0, 1, 3, 50, 500])
+    def test_tail_lines_matches_full_read(self, tmp_path, count):
+        """Чтение с конца блоками даёт те же строки, что полное чтение файла"""
+        from app import tail_lines
+        
+        log_file = tmp_path / "app.log"
+        log_file.write_text("".join(f"строка {i} " + "x" * (i % 37) + "\n" for i in range(200)), encoding="utf-8")
+        
+        expected = log_file.read_text(encoding="utf-8").splitlines()[-count:] if count else []
+        assert tail_lines(log_file, count, block_size=64) == expected
+
+
+@pytest.mark.xdist_group("api_rw")
 class TestCleanup:
     """Тесты очистки старых файлов"""
     
@@ -301,3 +793,201 @@ class TestCleanup:
         
         # Может вернуть 200 или требовать авторизацию
         assert response.status_code in [200, 401, 403]
+    
+    def test_remove_stale_files(self, monkeypatch, tmp_path):
+        """Удаляются только старые файлы; подкаталоги и снимок статусов остаются"""
+        import os
+        import time
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "TASKS_SNAPSHOT_FILE", tmp_path / "tasks_status.snapshot")
+        old = time.time() - 10 * 86400
+        for name in ("old.json", "old.ogg", "tasks_status.snapshot", "fresh.json"):
+            (tmp_path / name).write_text("x")
+            if name != "fresh.json":
+                os.utime(tmp_path / name, (old, old))
+        (tmp_path / "subdir").mkdir()
+        os.utime(tmp_path / "subdir", (old, old))
+        
+        assert app_module.remove_stale_files([tmp_path], time.time() - 7 * 86400) == 2
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["fresh.json", "subdir", "tasks_status.snapshot"]
+
+
+class TestAudioConversion:
+    """Тесты конвертации в OGG Opus"""
+    
+    def _fake_run(self, monkeypatch, stderr_by_call):
+        import subprocess
+        calls = []
+        
+        def fake_run(cmd, **kwargs):
+            calls.append(cmd)
+            stderr = stderr_by_call[len(calls) - 1]
+            if stderr is not None:
+                raise subprocess.CalledProcessError(1, cmd, stderr=stderr)
+        
+        monkeypatch.setattr(subprocess, "run", fake_run)
+        return calls
+    
+    def test_filters_applied_in_single_pass(self, monkeypatch, tmp_path):
+        """Фильтры и кодирование — один вызов ffmpeg"""
+        from app import convert_to_opus
+        
+        calls = self._fake_run(monkeypatch, [None])
+        
+        assert convert_to_opus(tmp_path / "in.mp3", tmp_path / "out.ogg", "t1") is True
+        assert len(calls) == 1
+        assert "-af" in calls[0] and "libopus" in calls[0]
+    
+    def test_filter_failure_falls_back_to_plain_conversion(self, monkeypatch, tmp_path):
+        """Ошибка фильтров — повторная конвертация без них"""
+        from app import convert_to_opus
+        
+        calls = self._fake_run(monkeypatch, [b"Error initializing filter 'afftdn'", None])
+        
+        assert convert_to_opus(tmp_path / "in.mp3", tmp_path / "out.ogg", "t2") is False
+        assert len(calls) == 2
+        assert "-af" not in calls[1]
+    
+    def test_no_audio_stream_fails_without_retry(self, monkeypatch, tmp_path):
+        """Файл без аудио дорожки не конвертируется повторно"""
+        from app import convert_to_opus
+        
+        calls = self._fake_run(monkeypatch, [b"Stream map '0:a:0' matches no streams."])
+        
+        with pytest.raises(ValueError, match="аудио дорожки"):
+            convert_to_opus(tmp_path / "in.mp4", tmp_path / "out.ogg", "t3")
+        assert len(calls) == 1
+    
+    @pytest.mark.parametrize("probe, expected", [
+        ({"format": {"format_name": "ogg"},
+          "streams": [{"codec_name": "opus", "sample_rate": "48000", "channels": 1}]}, True),
+        ({"format": {"format_name": "ogg"},
+          "streams": [{"codec_name": "opus", "sample_rate": "48000", "channels": 2}]}, False),
+        ({"format": {"format_name": "ogg"},
+          "streams": [{"codec_name": "vorbis", "sample_rate": "48000", "channels": 1}]}, False),
+        ({"format": {"format_name": "matroska,webm"},
+          "streams": [{"codec_name": "opus", "sample_rate": "48000", "channels": 1}]}, False),
+    ])
+    def test_is_target_opus(self, monkeypatch, tmp_path, probe, expected):
+        """Перекодирование пропускается только для OGG Opus 48 кГц моно"""
+        import app as app_module
+        
+        monkeypatch.setattr(app_module, "probe_media_file", lambda path: probe)
+        
+        assert app_module.is_target_opus(tmp_path / "in.ogg") is expected
+
+
+class TestSpeakerFormatting:
+    """Тесты форматирования диалога по спикерам"""
+    
+    @staticmethod
+    def _result(tags):
+        words = [
+            {"word": f"w{i}", "startTime": f"{i}s", "speakerTag": tag}
+            for i, tag in enumerate(tags)
+        ]
+        return {"result": "plain text", "chunks": [{"alternatives": [{"words": words}]}]}
+    
+    def test_dialog_grouped_by_consecutive_speaker(self):
+        """Подряд идущие слова одного спикера — одна реплика"""
+        from app import format_with_speakers
+        
+        text = format_with_speakers(self._result([1, 1, 2, 1]))
+        
+        assert text == "Спикер 1: w0 w1\n\nСпикер 2: w2\n\nСпикер 1: w3"
+    
+    def test_single_speaker_returns_plain_text(self):
+        """Один спикер — обычный текст без префиксов"""
+        from app import format_with_speakers
+        
+        assert format_with_speakers(self._result([3, 3, 3])) == "plain text"
+        assert format_with_speakers(self._result([None, None])) == "plain text"
+    
+    def test_diarization_cached_by_audio_content(self, monkeypatch, tmp_path):
+        """Повторная диаризация того же аудио берётся из кеша"""
+        import asyncio
+        import app as app_module
+        
+        calls = []
+        
+        class FakeDiarizer:
+            def diarize(self, audio_file, num_speakers=None):
+                calls.append(audio_file)
+                return [{"speaker": "SPEAKER_00", "start": 0.0, "end": 1.5}]
+        
+        monkeypatch.setattr(app_module, "DIAR_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(app_module, "diarizer", FakeDiarizer())
+        monkeypatch.setattr(app_module, "diarization_pool", None)
+        
+        audio = tmp_path / "a.ogg"
+        audio.write_bytes(b"OggS" + b"\x01" * 100)
+        copy = tmp_path / "b.ogg"
+        copy.write_bytes(audio.read_bytes())
+        other = tmp_path / "c.ogg"
+        other.write_bytes(b"OggS" + b"\x02" * 100)
+        
+        first = asyncio.run(app_module.diarize_audio(str(audio)))
+        assert asyncio.run(app_module.diarize_audio(str(copy))) == first
+        asyncio.run(app_module.diarize_audio(str(other)))
+        
+        assert calls == [str(audio), str(other)]
+
+
+class TestTextPostprocessingCache:
+    """Тесты кеширования очистки текста и JTBD анализа"""
+    
+    def test_clean_text_memoized(self, monkeypatch):
+        """Повторная очистка того же текста с теми же флагами берётся из кеша"""
+        import copy
+        import app as app_module
+        from core.text_cleaner import TranscriptionCleaner, default_corrector
+        
+        cleaner = TranscriptionCleaner(copy.copy(default_corrector))
+        calls = []
+        clean = cleaner.clean
+        monkeypatch.setattr(cleaner, "clean", lambda text, **flags: calls.append(flags) or clean(text, **flags))
+        monkeypatch.setattr(app_module, "cleaner", cleaner)
+        
+        text = "эээ ну вот это текст про кубер"
+        first = app_module.clean_text(text, remove_filler_words=True, fix_artifacts=True)
+        assert app_module.clean_text(text, remove_filler_words=True, fix_artifacts=True) == first
+        app_module.clean_text(text, remove_filler_words=False, fix_artifacts=True)
+        assert len(calls) == 2
+        assert all(isinstance(key[0], bytes) for key in app_module.clean_text_cache)
+        
+        # Новое исправление сбрасывает кеш: старый текст не отдаётся
+        cleaner.add_custom_correction("кубер", "Kubernetes")
+        assert "Kubernetes" in app_module.clean_text(text, remove_filler_words=True, fix_artifacts=True)
+        assert len(calls) == 3
+    
+    def test_jtbd_cached_on_disk_except_errors(self, monkeypatch, tmp_path):
+        """Успешный JTBD анализ кешируется на диске, неудачный — нет"""
+        import app as app_module
+        
+        calls = []
+        
+        class FakeAnalyzer:
+            provider = "apinet"
+            model = "test-model"
+            
+            def analyze(self, text):
+                calls.append(text)
+                error = "Ошибка анализа" if text == "сбой" else ""
+                return {"jobs": [text], "metadata": {"error": error, "total_elements": 1}}
+        
+        monkeypatch.setattr(app_module, "JTBD_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(app_module, "jtbd_analyzer", FakeAnalyzer())
+        
+        first = app_module.analyze_jtbd_cached("интервью")
+        assert app_module.analyze_jtbd_cached("интервью") == first
+        app_module.analyze_jtbd_cached("сбой")
+        app_module.analyze_jtbd_cached("сбой")
+        
+        assert calls == ["интервью", "сбой", "сбой"]
+        assert len(list(tmp_path.glob("*.json"))) == 1
+        
+        # Новая версия промпта/схемы — новый ключ кеша
+        monkeypatch.setattr(app_module, "JTBD_PROMPT_FINGERPRINT", "changed")
+        app_module.analyze_jtbd_cached("интервью")
+        assert calls[-1] == "интервью"
@@ -5,12 +5,9 @@ Unit-тесты для stt_corrections.py
 
 import pytest
 from pathlib import Path
-import sys
 import json
 import tempfile
 
-sys.path.insert(0, str(Path(__file__).parent.parent.parent / "core"))
-
 from stt_corrections import TranscriptionCorrector, correct_transcription
 
 
@@ -25,28 +22,22 @@ class TestTranscriptionCorrector:
         assert len(corrector.corrections) > 0
         assert isinstance(corrector.phonetic_patterns, list)
     
-    def test_basic_corrections_loaded(self):
+    def test_basic_corrections_loaded(self, corrector):
         """Тест загрузки базовых исправлений"""
-        corrector = TranscriptionCorrector()
-        
         # Проверяем что есть базовые исправления
         assert "иришка" in corrector.corrections
         assert corrector.corrections["иришка"] == "ИИшка"
     
-    def test_correct_simple_word(self):
+    def test_correct_simple_word(self, corrector):
         """Тест простого исправления слова"""
-        corrector = TranscriptionCorrector()
-        
         text = "Я слышал про иришка"
         result = corrector.correct(text)
         
         assert "ИИшка" in result
         assert "иришка" not in result.lower() or "иришка" == "ИИшка".lower()
     
-    def test_correct_multiple_words(self):
+    def test_correct_multiple_words(self, corrector):
         """Тест исправления нескольких слов"""
-        corrector = TranscriptionCorrector()
-        
         text = "иришка и мелишка и свита"
         result = corrector.correct(text)
         
@@ -54,49 +45,39 @@ class TestTranscriptionCorrector:
         assert "милишка" in result
         assert "свит" in result
     
-    def test_correct_preserves_punctuation(self):
+    def test_correct_preserves_punctuation(self, corrector):
         """Тест сохранения пунктуации"""
-        corrector = TranscriptionCorrector()
-        
         text = "Это иришка, мелишка."
         result = corrector.correct(text)
         
         assert "," in result
         assert "." in result
     
-    def test_correct_case_insensitive(self):
+    def test_correct_case_insensitive(self, corrector):
         """Тест что исправления не зависят от регистра"""
-        corrector = TranscriptionCorrector()
-        
         text = "ИРИШКА Иришка иришка"
         result = corrector.correct(text)
         
         # Все варианты должны быть исправлены
         assert result.count("ИИшка") >= 3 or "иришка" not in result.lower()
     
-    def test_phonetic_patterns(self):
+    def test_phonetic_patterns(self, corrector):
         """Тест фонетических паттернов (regex)"""
-        corrector = TranscriptionCorrector()
-        
         text = "Текст с иришка внутри"
         result = corrector.correct(text, use_phonetic=True)
         
         # Должен применить regex паттерны
         assert "ИИшка" in result or "иришка" not in result.lower()
     
-    def test_correct_without_phonetic(self):
+    def test_correct_without_phonetic(self, corrector):
         """Тест без фонетических паттернов"""
-        corrector = TranscriptionCorrector()
-        
         text = "Обычный текст"
         result = corrector.correct(text, use_phonetic=False)
         
         assert result == text
     
-    def test_add_correction(self):
+    def test_add_correction(self, corrector):
         """Тест добавления нового исправления"""
-        corrector = TranscriptionCorrector()
-        
         corrector.add_correction("тест", "ТЕСТ")
         
         text = "Это тест"
@@ -104,10 +85,14 @@ class TestTranscriptionCorrector:
         
         assert "ТЕСТ" in result
     
-    def test_add_phonetic_pattern(self):
-        """Тест добавления фонетического паттерна"""
-        corrector = TranscriptionCorrector()
+    def test_add_corrections_batch(self, corrector):
+        """Тест добавления нескольких замен одним вызовом"""
+        corrector.add_corrections({"Кубер": "Kubernetes", "докер": "Docker"})
         
+        assert corrector.correct("кубер и докер", use_phonetic=False) == "Kubernetes и Docker"
+    
+    def test_add_phonetic_pattern(self, corrector):
+        """Тест добавления фонетического паттерна"""
         corrector.add_phonetic_pattern(r'\bтест\b', 'TEST')
         
         text = "Это тест текста"
@@ -116,39 +101,43 @@ class TestTranscriptionCorrector:
         assert "TEST" in result
 
 
+    def test_copy_does_not_share_mutable_state(self, corrector):
+        """Замены и паттерны, добавленные в копию, не попадают в оригинал"""
+        import copy
+        
+        clone = copy.copy(corrector)
+        clone.add_correction("кубер", "Kubernetes")
+        clone.add_phonetic_pattern(r'\bдокер\b', 'Docker')
+        
+        assert clone.correct("кубер и докер") == "Kubernetes и Docker"
+        assert corrector.correct("кубер и докер") == "кубер и докер"
+
+
 class TestCorrectionEdgeCases:
     """Тесты граничных случаев"""
     
-    def test_empty_text(self):
+    def test_empty_text(self, corrector):
         """Тест пустого текста"""
-        corrector = TranscriptionCorrector()
-        
         result = corrector.correct("")
         
         assert result == ""
     
-    def test_text_without_corrections(self):
+    def test_text_without_corrections(self, corrector):
         """Тест текста без исправлений"""
-        corrector = TranscriptionCorrector()
-        
         text = "Обычный текст без ошибок"
         result = corrector.correct(text)
         
         assert result == text
     
-    def test_only_punctuation(self):
+    def test_only_punctuation(self, corrector):
         """Тест текста только из пунктуации"""
-        corrector = TranscriptionCorrector()
-        
         text = "... !!! ???"
         result = corrector.correct(text)
         
         assert result == text
     
-    def test_unicode_text(self):
+    def test_unicode_text(self, corrector):
         """Тест с unicode символами"""
-        corrector = TranscriptionCorrector()
-        
         text = "Текст с эмодзи 🎉 и иришка"
         result = corrector.correct(text)
         
@@ -158,11 +147,9 @@ class TestCorrectionEdgeCases:
 class TestCorrectionWithCustomDict:
     """Тесты с кастомными словарями"""
     
-    def test_load_custom_corrections(self, test_corrections_file):
+    def test_load_custom_corrections(self, corrector, test_corrections_file):
         """Тест загрузки кастомных исправлений из файла"""
         # Создаём новый корректор и подменяем путь к файлу
-        corrector = TranscriptionCorrector()
-        
         # Добавляем кастомные исправления вручную
         corrector.corrections["тест"] = "TEST"
         corrector.corrections["пример"] = "EXAMPLE"
@@ -173,10 +160,8 @@ class TestCorrectionWithCustomDict:
         assert "TEST" in result
         assert "EXAMPLE" in result
     
-    def test_merge_corrections(self):
+    def test_merge_corrections(self, corrector):
         """Тест слияния базовых и кастомных исправлений"""
-        corrector = TranscriptionCorrector()
-        
         # Базовые должны остаться
         assert "иришка" in corrector.corrections
         
@@ -187,6 +172,31 @@ class TestCorrectionWithCustomDict:
         assert "иришка" in corrector.corrections
 
 
+class TestCorrectionsFileCache:
+    """Тесты кеширования JSON со словарём исправлений"""
+    
+    def test_cached_load_parses_file_once(self, test_corrections_file):
+        """Повторная загрузка того же файла не перечитывает JSON"""
+        from stt_corrections import _load_corrections_cached
+        
+        mtime = Path(test_corrections_file).stat().st_mtime
+        first = _load_corrections_cached(test_corrections_file, mtime)
+        second = _load_corrections_cached(test_corrections_file, mtime)
+        
+        assert first == {"тест": "TEST", "пример": "EXAMPLE"}
+        assert second is first
+    
+    def test_flattened_dictionary_is_pickled_next_to_json(self, test_corrections_file):
+        """Следующий процесс читает уже объединённый словарь из .pkl"""
+        from stt_corrections import _read_corrections_file
+        
+        json_path = Path(test_corrections_file)
+        first = _read_corrections_file(json_path)
+        
+        assert json_path.with_suffix('.pkl').exists()
+        assert _read_corrections_file(json_path) == first == {"тест": "TEST", "пример": "EXAMPLE"}
+
+
 class TestGlobalCorrector:
     """Тесты глобальной функции correct_transcription"""
     
@@ -209,10 +219,8 @@ class TestGlobalCorrector:
 class TestCorrectionPerformance:
     """Тесты производительности"""
     
-    def test_large_text_correction(self):
+    def test_large_text_correction(self, corrector):
         """Тест исправления большого текста"""
-        corrector = TranscriptionCorrector()
-        
         # Большой текст (10000 слов)
         text = " ".join(["слово"] * 10000)
         
@@ -221,10 +229,8 @@ class TestCorrectionPerformance:
         assert len(result) > 0
         assert "слово" in result
     
-    def test_many_corrections(self):
+    def test_many_corrections(self, corrector):
         """Тест с множеством исправлений"""
-        corrector = TranscriptionCorrector()
-        
         # Добавляем 100 исправлений
         for i in range(100):
             corrector.add_correction(f"слово{i}", f"СЛОВО{i}")
@@ -234,3 +240,107 @@ class TestCorrectionPerformance:
         
         assert "СЛОВО0" in result
         assert "СЛОВО1" in result
+
+
+class TestCorrectionMatcher:
+    """Тесты поиска по словарю (Aho–Corasick и regex fallback)"""
+    
+    @pytest.mark.parametrize("use_automaton", [True, False])
+    def test_multiword_keys_and_layout(self, monkeypatch, use_automaton):
+        """Многословные ключи исправляются, разметка текста сохраняется"""
+        import stt_corrections
+        
+        if not use_automaton:
+            monkeypatch.setattr(stt_corrections, "ahocorasick", None)
+        corrector = TranscriptionCorrector()
+        
+        text = "Спикер 1: эс кю эль, иришка.\n\nСпикер 2: испринг"
+        result = corrector.correct(text, use_phonetic=False)
+        
+        assert result == "Спикер 1: SQL, ИИшка.\n\nСпикер 2: iSpring"
+    
+    def test_offsets_survive_length_changing_casefold(self):
+        """Символы, меняющие длину при casefold(), не сдвигают замены"""
+        corrector = TranscriptionCorrector()
+        
+        text = "Straße\tАПИ  и ЛМС"
+        result = corrector.correct(text, use_phonetic=False)
+        
+        assert result == "Straße\tAPI  и LMS"
+    
+    def test_same_size_dictionary_edit_rebuilds_matcher(self):
+        """Прямая правка словаря без изменения размера перестраивает автомат"""
+        corrector = TranscriptionCorrector()
+        corrector.correct("апи")
+        version = corrector.version
+        
+        del corrector.corrections["апи"]
+        corrector.corrections["кубер"] = "Kubernetes"
+        
+        assert corrector.correct("апи и кубер", use_phonetic=False) == "апи и Kubernetes"
+        assert corrector.version > version
+
+
+class TestPhoneticPrefilter:
+    """Тесты префильтра фонетических паттернов"""
+    
+    @pytest.mark.parametrize("pattern, literal", [
+        (r'\bи+ришка\b', 'иришка'),
+        (r'\bай\s*спринг\b', 'спринг'),
+        (r'\bab+c\b', 'ab'),
+        (r'\bн?у\b', None),
+        (r'\b(\w+)\s+\1\b', None),
+        (r'\bнапример\b(?!\s+\w)', 'например'),
+        (r'(?<!\w)ну(?=\s)', 'ну'),
+        (r'\bну(?=[,.])', None),
+    ])
+    def test_required_literal(self, pattern, literal):
+        """Обязательная подстрока извлекается только из простых паттернов"""
+        from stt_corrections import _required_literal
+        
+        assert _required_literal(pattern) == literal
+    
+    def test_patterns_without_literal_in_text_are_skipped(self):
+        """Паттерны, которые не могут совпасть, не попадают в alternation"""
+        corrector = TranscriptionCorrector()
+        
+        assert corrector.correct("Обычный текст без терминов") == "Обычный текст без терминов"
+        assert corrector._phonetic_regex_cache == {}
+        
+        assert corrector.correct("Айспринг и ииишка") == "iSpring и ИИшка"
+
+
+class TestStreamingCorrector:
+    """Тесты потокового исправления"""
+    
+    def test_chunks_split_inside_keys_match_whole_text(self):
+        """Ключи, разрезанные между частями, исправляются как в целом тексте"""
+        from stt_corrections import StreamingCorrector
+        
+        corrector = TranscriptionCorrector()
+        text = "Спикер 1: мы подключили эс кю эль и апи, иришка помогла.\n\nСпикер 2: испринг " * 5
+        
+        streaming = StreamingCorrector(corrector, holdback=16)
+        parts = [streaming.feed(text[i:i + 7]) for i in range(0, len(text), 7)]
+        parts.append(streaming.flush())
+        
+        assert ''.join(parts) == corrector.correct(text)
+        assert any(parts[:-1])  # Текст выдаётся по ходу, а не только в flush()
+    
+    def test_work_is_linear_in_stream_length(self):
+        """Каждая часть исправляет только новый текст и окно вокруг разреза"""
+        from stt_corrections import StreamingCorrector
+        
+        corrector = TranscriptionCorrector()
+        text = "мы подключили эс кю эль и апи, иришка помогла. " * 400
+        streaming = StreamingCorrector(corrector, holdback=16)
+        corrected_chars = []
+        correct = streaming._correct
+        streaming._correct = lambda part: corrected_chars.append(len(part)) or correct(part)
+        
+        parts = [streaming.feed(text[i:i + 7]) for i in range(0, len(text), 7)]
+        parts.append(streaming.flush())
+        
+        assert ''.join(parts) == corrector.correct(text)
+        window = max(16, streaming._longest_key + 1)
+        assert sum(corrected_chars) <= len(text) + len(parts) * 8 * window
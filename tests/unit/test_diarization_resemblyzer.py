@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Unit-тесты для speaker_diarization_resemblyzer.py
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from speaker_diarization_resemblyzer import (
+    SpeakerDiarizationResemblyzer,
+    cluster_embeddings,
+    load_audio_16k,
+)
+
+
+class TestResemblyzerDiarization:
+    """Тесты загрузки аудио, кластеризации и кеша embeddings"""
+    
+    def test_load_audio_16k_streams_like_one_shot_resample(self, tmp_path):
+        """Поблочное чтение с потоковым ресемплингом даёт тот же сигнал, что ресемплинг целиком"""
+        sf = pytest.importorskip("soundfile")
+        soxr = pytest.importorskip("soxr")
+        
+        t = np.arange(44100 * 3) / 44100
+        stereo = np.stack([np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 330 * t)], axis=1).astype(np.float32) / 2
+        sf.write(tmp_path / "a.wav", stereo, 44100)
+        
+        wav = load_audio_16k(str(tmp_path / "a.wav"))
+        expected = soxr.resample(stereo.mean(axis=1), 44100, 16000)
+        
+        assert wav.dtype == np.float32
+        assert len(wav) == len(expected)
+        assert np.abs(wav - expected).max() < 1e-3
+    
+    def test_kmeans_clustering_matches_agglomerative(self):
+        """KMeans на нормированных embeddings разбивает окна так же, как cosine/average"""
+        pytest.importorskip("sklearn")
+        
+        rng = np.random.default_rng(0)
+        centers = rng.normal(0, 1, (3, 64))
+        embeddings = np.vstack([center + rng.normal(0, 0.2, (40, 64)) for center in centers])
+        
+        def partition(labels):
+            return {frozenset(np.flatnonzero(labels == label)) for label in set(labels)}
+        
+        assert partition(cluster_embeddings(embeddings, 3, "kmeans")) == partition(
+            cluster_embeddings(embeddings, 3, "agglomerative")
+        )
+    
+    def test_resemblyzer_embeddings_cached_by_audio_content(self, monkeypatch, tmp_path):
+        """Embeddings окон того же аудио берутся из кеша — encoder не запускается повторно"""
+        diarizer = SpeakerDiarizationResemblyzer(cache_dir=tmp_path)
+        calls = []
+        
+        def fake_embed_windows(audio_file, min_segment_duration):
+            calls.append(audio_file)
+            return np.eye(3, dtype=np.float32), [0.0, 1.0, 2.0], 3.5
+        
+        monkeypatch.setattr(diarizer, "_embed_windows", fake_embed_windows)
+        audio = tmp_path / "a.ogg"
+        audio.write_bytes(b"OggS" + b"\x01" * 100)
+        copy = tmp_path / "b.ogg"
+        copy.write_bytes(audio.read_bytes())
+        
+        first = diarizer._embed_windows_cached(str(audio), 1.0)
+        second = diarizer._embed_windows_cached(str(copy), 1.0)
+        
+        assert calls == [str(audio)]
+        assert np.array_equal(second[0], first[0])
+        assert second[1:] == ([0.0, 1.0, 2.0], 3.5)
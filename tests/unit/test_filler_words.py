@@ -4,10 +4,6 @@ Unit-тесты для filler_words_filter.py
 """
 
 import pytest
-from pathlib import Path
-import sys
-
-sys.path.insert(0, str(Path(__file__).parent.parent.parent / "core"))
 
 from filler_words_filter import FillerWordsFilter, clean_filler_words
 
@@ -24,99 +20,69 @@ class TestFillerWordsFilter:
         assert isinstance(filter.patterns, list)
         assert len(filter.patterns) > 0
     
-    def test_russian_fillers_loaded(self):
+    def test_russian_fillers_loaded(self, filler):
         """Тест загрузки русских слов-паразитов"""
-        filter = FillerWordsFilter()
-        
         # Проверяем наличие базовых русских паттернов
-        patterns_str = " ".join(filter.russian_fillers)
+        patterns_str = " ".join(filler.russian_fillers)
         assert r"\bну\b" in patterns_str
         assert r"\bво+т\b" in patterns_str
         assert r"\bэ+" in patterns_str
     
-    def test_english_fillers_loaded(self):
+    def test_english_fillers_loaded(self, filler):
         """Тест загрузки английских слов-паразитов"""
-        filter = FillerWordsFilter()
-        
-        patterns_str = " ".join(filter.english_fillers)
+        patterns_str = " ".join(filler.english_fillers)
         assert r"\bum+" in patterns_str or r"\buh+" in patterns_str
 
 
 class TestFillerWordsCleaning:
     """Тесты очистки текста"""
     
-    def test_clean_russian_sounds(self):
-        """Тест удаления русских звуков-паразитов"""
-        filter = FillerWordsFilter()
-        
-        text = "Эээ я думаю что ммм это хорошо"
-        result = filter.clean(text)
-        
-        # Звуки должны быть удалены
-        assert "Эээ" not in result or result.startswith("Я")
-        assert "ммм" not in result.lower()
-    
-    def test_clean_russian_words(self):
-        """Тест удаления русских слов-паразитов"""
-        filter = FillerWordsFilter()
-        
-        text = "Ну вот короче типа это хорошо"
-        result = filter.clean(text)
-        
-        # Слова-паразиты должны быть удалены
-        assert "хорошо" in result
-        # Проверяем что паразиты убраны (могут остаться пробелы)
-        assert "вот" not in result or "короче" not in result or "типа" not in result
-    
-    def test_clean_preserves_content(self):
-        """Тест сохранения смыслового содержания"""
-        filter = FillerWordsFilter()
-        
-        text = "Это важный текст про результат"
-        result = filter.clean(text)
-        
-        assert "важный" in result
-        assert "текст" in result
-        assert "результат" in result
+    @pytest.mark.parametrize("text, must_keep, must_remove", [
+        # Звуки-паразиты
+        ("Эээ я думаю что ммм это хорошо", ["думаю", "хорошо"], ["эээ", "ммм"]),
+        # Слова-паразиты
+        ("Ну вот короче типа это хорошо", ["хорошо"], ["вот", "короче", "типа"]),
+        # Смысловой текст не трогается
+        ("Это важный текст про результат", ["важный", "текст", "результат"], []),
+        ("Чистый профессиональный текст.", ["профессиональный", "текст"], []),
+        # Повторы
+        ("Я я думаю и и это хорошо", ["думаю"], ["я я", "и и"]),
+        # Смешанный русский и английский
+        ("Эээ это um текст like на двух языках", ["текст", "языках"], ["эээ", " um ", "like"]),
+        # Unicode
+        ("Текст с эмодзи 🎉 ну вот и символами", ["🎉", "символами"], [" ну ", " вот "]),
+    ], ids=["sounds", "words", "content", "clean_text", "repeats", "mixed", "unicode"])
+    def test_clean_cases(self, filler, text, must_keep, must_remove):
+        """Смысловые слова остаются, паразиты и повторы удаляются"""
+        result = filler.clean(text).lower()
+        
+        for word in must_keep:
+            assert word in result
+        for word in must_remove:
+            assert word not in result
     
-    def test_clean_removes_repeats(self):
-        """Тест удаления повторов"""
-        filter = FillerWordsFilter()
-        
-        text = "Я я думаю и и это хорошо"
-        result = filter.clean(text)
-        
-        # Повторы должны быть убраны
-        assert "я я" not in result.lower() or "и и" not in result.lower()
-    
-    def test_clean_fixes_spaces(self):
+    def test_clean_fixes_spaces(self, filler):
         """Тест нормализации пробелов"""
-        filter = FillerWordsFilter()
-        
         text = "Текст  с   множественными    пробелами"
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         # Множественные пробелы должны схлопнуться в один
         assert "  " not in result
     
-    def test_clean_fixes_punctuation_spaces(self):
+    def test_clean_fixes_punctuation_spaces(self, filler):
         """Тест удаления пробелов перед пунктуацией"""
-        filter = FillerWordsFilter()
-        
         text = "Текст , с пробелами . перед знаками !"
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         # Пробелы перед знаками должны быть убраны
         assert " ," not in result
         assert " ." not in result
         assert " !" not in result
     
-    def test_clean_capitalizes_first_letter(self):
+    def test_clean_capitalizes_first_letter(self, filler):
         """Тест заглавной буквы в начале"""
-        filter = FillerWordsFilter()
-        
         text = "текст начинается с маленькой буквы"
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         # Первая буква должна быть заглавной
         assert result[0].isupper()
@@ -125,35 +91,42 @@ class TestFillerWordsCleaning:
 class TestAggressiveCleaning:
     """Тесты агрессивной очистки"""
     
-    def test_aggressive_removes_single_letters(self):
+    def test_aggressive_removes_single_letters(self, filler):
         """Тест удаления одиночных букв"""
-        filter = FillerWordsFilter()
-        
         text = "Это б текст д с буквами"
-        result = filter.clean(text, aggressive=True)
+        result = filler.clean(text, aggressive=True)
         
         # Одиночные буквы (кроме а, и) должны быть удалены
         assert " б " not in result
         assert " д " not in result
     
-    def test_aggressive_preserves_a_i(self):
+    def test_aggressive_preserves_a_i(self, filler):
         """Тест удаления междометий в агрессивном режиме"""
-        filter = FillerWordsFilter()
-        
         # "а" и "и" как междометия удаляются базовыми паттернами
         text = "Это а и то"
-        result = filter.clean(text, aggressive=True)
+        result = filler.clean(text, aggressive=True)
         
         # Проверяем что текст очищен и осталось только основное
         assert "это" in result.lower()
         assert "то" in result.lower()
     
-    def test_aggressive_fixes_punctuation_repeats(self):
+    def test_single_letter_regex_matches_lookahead_form(self):
+        """Класс без "а"/"и" удаляет те же буквы, что прежний паттерн с lookahead"""
+        import re
+        import random
+        from filler_words_filter import _SINGLE_LETTER_RE
+        
+        reference = re.compile(r'\b(?![аиАИ])[а-яА-Яa-zA-Z]\b')
+        pieces = list("аиАИйЙяЯбБзЗёЁzZ ,.-_1\n") + ["текст ", "слово "]
+        rng = random.Random(0)
+        for _ in range(3000):
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 20)))
+            assert _SINGLE_LETTER_RE.sub('', text) == reference.sub('', text), repr(text)
+    
+    def test_aggressive_fixes_punctuation_repeats(self, filler):
         """Тест удаления повторяющихся знаков препинания"""
-        filter = FillerWordsFilter()
-        
         text = "Что это!!! Да???"
-        result = filter.clean(text, aggressive=True)
+        result = filler.clean(text, aggressive=True)
         
         # Повторы должны схлопнуться
         assert "!!!" not in result
@@ -165,79 +138,163 @@ class TestAggressiveCleaning:
 class TestEdgeCases:
     """Тесты граничных случаев"""
     
-    def test_empty_text(self):
+    def test_empty_text(self, filler):
         """Тест пустого текста"""
-        filter = FillerWordsFilter()
-        
-        result = filter.clean("")
+        result = filler.clean("")
         
         assert result == ""
     
-    def test_only_filler_words(self):
+    def test_only_filler_words(self, filler):
         """Тест текста только из слов-паразитов"""
-        filter = FillerWordsFilter()
-        
         text = "Ну эээ ммм вот"
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         # Результат может быть пустым или почти пустым
         assert len(result) < len(text)
-    
-    def test_no_filler_words(self):
-        """Тест текста без слов-паразитов"""
-        filter = FillerWordsFilter()
-        
-        text = "Чистый профессиональный текст."
-        result = filter.clean(text)
-        
-        # Текст должен остаться почти неизменным
-        assert "профессиональный" in result
-        assert "текст" in result
-    
-    def test_mixed_russian_english(self):
-        """Тест смешанного текста"""
-        filter = FillerWordsFilter()
-        
-        text = "Эээ это um текст like на двух языках"
-        result = filter.clean(text)
-        
-        assert "текст" in result
-        assert "языках" in result
-    
-    def test_unicode_content(self):
-        """Тест с unicode символами"""
-        filter = FillerWordsFilter()
-        
-        text = "Текст с эмодзи 🎉 ну вот и символами"
-        result = filter.clean(text)
-        
-        assert "🎉" in result
 
 
 class TestCustomFillers:
     """Тесты добавления кастомных слов-паразитов"""
     
-    def test_add_custom_filler(self):
+    def test_add_custom_filler(self, filler_fresh):
         """Тест добавления своего паттерна"""
-        filter = FillerWordsFilter()
-        
-        filter.add_filler(r'\bкак_бы\b')
+        filler_fresh.add_filler(r'\bкак_бы\b')
         
         text = "Это как_бы хороший текст"
-        result = filter.clean(text)
+        result = filler_fresh.clean(text)
         
         assert "как_бы" not in result
     
-    def test_show_fillers(self):
-        """Тест получения списка паттернов"""
-        filter = FillerWordsFilter()
+    def test_add_filler_applies_to_previously_cleaned_text(self, filler_fresh):
+        """Новый паттерн применяется и к тексту, который уже чистили"""
+        text = "Это как_бы хороший текст"
+        assert filler_fresh.clean(text) == filler_fresh.clean(text) == text
         
-        patterns = filter.show_fillers()
+        filler_fresh.add_filler(r'\bкак_бы\b')
+        
+        assert filler_fresh.clean(text) == "Это хороший текст"
+    
+    def test_patterns_appended_directly_are_applied(self, filler_fresh):
+        """Паттерн, добавленный в patterns напрямую, тоже применяется"""
+        filler_fresh.clean("Разогрев")
+        
+        filler_fresh.patterns.append(r'\bзначится\b')
+        
+        assert filler_fresh.clean("Значится хороший текст") == "Хороший текст"
+    
+    def test_patterns_apply_in_order_to_previous_result(self, filler):
+        """Каждый паттерн работает по тексту, очищенному предыдущими"""
+        # "например" без продолжения удаляется, только когда следующее "ну" уже убрано
+        assert filler.clean("Хорошо, например ну") == "Хорошо,"
+    
+    def test_literal_first_patterns_match_the_same(self):
+        """Переписанные паттерны находят ровно те же совпадения, что исходные"""
+        import re
+        import random
+        from filler_words_filter import _literal_first
+        
+        pieces = list("эмаоуынвтк-") + [" ", "\n", ",", "1", "_", "Э", "Н", "мм", "ну", "вот", "like ", "I mean"]
+        rng = random.Random(0)
+        texts = ["".join(rng.choice(pieces) for _ in range(40)) for _ in range(300)]
+        
+        for pattern in FillerWordsFilter().patterns:
+            rewritten = re.compile(_literal_first(pattern), re.IGNORECASE)
+            original = re.compile(pattern, re.IGNORECASE)
+            for text in texts:
+                assert [m.span() for m in rewritten.finditer(text)] == \
+                    [m.span() for m in original.finditer(text)], (pattern, text)
+    
+    def test_show_fillers(self, filler):
+        """Тест получения списка паттернов"""
+        patterns = filler.show_fillers()
         
         assert isinstance(patterns, list)
         assert len(patterns) > 0
 
 
+class TestLiteralPrefilter:
+    """Тесты префильтра паттернов по обязательным подстрокам"""
+    
+    def test_automaton_prefilter_matches_plain_checks(self, monkeypatch):
+        """С автоматом pyahocorasick и без него результат clean() одинаковый"""
+        pytest.importorskip("ahocorasick")
+        import filler_words_filter
+        
+        texts = [
+            "Чистый текст про внедрение системы обучения",
+            "Эээ ну вот я думаю что это хорошо короче типа",
+            "В общем-то это самое, понимаешь, реально важно.\n\nКстати like you know",
+            "Хорошо, например ну",
+        ]
+        with_automaton = filler_words_filter.FillerWordsFilter()
+        with_automaton.clean("Разогрев")  # паттерны компилируются при первом clean()
+        assert with_automaton._literal_automaton is not None
+        
+        monkeypatch.setattr(filler_words_filter, "ahocorasick", None)
+        without_automaton = filler_words_filter.FillerWordsFilter()
+        
+        for text in texts:
+            assert with_automaton.clean(text) == without_automaton.clean(text)
+
+
+class TestLayoutNormalization:
+    """Тесты нормализации пробелов и блоков спикеров"""
+    
+    def test_matches_per_block_reference(self):
+        """Нормализация пробелов совпадает с прежней поблочной реализацией"""
+        import re
+        import random
+        from filler_words_filter import FillerWordsFilter
+        
+        def reference(text):
+            blocks = []
+            for block in text.split('\n\n'):
+                block = re.sub(r'[ \t]+', ' ', block)
+                block = re.sub(r'\n+', '\n', block)
+                block = re.sub(r'\s+([,.!?])', r'\1', block).strip()
+                if block:
+                    blocks.append(block)
+            result = '\n\n'.join(blocks)
+            return result[0].upper() + result[1:] if result else result
+        
+        # Без паттернов: проверяется только нормализация
+        filter_without_patterns = FillerWordsFilter()
+        filter_without_patterns.patterns = []
+        
+        pieces = [" ", "  ", "\t", "\n", "\n", "\n", "\r", ",", ".", "!", "Я", "текст"]
+        rng = random.Random(0)
+        for _ in range(3000):
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 16)))
+            assert filter_without_patterns.clean(text) == reference(text), repr(text)
+
+
+class TestCleanBatch:
+    """Тесты пакетной очистки"""
+    
+    @pytest.mark.parametrize("aggressive", [False, True])
+    def test_matches_per_text_clean(self, filler, aggressive):
+        """clean_batch даёт то же, что clean() для каждого текста"""
+        texts = [
+            "Эээ ну вот я думаю что это хорошо",
+            "",
+            "Хорошо, например ну",
+            "Я я думаю что э это хорошо",
+            "Спикер 1: ну типа да\n\nСпикер 2: б в общем нет!!",
+            "например",
+            "   ",
+        ]
+        
+        assert filler.clean_batch(texts, aggressive) == [filler.clean(t, aggressive) for t in texts]
+        assert filler.clean_batch([], aggressive) == []
+    
+    def test_custom_patterns_fall_back_to_per_text(self, filler_fresh):
+        """Свой паттерн может захватить разделитель — тогда тексты чистятся по одному"""
+        filler_fresh.add_filler(r'ну.')
+        texts = ["Хорошо ну", "Да"]
+        
+        assert filler_fresh.clean_batch(texts) == [filler_fresh.clean(t) for t in texts]
+
+
 class TestGlobalFunction:
     """Тесты глобальной функции clean_filler_words"""
     
@@ -260,25 +317,21 @@ class TestGlobalFunction:
 class TestPerformance:
     """Тесты производительности"""
     
-    def test_large_text(self):
+    def test_large_text(self, filler):
         """Тест очистки большого текста"""
-        filter = FillerWordsFilter()
-        
         # Большой текст с настоящими словами (не только "слово")
         text = " ".join(["важное слово"] * 1000)
         
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         assert len(result) > 0
         assert "важное" in result or "слово" in result
     
-    def test_many_fillers(self):
+    def test_many_fillers(self, filler):
         """Тест текста с множеством слов-паразитов"""
-        filter = FillerWordsFilter()
-        
         text = "ну " * 1000 + "важный текст"
         
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         # Текст должен быть короче (слова-паразиты убраны)
         assert len(result) < len(text)
@@ -289,12 +342,10 @@ class TestPerformance:
 class TestRealWorldExamples:
     """Тесты на реальных примерах"""
     
-    def test_interview_transcript(self):
+    def test_interview_transcript(self, filler):
         """Тест транскрипта интервью"""
-        filter = FillerWordsFilter()
-        
         text = "Эээ ну вот я думаю что эээ это хорошо короче"
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         # Должен остаться смысл
         assert "думаю" in result
@@ -302,12 +353,10 @@ class TestRealWorldExamples:
         # Паразиты убраны
         assert result.count("эээ") < text.count("эээ")
     
-    def test_presentation_transcript(self):
+    def test_presentation_transcript(self, filler):
         """Тест транскрипта презентации"""
-        filter = FillerWordsFilter()
-        
         text = "Вообще наверное кстати это важный момент в принципе"
-        result = filter.clean(text)
+        result = filler.clean(text)
         
         # Основной смысл сохранён
         assert "важный" in result
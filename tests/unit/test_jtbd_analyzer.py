@@ -4,10 +4,11 @@ Unit-тесты для JTBDAnalyzer.
 """
 
 import json as json_module
+from types import SimpleNamespace
 
 import pytest
 
-from core.jtbd_analyzer import JTBDAnalyzer
+from core.jtbd_analyzer import BATCH_API_MIN_TEXTS, JTBDAnalyzer
 
 
 class FakeResponse:
@@ -68,3 +69,241 @@ def test_apinet_analyze_parses_json(monkeypatch):
     assert result["metadata"]["provider"] == "apinet"
     assert result["metadata"]["input_tokens"] == 12
     assert result["metadata"]["output_tokens"] == 34
+
+
+def test_apinet_analyze_batch_preserves_order(monkeypatch):
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        text = json["messages"][1]["content"]
+        summary = "first" if "Первый текст" in text else "second"
+        return FakeResponse({
+            "choices": [{"message": {"content": json_module.dumps({"summary": summary})}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+        })
+    monkeypatch.setattr("core.jtbd_analyzer.requests.post", fake_post)
+
+    analyzer = JTBDAnalyzer()
+    results = analyzer.analyze_batch(["Первый текст", "Второй текст", ""])
+
+    assert [r["summary"] for r in results[:2]] == ["first", "second"]
+    assert results[2]["metadata"]["error"] == "Пустой текст"
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.text_stream = iter(chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def get_final_message(self):
+        usage = type("Usage", (), {"input_tokens": 5, "output_tokens": 7})()
+        return type("Message", (), {"usage": usage})()
+
+
+def test_anthropic_analyze_collects_streamed_text(monkeypatch):
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+    analyzer = JTBDAnalyzer()
+    analyzer.provider = "anthropic"
+
+    streamed = {"calls": 0}
+
+    def fake_stream(**kwargs):
+        streamed["calls"] += 1
+        streamed["content"] = kwargs["messages"][0]["content"]
+        return FakeStream(['{"summary": ', '"stream', 'ed", "jobs": []}'])
+
+    analyzer.client = type("Client", (), {})()
+    analyzer.client.messages = type("Messages", (), {"stream": staticmethod(fake_stream)})()
+
+    result = analyzer.analyze("Пример транскрипции")
+
+    assert streamed["calls"] == 1
+    assert streamed["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert "Пример транскрипции" in streamed["content"][1]["text"]
+    assert result["summary"] == "streamed"
+    assert result["metadata"]["input_tokens"] == 5
+    assert result["metadata"]["output_tokens"] == 7
+
+
+def test_anthropic_analyze_batch_uses_batches_api(monkeypatch):
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+    analyzer = JTBDAnalyzer()
+    analyzer.provider = "anthropic"
+
+    submitted = {}
+
+    def create(requests):
+        submitted["requests"] = requests
+        return SimpleNamespace(id="batch_1", processing_status="in_progress")
+
+    def retrieve(batch_id):
+        return SimpleNamespace(id=batch_id, processing_status="ended")
+
+    def results(batch_id):
+        for request in reversed(submitted["requests"]):
+            message = SimpleNamespace(
+                content=[SimpleNamespace(
+                    type="tool_use", name="emit_jtbd", input={"summary": request["custom_id"]},
+                )],
+                usage=SimpleNamespace(input_tokens=1, output_tokens=1),
+            )
+            yield SimpleNamespace(
+                custom_id=request["custom_id"],
+                result=SimpleNamespace(type="succeeded", message=message),
+            )
+
+    analyzer.client = SimpleNamespace(messages=SimpleNamespace(
+        batches=SimpleNamespace(create=create, retrieve=retrieve, results=results),
+    ))
+
+    texts = [f"Текст {i}" for i in range(BATCH_API_MIN_TEXTS)] + [" "]
+    output = analyzer.analyze_batch(texts, poll_interval=0)
+
+    assert len(submitted["requests"]) == BATCH_API_MIN_TEXTS
+    assert [r["summary"] for r in output[:-1]] == [f"t{i}" for i in range(BATCH_API_MIN_TEXTS)]
+    assert output[-1]["metadata"]["error"] == "Пустой текст"
+
+
+class FakeAsyncStream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    async def get_final_message(self):
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=1, output_tokens=1))
+
+
+def test_anthropic_analyze_batch_opens_async_client_per_call(monkeypatch):
+    import asyncio
+
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+    analyzer = JTBDAnalyzer()
+    analyzer.provider = "anthropic"
+
+    clients = []
+
+    class FakeAsyncClient:
+        def __init__(self):
+            self.loops = set()
+            self.closed = False
+            self.messages = SimpleNamespace(stream=self.stream)
+            clients.append(self)
+
+        def stream(self, **kwargs):
+            self.loops.add(asyncio.get_running_loop())
+            return FakeAsyncStream(['{"summary": "ok"}'])
+
+        async def close(self):
+            self.closed = True
+
+    analyzer._new_async_client = FakeAsyncClient
+
+    for _ in range(2):
+        results = analyzer.analyze_batch(["Первый текст", "Второй текст"])
+        assert [r["summary"] for r in results] == ["ok", "ok"]
+
+    # Каждый вызов — свой loop, свой клиент, закрытый в конце
+    assert len(clients) == 2
+    assert all(client.closed and len(client.loops) == 1 for client in clients)
+    assert clients[0].loops != clients[1].loops
+
+
+def test_analyze_batch_inside_running_loop_uses_sync_client(monkeypatch):
+    import asyncio
+
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+    analyzer = JTBDAnalyzer()
+    monkeypatch.setattr(analyzer, "analyze", lambda text, max_tokens=4000: {"summary": text})
+
+    async def run_inside_loop():
+        return analyzer.analyze_batch(["Первый текст", "Второй текст"])
+
+    results = asyncio.run(run_inside_loop())
+
+    assert [r["summary"] for r in results] == ["Первый текст", "Второй текст"]
+
+
+def test_anthropic_tool_use_result_is_used_without_json_parsing(monkeypatch):
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+    analyzer = JTBDAnalyzer()
+    analyzer.provider = "anthropic"
+
+    final_message = SimpleNamespace(
+        content=[SimpleNamespace(
+            type="tool_use",
+            name="emit_jtbd",
+            input={"jobs": [{"text": "j", "quote": "q", "type": "functional", "confidence": "high"}],
+                   "pains": [], "gains": [], "context": [], "triggers": [], "summary": "tool"},
+        )],
+        usage=SimpleNamespace(input_tokens=3, output_tokens=4, cache_read_input_tokens=2),
+    )
+    captured = {}
+
+    class ToolStream(FakeStream):
+        def get_final_message(self):
+            return final_message
+
+    def fake_stream(**kwargs):
+        captured.update(kwargs)
+        return ToolStream([])
+
+    analyzer.client = SimpleNamespace(messages=SimpleNamespace(stream=fake_stream))
+
+    result = analyzer.analyze("Пример транскрипции")
+
+    assert captured["tool_choice"] == {"type": "tool", "name": "emit_jtbd"}
+    assert result["summary"] == "tool"
+    assert result["metadata"]["total_elements"] == 1
+    assert result["metadata"]["cache_read_input_tokens"] == 2
+
+
+def test_format_as_markdown_renders_each_section_attribute(monkeypatch):
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+    analyzer = JTBDAnalyzer()
+
+    markdown = analyzer.format_as_markdown({
+        "jobs": [{"text": "j", "quote": "q", "type": "functional", "confidence": "high"}],
+        "pains": [{"text": "p", "severity": "high"}],
+        "gains": [],
+        "context": [{"text": "c", "dimension": "where"}],
+        "triggers": [],
+    })
+
+    assert "## 🎯 Jobs (Работы)\n" in markdown
+    assert '  > "q"' in markdown
+    assert "  - Severity: high, Confidence: N/A\n" in markdown
+    assert "  - Dimension: where, Confidence: N/A\n" in markdown
+    assert "Gains" not in markdown and "Triggers" not in markdown
+
+
+@pytest.mark.parametrize("response_text", [
+    'Вот результат:\n```json\n{"summary": "fenced", "jobs": [{"text": "j"}]}\n```',
+    'Результат:\n```\n{"summary": "fenced", "jobs": [{"text": "j"}]}\n```\nГотово.',
+    'Результат: {"summary": "fenced", "jobs": [{"text": "j"}]} — конец.',
+])
+def test_build_result_recovers_json_from_prose(monkeypatch, response_text):
+    monkeypatch.setenv("APINET_API_KEY", "test-key")
+    analyzer = JTBDAnalyzer()
+
+    result = analyzer._build_result("текст", {
+        "response_text": response_text,
+        "usage": {"input_tokens": 1, "output_tokens": 1},
+    })
+
+    assert result["summary"] == "fenced"
+    assert result["metadata"]["total_elements"] == 1
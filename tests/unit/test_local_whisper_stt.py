@@ -3,15 +3,12 @@
 Unit-тесты для локального Whisper STT-провайдера.
 """
 
-from pathlib import Path
 from types import SimpleNamespace
 from unittest.mock import Mock
 import sys
 
 import pytest
 
-sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-
 from core.local_whisper_stt import LocalWhisperSTT, WhisperSettings
 
 
@@ -134,3 +131,28 @@ class TestLocalWhisperSTT:
         stt = FakeWhisperSTT()
 
         assert stt.delete_from_storage("anything") is None
+
+    def test_warmup_loads_model_once_under_concurrency(self, monkeypatch):
+        import threading
+        from types import ModuleType
+
+        created = []
+
+        class SlowModel:
+            def __init__(self, name, **kwargs):
+                created.append(name)
+                threading.Event().wait(0.05)
+
+        fake_module = ModuleType("faster_whisper")
+        fake_module.WhisperModel = SlowModel
+        monkeypatch.setitem(sys.modules, "faster_whisper", fake_module)
+
+        stt = LocalWhisperSTT(FakeWhisperSTT().settings)
+        threads = [threading.Thread(target=stt.warmup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert created == ["tiny"]
+        assert isinstance(stt.model, SlowModel)
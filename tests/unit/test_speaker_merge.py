@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Unit-тесты для speaker_merge.py
+"""
+
+import pytest
+
+import speaker_merge
+
+
+class TestSpeakerMerge:
+    """Тесты сопоставления слов со спикерами"""
+    
+    @pytest.mark.parametrize("segments, expected", [
+        ([{"speaker": "A", "start": 0.0, "end": 2.0},
+          {"speaker": "B", "start": 2.0, "end": 4.0},
+          {"speaker": "A", "start": 6.0, "end": 8.0}],
+         ["A", "B", "B", "A"]),
+        # Перекрывающиеся сегменты — перебор по порядку, первый подходящий
+        ([{"speaker": "B", "start": 1.0, "end": 5.0},
+          {"speaker": "A", "start": 0.0, "end": 2.0},
+          {"speaker": "A", "start": 6.0, "end": 8.0}],
+         ["B", "B", "B", "A"]),
+    ])
+    def test_merge_assigns_containing_or_nearest_segment(self, segments, expected):
+        """Слово получает спикера своего сегмента, в паузе — ближайшего"""
+        def word(start, end):
+            return {"word": "w", "startTime": f"{start}s", "endTime": f"{end}s"}
+        
+        # Внутри сегмента, в паузе ближе к B, в паузе поровну (берётся раньший), после всех
+        words = [word(0.5, 1.5), word(4.4, 4.6), word(4.9, 5.1), word(9.0, 9.0)]
+        merged = speaker_merge.merge_transcription_with_speakers(words, segments)
+        
+        assert [w["speaker"] for w in merged] == expected
+        assert speaker_merge.merge_transcription_with_speakers(words, [])[0]["speaker"] == "UNKNOWN"
+    
+    def test_parse_times_matches_per_word_parse(self):
+        """Разбор времён одним split совпадает с поэлементным, нестроковые — поэлементно"""
+        values = ["1.540s", "0s", "12.5", "3e-1s"]
+        assert speaker_merge._parse_times(values) == [speaker_merge._parse_time(value) for value in values]
+        assert speaker_merge._parse_times(["1.5s", 2.0, "3s"]) == [1.5, 2.0, 3.0]
+        assert speaker_merge._parse_times([]) == []
+        with pytest.raises(ValueError):
+            speaker_merge._parse_times(["1.5s", ""])
+    
+    def test_merge_numpy_matches_linear_scan(self, monkeypatch):
+        """Для перекрывающихся сегментов векторный путь (numba или NumPy) даёт те же спикеры, что перебор"""
+        pytest.importorskip("numpy")
+        import random
+        
+        rng = random.Random(3)
+        for _ in range(100):
+            segments = []
+            for _ in range(rng.randint(1, 20)):
+                start = round(rng.uniform(0, 50), 1)
+                segments.append({"speaker": f"S{rng.randint(0, 3)}", "start": start, "end": round(start + rng.uniform(0, 5), 1)})
+            words = []
+            for _ in range(40):
+                start = round(rng.uniform(0, 60), 2)
+                words.append({"word": "w", "startTime": f"{start}s", "endTime": f"{start + 0.25}s"})
+            
+            vectorized = speaker_merge.merge_transcription_with_speakers(words, segments)
+            with monkeypatch.context() as patch:
+                patch.setattr(speaker_merge, "_segment_indices", None)
+                assert speaker_merge.merge_transcription_with_speakers(words, segments) == vectorized
+    
+    def test_merge_numba_matches_numpy(self):
+        """Скомпилированный numba цикл выбирает те же сегменты, что NumPy-путь"""
+        pytest.importorskip("numba")
+        import random
+        
+        rng = random.Random(5)
+        for _ in range(50):
+            starts = [round(rng.uniform(0, 50), 1) for _ in range(rng.randint(1, 20))]
+            ends = [start + round(rng.uniform(0, 5), 1) for start in starts]
+            mids = [round(rng.uniform(0, 60), 2) for _ in range(40)]
+            assert speaker_merge._segment_indices_numba(mids, starts, ends) == speaker_merge._segment_indices_numpy(mids, starts, ends)
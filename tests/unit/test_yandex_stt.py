@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Unit-тесты для YandexSTT (без сети).
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from core import yandex_stt
+from core.yandex_stt import YandexSTT
+
+
+class FakeClock:
+    """Монотонные часы, которые двигает только sleep()"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_client():
+    return YandexSTT(
+        api_key="test-key",
+        folder_id="test-folder",
+        s3_access_key="test-access",
+        s3_secret_key="test-secret",
+        s3_bucket="test-bucket",
+    )
+
+
+def done_operation(text):
+    return {"done": True, "response": {"chunks": [{"alternatives": [{"text": text}]}]}}
+
+
+def test_wait_for_completion_many_mixed_batch(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(yandex_stt, "time", SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+
+    calls = []
+
+    def fake_check(operation_id):
+        calls.append(operation_id)
+        if operation_id == "broken":
+            raise RuntimeError("HTTP 500")
+        if operation_id == "failed":
+            return {"done": True, "error": {"message": "bad audio"}}
+        if operation_id == "late" and calls.count("late") > 1:
+            return done_operation("позже")
+        if operation_id == "ready":
+            return done_operation("готово")
+        return {"done": False}
+
+    client = make_client()
+    monkeypatch.setattr(client, "check_operation", fake_check)
+
+    results, errors = client.wait_for_completion_many(
+        ["ready", "late", "broken", "failed", "slow", "ready"],
+        timeout=2,
+        poll_interval=1,
+        max_parallel=2,
+    )
+
+    assert results["ready"]["result"] == "готово"
+    assert results["late"]["result"] == "позже"
+    assert set(results) == {"ready", "late"}
+    assert isinstance(errors["broken"], RuntimeError)
+    assert "bad audio" in str(errors["failed"])
+    assert isinstance(errors["slow"], TimeoutError)
+    assert set(errors) == {"broken", "failed", "slow"}
+
+    # Дубликаты опрашиваются один раз, завершённые больше не опрашиваются
+    assert calls.count("ready") == 1
+    assert calls.count("late") == 2
+    assert calls.count("slow") > 2
+    assert clock.now >= 2
+
+
+def test_wait_for_completion_many_empty_batch():
+    assert make_client().wait_for_completion_many([]) == ({}, {})